@@ -2,7 +2,8 @@
 """
 ASGI config for api_dados_rio project.
 
-It exposes the ASGI callable as a module-level variable named ``application``.
+It exposes the ASGI callable as a module-level variable named ``application``. Requests to
+``/v2/stream/`` are served by the Server-Sent Events application, everything else by Django.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/4.1/howto/deployment/asgi/
@@ -14,4 +15,14 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "api_dados_rio.settings")
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+from api_dados_rio.v2.stream import application as stream_application  # noqa: E402
+
+STREAM_PATHS = ("/v2/stream", "/v2/stream/")
+
+
+async def application(scope, receive, send):
+    if scope["type"] == "http" and scope["path"] in STREAM_PATHS:
+        return await stream_application(scope, receive, send)
+    return await django_application(scope, receive, send)
@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+"""
+Circuit breakers around our dependencies (the Redis targets and the COR Comando API).
+
+A breaker watches the outcome of the last ``CIRCUIT_BREAKER_WINDOW`` calls to a dependency.
+Once at least ``CIRCUIT_BREAKER_MIN_CALLS`` were made, if the share of failed calls reaches
+``CIRCUIT_BREAKER_ERROR_RATE`` or the share of calls slower than the breaker's
+``slow_call_duration`` reaches ``CIRCUIT_BREAKER_SLOW_CALL_RATE``, the breaker opens: calls fail
+fast with `CircuitOpen` for ``CIRCUIT_BREAKER_OPEN_DURATION`` seconds, so callers go straight to
+their cache or backup path instead of piling up on a dependency that's down. The breaker is then
+half-open: a single trial call goes through, closing the breaker if it succeeds in time or
+opening it again otherwise.
+
+Breakers are per worker process. Their states, transitions and calls are exported as metrics.
+"""
+import logging
+import threading
+from collections import deque
+from contextlib import contextmanager
+from time import monotonic
+from typing import Deque, Dict, Iterator, Optional, Tuple
+
+from django.conf import settings
+
+from api_dados_rio.custom.metrics import (
+    CIRCUIT_BREAKER_CALLS,
+    CIRCUIT_BREAKER_STATE,
+    CIRCUIT_BREAKER_TRANSITIONS,
+)
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+HALF_OPEN = "half_open"
+OPEN = "open"
+
+# Values of the state metric
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitOpen(Exception):
+    """A call was rejected because its circuit breaker is open"""
+
+    def __init__(self, name: str):
+        super().__init__(f"Circuit breaker {name} is open.")
+        self.name = name
+
+
+class CircuitBreaker:
+    """Closed/open/half-open circuit breaker with error rate and latency thresholds"""
+
+    def __init__(
+        self,
+        name: str,
+        *,
+        slow_call_duration: float,
+        window: int = 20,
+        min_calls: int = 5,
+        error_rate: float = 0.5,
+        slow_call_rate: float = 0.5,
+        open_duration: float = 30,
+    ):
+        self.name = name
+        self.slow_call_duration = slow_call_duration
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.slow_call_rate = slow_call_rate
+        self.open_duration = open_duration
+        self._state = CLOSED
+        # (failed, slow) outcomes of the last calls while closed
+        self._outcomes: Deque[Tuple[bool, bool]] = deque(maxlen=window)
+        self._opened_at = 0.0
+        self._trial = False
+        self._lock = threading.Lock()
+        CIRCUIT_BREAKER_STATE.labels(name).set(STATE_VALUES[CLOSED])
+
+    def __repr__(self) -> str:
+        return f"<CircuitBreaker {self.name} {self.state}>"
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            self._expire()
+            return self._state
+
+    @contextmanager
+    def guard(self) -> Iterator[None]:
+        """
+        Run a call to the dependency through the breaker. Exceptions raised by the call count
+        as failures.
+
+        Raises:
+            CircuitOpen: If the breaker is open (or half-open, with its trial call ongoing).
+        """
+        self._before_call()
+        start = monotonic()
+        failed: Optional[bool] = None
+        try:
+            yield
+            failed = False
+        except Exception:
+            failed = True
+            raise
+        finally:
+            self._after_call(failed, monotonic() - start)
+
+    def reset(self):
+        with self._lock:
+            self._transition(CLOSED)
+
+    def _before_call(self):
+        with self._lock:
+            self._expire()
+            if self._state == OPEN or (self._state == HALF_OPEN and self._trial):
+                CIRCUIT_BREAKER_CALLS.labels(self.name, "rejected").inc()
+                raise CircuitOpen(self.name)
+            if self._state == HALF_OPEN:
+                self._trial = True
+
+    def _after_call(self, failed: Optional[bool], duration: float):
+        """Record the outcome of a call, or just release its slot if it was cancelled"""
+        slow = duration >= self.slow_call_duration
+        if failed is not None:
+            outcome = "failure" if failed else "slow" if slow else "success"
+            CIRCUIT_BREAKER_CALLS.labels(self.name, outcome).inc()
+        with self._lock:
+            if self._state == HALF_OPEN:
+                if failed is None:
+                    self._trial = False
+                else:
+                    self._transition(OPEN if failed or slow else CLOSED)
+            elif self._state == CLOSED and failed is not None:
+                self._outcomes.append((failed, slow))
+                self._trip()
+
+    def _trip(self):
+        """Open the breaker if the last calls crossed a threshold. Must hold the lock."""
+        calls = len(self._outcomes)
+        if calls < self.min_calls:
+            return
+        error_rate = sum(1 for failed, _ in self._outcomes if failed) / calls
+        slow_call_rate = sum(1 for _, slow in self._outcomes if slow) / calls
+        if error_rate >= self.error_rate or slow_call_rate >= self.slow_call_rate:
+            self._transition(OPEN)
+
+    def _expire(self):
+        """Let an open breaker try again once its open period is over. Must hold the lock."""
+        if self._state == OPEN and monotonic() - self._opened_at >= self.open_duration:
+            self._transition(HALF_OPEN)
+
+    def _transition(self, state: str):
+        """Must hold the lock"""
+        if state != self._state:
+            logger.warning("Circuit breaker %s is now %s", self.name, state)
+            CIRCUIT_BREAKER_TRANSITIONS.labels(self.name, state).inc()
+            CIRCUIT_BREAKER_STATE.labels(self.name).set(STATE_VALUES[state])
+        self._state = state
+        self._outcomes.clear()
+        self._trial = False
+        if state == OPEN:
+            self._opened_at = monotonic()
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(name: str, slow_call_duration: float) -> CircuitBreaker:
+    """Get the process-wide circuit breaker of a dependency, creating it on first use"""
+    breaker = _breakers.get(name)
+    if breaker is not None:
+        return breaker
+    with _breakers_lock:
+        breaker = _breakers.get(name)
+        if breaker is None:
+            breaker = CircuitBreaker(
+                name,
+                slow_call_duration=slow_call_duration,
+                window=getattr(settings, "CIRCUIT_BREAKER_WINDOW", 20),
+                min_calls=getattr(settings, "CIRCUIT_BREAKER_MIN_CALLS", 5),
+                error_rate=getattr(settings, "CIRCUIT_BREAKER_ERROR_RATE", 0.5),
+                slow_call_rate=getattr(settings, "CIRCUIT_BREAKER_SLOW_CALL_RATE", 0.5),
+                open_duration=getattr(settings, "CIRCUIT_BREAKER_OPEN_DURATION", 30),
+            )
+            _breakers[name] = breaker
+    return breaker
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+"""
+Columnar representation of H3 snapshots (``?formato=colunar``).
+
+Instead of a list of objects repeating every key, the payload is returned as parallel arrays,
+one per field. Fields taking only a few distinct values (e.g. ``bairro``, ``status`` and
+``color``) are dictionary-encoded: their distinct values are listed once and each item refers
+to one of them by index. The encoding of a whole snapshot is built once per version.
+
+```json
+{
+    "total": 2,
+    "colunas": {
+        "id_h3": ["88a8a03989fffff", "88a8a0398bfffff"],
+        "quantidade": [0.0, 1.2],
+        "status": {"valores": ["sem chuva", "chuva fraca"], "indices": [0, 1]},
+        ...
+    }
+}
+```
+"""
+from typing import Any, Dict, List
+
+from django.http.response import HttpResponseBase
+from drf_yasg import openapi
+from rest_framework.request import Request
+
+from api_dados_rio.custom.responses import representation_response
+from api_dados_rio.custom.snapshots import Snapshot
+from api_dados_rio.custom.tables import is_low_cardinality
+
+FORMATO_COLUNAR = "colunar"
+
+COLUMNAR_PARAMETERS = [
+    openapi.Parameter(
+        "formato",
+        openapi.IN_QUERY,
+        description="Use `colunar` para receber os dados como listas paralelas, uma por campo, "
+        "com os campos de poucos valores distintos (como `bairro`, `status` e `color`) "
+        "codificados por dicionário.",
+        type=openapi.TYPE_STRING,
+        enum=[FORMATO_COLUNAR],
+        required=False,
+    ),
+]
+
+
+def get_formato(request: Request) -> str:
+    """
+    Representation requested for the items of an H3 dataset, if other than the default.
+
+    Raises:
+        ValueError: If the representation is unknown.
+    """
+    formato = request.query_params.get("formato", "").strip().lower()
+    if formato not in ("", FORMATO_COLUNAR):
+        raise ValueError(f'Parameter "formato" must be "{FORMATO_COLUNAR}".')
+    return formato
+
+
+def encode_column(values: List[Any]) -> Any:
+    """Dictionary-encode a text column if it only takes a few distinct values"""
+    if not all(value is None or isinstance(value, str) for value in values):
+        return values
+    if not is_low_cardinality(values):
+        return values
+    distinct = dict.fromkeys(values)
+    positions = {value: position for position, value in enumerate(distinct)}
+    return {
+        "valores": list(distinct),
+        "indices": [positions[value] for value in values],
+    }
+
+
+def to_columns(items: List[dict]) -> Dict[str, Any]:
+    """Turn a list of objects into dictionary-encoded parallel arrays"""
+    fields = list(dict.fromkeys(field for item in items for field in item))
+    return {
+        "total": len(items),
+        "colunas": {
+            field: encode_column([item.get(field) for item in items])
+            for field in fields
+        },
+    }
+
+
+def columnar_response(request: Request, snapshot: Snapshot) -> HttpResponseBase:
+    """Respond with the columnar representation of a snapshot, built once per version"""
+    return representation_response(
+        request,
+        snapshot,
+        "colunar",
+        lambda snapshot: to_columns(snapshot.data),
+        f"formato={FORMATO_COLUNAR}",
+    )
@@ -0,0 +1,322 @@
+# -*- coding: utf-8 -*-
+"""
+Client of comando's API (COR), shared by the v1 and v2 endpoints.
+
+Requests are authenticated with a token obtained from ``API_URL_LOGIN``. Instead of logging in
+on every request, a single token is shared by every worker through the Django cache (Redis, in
+production) along with its expiry, read from the token itself when it's a JWT or assumed to be
+``COR_COMANDO_TOKEN_TTL`` seconds otherwise. Tokens are refreshed ahead of expiry, within
+``COR_COMANDO_TOKEN_REFRESH_MARGIN`` seconds of it, by whichever worker takes the refresh lock
+first; the others keep using the current token meanwhile. A request rejected with 401 or 403 is
+retried once with a fresh token.
+
+Every request goes through a single session per process, keeping pooled keep-alive connections
+to comando's API. Each attempt is bounded by ``COR_COMANDO_CONNECT_TIMEOUT`` and
+``COR_COMANDO_READ_TIMEOUT``, and retries of connection errors and 502/503/504 responses (up to
+``COR_COMANDO_RETRIES``, with exponential backoff) stop once the call as a whole would outlast
+``COR_COMANDO_DEADLINE``. That deadline covers every request a `get_url` call makes (logging in,
+the request itself and its retry with a fresh token), so a slow upstream can't hold a worker for
+longer than that.
+"""
+import base64
+import json
+import logging
+import os
+import threading
+from time import monotonic, sleep, time
+from typing import Optional, Tuple
+from urllib.parse import urlsplit
+
+import requests
+from django.conf import settings
+from django.core.cache import cache
+from requests.adapters import HTTPAdapter
+
+from api_dados_rio.custom.breakers import CircuitBreaker, get_breaker
+from api_dados_rio.custom.metrics import (
+    COR_COMANDO_REQUEST_DURATION,
+    COR_COMANDO_RETRIES,
+    COR_COMANDO_TOKEN_REFRESHES,
+)
+from api_dados_rio.custom.single_flight import single_flight
+
+logger = logging.getLogger(__name__)
+
+TOKEN_CACHE_KEY = "cor_comando_token"
+TOKEN_LOCK_CACHE_KEY = "cor_comando_token_lock"
+
+# How often to check for the token being refreshed by another worker, in seconds
+TOKEN_POLL_INTERVAL = 0.1
+
+# Responses worth retrying, as the upstream may be momentarily unavailable
+RETRY_STATUSES = (502, 503, 504)
+
+_session: Optional[requests.Session] = None
+_session_pid: Optional[int] = None
+_session_lock = threading.Lock()
+
+
+def get_cor_breaker(endpoint: str) -> CircuitBreaker:
+    """Circuit breaker of an endpoint (`login` or `api`) of comando's API"""
+    return get_breaker(
+        f"cor_comando.{endpoint}",
+        getattr(settings, "COR_COMANDO_SLOW_CALL_DURATION", 10),
+    )
+
+
+def get_session() -> requests.Session:
+    """Get the pooled session of this process, creating it on first use"""
+    global _session, _session_pid
+    if _session is not None and _session_pid == os.getpid():
+        return _session
+    with _session_lock:
+        if _session is None or _session_pid != os.getpid():
+            # Connections inherited from a parent process can't be shared with it
+            session = requests.Session()
+            adapter = HTTPAdapter(
+                pool_maxsize=getattr(settings, "COR_COMANDO_POOL_MAXSIZE", 10),
+                max_retries=0,
+            )
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _session, _session_pid = session, os.getpid()
+    return _session
+
+
+def get_deadline() -> float:
+    """Deadline of a call to comando's API starting now, on the `monotonic` clock"""
+    return monotonic() + getattr(settings, "COR_COMANDO_DEADLINE", 20)
+
+
+def send(
+    method: str, url: str, deadline: Optional[float] = None, **kwargs
+) -> requests.Response:
+    """
+    Make a request to comando's API, retrying connection errors and 502/503/504 responses
+    until `deadline` (see `get_deadline`, which is also the default)
+
+    Raises:
+        requests.RequestException: If the last attempt failed to connect or timed out, or the
+            deadline had already passed.
+    """
+    endpoint = urlsplit(url).path or "/"
+    connect_timeout = getattr(settings, "COR_COMANDO_CONNECT_TIMEOUT", 3)
+    read_timeout = getattr(settings, "COR_COMANDO_READ_TIMEOUT", 10)
+    retries = getattr(settings, "COR_COMANDO_RETRIES", 2)
+    backoff_factor = getattr(settings, "COR_COMANDO_BACKOFF_FACTOR", 0.5)
+    if deadline is None:
+        deadline = get_deadline()
+    attempt = 0
+    while True:
+        remaining = deadline - monotonic()
+        if remaining <= 0:
+            raise requests.Timeout(f"Deadline exceeded before requesting {endpoint}")
+        started_at = monotonic()
+        error = None
+        try:
+            response = get_session().request(
+                method,
+                url,
+                timeout=(min(connect_timeout, remaining), min(read_timeout, remaining)),
+                **kwargs,
+            )
+            outcome = str(response.status_code)
+        except (requests.ConnectionError, requests.Timeout) as exc:
+            response, error = None, exc
+            outcome = "timeout" if isinstance(exc, requests.Timeout) else "error"
+        COR_COMANDO_REQUEST_DURATION.labels(endpoint, outcome).observe(
+            monotonic() - started_at
+        )
+        if response is not None and response.status_code not in RETRY_STATUSES:
+            return response
+        backoff = backoff_factor * 2**attempt
+        if attempt >= retries or monotonic() + backoff >= deadline:
+            if error is not None:
+                raise error
+            return response
+        COR_COMANDO_RETRIES.labels(endpoint).inc()
+        sleep(backoff)
+        attempt += 1
+
+
+def get_expiry(token: str) -> float:
+    """Timestamp a token expires at: its `exp` claim if it's a JWT, or its assumed lifetime"""
+    try:
+        claims = token.split(".")[1]
+        claims += "=" * (-len(claims) % 4)
+        return float(json.loads(base64.urlsafe_b64decode(claims))["exp"])
+    except Exception:
+        return time() + getattr(settings, "COR_COMANDO_TOKEN_TTL", 1800)
+
+
+def login(deadline: Optional[float] = None) -> str:
+    """Get a new token to access comando's API"""
+    payload = {
+        "username": getattr(settings, "API_USERNAME"),
+        "password": getattr(settings, "API_PASSWORD"),
+    }
+    with get_cor_breaker("login").guard():
+        response = send(
+            "POST", getattr(settings, "API_URL_LOGIN"), deadline=deadline, json=payload
+        )
+        response.raise_for_status()
+        return response.text
+
+
+class TokenManager:
+    """Token to access comando's API, shared by every worker through the Django cache"""
+
+    def __init__(self):
+        # Copy of the shared token, so most requests don't even hit the cache
+        self._token: Optional[str] = None
+        self._expires_at = 0.0
+        self._lock = threading.Lock()
+
+    def get(self, deadline: Optional[float] = None) -> str:
+        """Get a valid token, refreshing it if it's about to expire (within `deadline`)"""
+        margin = getattr(settings, "COR_COMANDO_TOKEN_REFRESH_MARGIN", 60)
+        if self._token and time() < self._expires_at - margin:
+            return self._token
+        with self._lock:
+            token, expires_at = self._get_shared()
+            if token and time() < expires_at - margin:
+                return token
+            if token and time() < expires_at:
+                # Still valid: refresh it if no other worker is, else keep using it
+                try:
+                    refreshed = self._refresh("expiring", deadline, wait=False)
+                    return refreshed or token
+                except Exception as exc:
+                    logger.warning("Failed to refresh the COR token early: %r", exc)
+                    return token
+            return self._refresh("missing", deadline=deadline)
+
+    def refresh(self, rejected: str, deadline: Optional[float] = None) -> str:
+        """Get a new token (within `deadline`), after comando's API rejected the `rejected` one"""
+        with self._lock:
+            self._token = None
+            token, expires_at = self._get_shared()
+            if token and token != rejected and time() < expires_at:
+                # Another worker already refreshed it
+                return token
+            return self._refresh("rejected", deadline=deadline, rejected=rejected)
+
+    def clear(self):
+        with self._lock:
+            self._token = None
+            self._expires_at = 0.0
+        cache.delete(TOKEN_CACHE_KEY)
+
+    def _get_shared(self) -> Tuple[Optional[str], float]:
+        """Get the shared token and its expiry, keeping a copy. Must hold the lock."""
+        shared = cache.get(TOKEN_CACHE_KEY)
+        if not shared:
+            return None, 0.0
+        self._token, self._expires_at = shared["token"], shared["expires_at"]
+        return self._token, self._expires_at
+
+    def _refresh(
+        self,
+        reason: str,
+        deadline: Optional[float] = None,
+        wait: bool = True,
+        rejected: str = None,
+    ) -> Optional[str]:
+        """
+        Log in and share the new token, unless another worker is already doing so. In that
+        case, wait for its token if `wait` is set (logging in anyway if it takes too long), or
+        return None otherwise. Gives up at `deadline`. Must hold the lock.
+        """
+        if deadline is None:
+            deadline = get_deadline()
+        lock_timeout = getattr(settings, "COR_COMANDO_TOKEN_LOCK_TIMEOUT", 10)
+        locked = cache.add(TOKEN_LOCK_CACHE_KEY, True, timeout=lock_timeout)
+        if not locked:
+            if not wait:
+                return None
+            wait_until = min(monotonic() + lock_timeout, deadline)
+            while monotonic() < wait_until:
+                sleep(TOKEN_POLL_INTERVAL)
+                token, expires_at = self._get_shared()
+                if token and token != rejected and time() < expires_at:
+                    return token
+            logger.warning("Timed out waiting for the COR token, logging in anyway")
+        try:
+            token = login(deadline)
+        except Exception:
+            COR_COMANDO_TOKEN_REFRESHES.labels(reason, "failure").inc()
+            raise
+        finally:
+            if locked:
+                cache.delete(TOKEN_LOCK_CACHE_KEY)
+        COR_COMANDO_TOKEN_REFRESHES.labels(reason, "success").inc()
+        expires_at = get_expiry(token)
+        cache.set(
+            TOKEN_CACHE_KEY,
+            {"token": token, "expires_at": expires_at},
+            timeout=max(1, int(expires_at - time())),
+        )
+        self._token, self._expires_at = token, expires_at
+        return token
+
+
+token_manager = TokenManager()
+
+
+def get_token() -> str:
+    """Get token to access comando's API"""
+    return token_manager.get()
+
+
+def request_api(
+    url: str, parameters: dict, token: str, deadline: Optional[float] = None
+) -> requests.Response:
+    """Make a single request to comando's API, through its circuit breaker"""
+    headers = {"Authorization": token}
+    with get_cor_breaker("api").guard():
+        response = send("GET", url, deadline=deadline, json=parameters, headers=headers)
+        if response.status_code >= 500:
+            response.raise_for_status()
+        return response
+
+
+def get_url(url, parameters: dict = None, token: str = None):  # pylint: disable=W0102
+    """
+    Make request to comando's API, retrying once with a new token if it's rejected, all within
+    `COR_COMANDO_DEADLINE`. Failures, including calls rejected while a circuit breaker is open
+    and calls out of time, are returned as `{"error": exc}` so views can fall back to their
+    cached data.
+    """
+    if not parameters:
+        parameters = {}
+    deadline = get_deadline()
+    try:
+        if not token:
+            token = token_manager.get(deadline)
+        response = request_api(url, parameters, token, deadline)
+        if response.status_code in (401, 403):
+            token = token_manager.refresh(token, deadline)
+            response = request_api(url, parameters, token, deadline)
+        response = response.json()
+    except Exception as exc:
+        response = {"error": exc}
+    return response
+
+
+def get_url_once(key: str, url, parameters: dict = None):
+    """
+    Same as `get_url`, but concurrent calls for the same cache key, in any worker, share a
+    single request to comando's API (see `single_flight`)
+    """
+
+    def fetch():
+        result = get_url(url, parameters=parameters)
+        if isinstance(result, dict) and result.get("error"):
+            # Exceptions don't always survive pickling into the cache
+            result = {**result, "error": str(result["error"]) or repr(result["error"])}
+        return result
+
+    result = single_flight(key, fetch)
+    if result is None:
+        return {"error": "Timed out waiting for comando's API."}
+    return result
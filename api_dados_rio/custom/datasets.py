@@ -0,0 +1,528 @@
+# -*- coding: utf-8 -*-
+"""
+Engine for datasets published on Redis by our pipelines.
+
+A dataset is declared once (name, data key, update key, Redis target and cache policy) and gets
+two endpoints generated from it: one serving its payload and one serving its last update time.
+Every read goes through the process-wide snapshot cache, so improvements to the read path apply
+to all datasets at once. The endpoints are async views reading Redis with asyncio clients. When
+Redis fails or a dataset comes back empty, the last known good snapshot is served instead.
+"""
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from django.http.response import HttpResponseBase
+from django.utils.decorators import method_decorator
+from drf_yasg import openapi
+from drf_yasg.utils import swagger_auto_schema
+from redis_pal import RedisPal
+from rest_framework.response import Response
+from rest_framework.routers import BaseRouter
+from rest_framework.viewsets import ViewSet
+from rest_framework_tracking.mixins import LoggingMixin
+
+from api_dados_rio.custom.columnar import (
+    COLUMNAR_PARAMETERS,
+    FORMATO_COLUNAR,
+    columnar_response,
+    get_formato,
+    to_columns,
+)
+from api_dados_rio.custom.deltas import DELTA_PARAMETERS, delta_response, get_desde
+from api_dados_rio.custom.fallback import last_known_good, set_staleness
+from api_dados_rio.custom.history import RainHistory
+from api_dados_rio.custom.indexes import (
+    FILTER_PARAMETERS,
+    Query,
+    get_filters,
+    get_variant,
+    select,
+)
+from api_dados_rio.custom.redis_pool import (
+    REDIS_TARGET_MAIN,
+    get_async_redis_client,
+    get_redis_client,
+)
+from api_dados_rio.custom.renderers import (
+    ArrowRenderer,
+    GeoJSONRenderer,
+    ParquetRenderer,
+)
+from api_dados_rio.custom.responses import (
+    format_last_update,
+    get_not_modified_response,
+    snapshot_response,
+    subset_response,
+)
+from api_dados_rio.custom.snapshots import Snapshot, SnapshotVersion, snapshot_cache
+from api_dados_rio.custom.spatial import SPATIAL_PARAMETERS, get_spatial_queries
+from api_dados_rio.custom.viewsets import AsyncViewSetMixin, run_in_thread
+
+# Query parameters accepted by the payload endpoints of H3 datasets
+H3_PARAMETERS = (
+    FILTER_PARAMETERS + SPATIAL_PARAMETERS + DELTA_PARAMETERS + COLUMNAR_PARAMETERS
+)
+
+# Formats offered by the payload endpoints of H3 datasets, on top of the default ones
+H3_RENDERER_CLASSES = [ArrowRenderer, ParquetRenderer, GeoJSONRenderer]
+
+
+class Dataset:
+    """A dataset published on Redis and the endpoints that serve it"""
+
+    def __init__(
+        self,
+        group: str,
+        name: str,
+        data_key: str,
+        update_key: str,
+        *,
+        summary: str,
+        description: str,
+        update_summary: str,
+        update_description: str,
+        update_name: str = None,
+        target: str = REDIS_TARGET_MAIN,
+        check_interval: Optional[float] = None,
+        allow_empty: bool = False,
+        raw_last_update: bool = False,
+        prewarm: bool = True,
+        h3: bool = False,
+        history: RainHistory = None,
+    ):
+        """
+        Args:
+            group: Name of the router (e.g. `clima_pluviometro`) the endpoints belong to.
+            name: Name of the endpoint serving the payload.
+            data_key: Redis key holding the payload.
+            update_key: Redis key that changes whenever a new payload is published.
+            summary, description: Swagger documentation of the payload endpoint.
+            update_summary, update_description: Swagger documentation of the last update
+                endpoint.
+            update_name: Name of the last update endpoint. Defaults to
+                `ultima_atualizacao_<name>`.
+            target: Redis target the keys live in.
+            check_interval: How often, in seconds, the update key is checked for a new
+                version. Defaults to `SNAPSHOT_CACHE_CHECK_INTERVAL`.
+            allow_empty: Whether an empty payload is a valid one.
+            raw_last_update: Serve the update key as is instead of a formatted timestamp.
+            prewarm: Whether to load the snapshot when a worker starts.
+            h3: Whether the payload is a list of H3 hexagons (with `id_h3` and `bairro`),
+                which enables server-side filtering, spatial queries, deltas and the
+                columnar, Arrow, Parquet and GeoJSON representations.
+            history: Rolling history the versions of the payload are recorded in (see
+                `api_dados_rio.custom.history`).
+        """
+        self.group = group
+        self.name = name
+        self.data_key = data_key
+        self.update_key = update_key
+        self.summary = summary
+        self.description = description
+        self.update_summary = update_summary
+        self.update_description = update_description
+        self.update_name = update_name or f"ultima_atualizacao_{name}"
+        self.target = target
+        self.check_interval = check_interval
+        self.allow_empty = allow_empty
+        self.raw_last_update = raw_last_update
+        self.prewarm = prewarm
+        self.h3 = h3
+        self.history = history
+
+    def __repr__(self) -> str:
+        return f"<Dataset {self.path}>"
+
+    @property
+    def path(self) -> str:
+        """Name of the dataset qualified by its group, e.g. `clima_radar/precipitacao_15min`"""
+        return f"{self.group}/{self.name}"
+
+    def get_version(self) -> SnapshotVersion:
+        """
+        Get the current version of this dataset without loading its payload. While Redis is
+        unavailable, that's the version of the last known good snapshot.
+        """
+        try:
+            version = snapshot_cache.get_version(
+                get_redis_client(self.target),
+                self.data_key,
+                self.update_key,
+                check_interval=self.check_interval,
+            )
+        except Exception as error:
+            return self.fall_back(error)
+        return version
+
+    def get_snapshot(self, check_interval: Optional[float] = None) -> Snapshot:
+        """
+        Get the current snapshot of this dataset, or the last known good one if Redis is
+        unavailable or the current one isn't valid. `check_interval` overrides the dataset's,
+        e.g. to force a check when we know a new version was published.
+        """
+        try:
+            snapshot = snapshot_cache.get(
+                get_redis_client(self.target),
+                self.data_key,
+                self.update_key,
+                check_interval=self.check_interval
+                if check_interval is None
+                else check_interval,
+            )
+        except Exception as error:
+            return self.fall_back(error)
+        return self.settle(snapshot)
+
+    async def aget_version(self) -> SnapshotVersion:
+        """Same as `get_version`, on the event loop"""
+        try:
+            version = await snapshot_cache.aget_version(
+                get_async_redis_client(self.target),
+                self.data_key,
+                self.update_key,
+                check_interval=self.check_interval,
+            )
+        except Exception as error:
+            return await self.afall_back(error)
+        return version
+
+    async def aget_snapshot(self, check_interval: Optional[float] = None) -> Snapshot:
+        """Same as `get_snapshot`, on the event loop"""
+        try:
+            snapshot = await snapshot_cache.aget(
+                get_async_redis_client(self.target),
+                self.data_key,
+                self.update_key,
+                check_interval=self.check_interval
+                if check_interval is None
+                else check_interval,
+            )
+        except Exception as error:
+            return await self.afall_back(error)
+        return await self.asettle(snapshot)
+
+    def fall_back(self, error: Exception) -> Snapshot:
+        """
+        Get the last known good snapshot of this dataset, for when Redis can't be read.
+
+        Raises:
+            The Redis error (e.g. `CircuitOpen`) if there's no snapshot to fall back on.
+        """
+        snapshot = last_known_good.fall_back(self.data_key)
+        if snapshot is None:
+            raise error
+        return snapshot
+
+    def settle(self, snapshot: Snapshot) -> Snapshot:
+        """
+        Remember a snapshot just read from Redis as the last known good one if it's valid, or
+        fall back to the last known good one if it isn't (and there's one)
+        """
+        if self.is_valid(snapshot):
+            last_known_good.remember(snapshot)
+            return snapshot
+        return last_known_good.fall_back(self.data_key) or snapshot
+
+    async def afall_back(self, error: Exception) -> Snapshot:
+        """Same as `fall_back`, reading the disk off the event loop"""
+        snapshot = await last_known_good.afall_back(self.data_key)
+        if snapshot is None:
+            raise error
+        return snapshot
+
+    async def asettle(self, snapshot: Snapshot) -> Snapshot:
+        """Same as `settle`, reading the disk off the event loop"""
+        if self.is_valid(snapshot):
+            last_known_good.remember(snapshot)
+            return snapshot
+        return await last_known_good.afall_back(self.data_key) or snapshot
+
+    def is_valid(self, snapshot: Snapshot) -> bool:
+        """Whether a snapshot holds a payload we can serve"""
+        return isinstance(snapshot.data, list) and (
+            self.allow_empty or len(snapshot.data) > 0
+        )
+
+    def validate(self, snapshot: Snapshot):
+        """Make sure a snapshot holds a payload we can serve"""
+        assert self.is_valid(snapshot)
+
+
+class DatasetViewSet(AsyncViewSetMixin, LoggingMixin, ViewSet):
+    """Serves the current payload of a dataset"""
+
+    dataset: Dataset = None
+
+    def get_renderers(self):
+        renderers = super().get_renderers()
+        if self.dataset.h3:
+            renderers += [renderer() for renderer in H3_RENDERER_CLASSES]
+        return renderers
+
+    def get_queries(self, request) -> List[Query]:
+        """Server-side queries requested for the dataset's items"""
+        if not self.dataset.h3:
+            return []
+        return get_filters(request) + get_spatial_queries(request)
+
+    @staticmethod
+    def build_response(
+        request,
+        snapshot: Snapshot,
+        queries: List[Query],
+        formato: str,
+        desde: Optional[str],
+        variant: str,
+    ) -> HttpResponseBase:
+        """Respond with the representation of a snapshot asked for, rendering it if needed"""
+        if desde:
+            return delta_response(request, snapshot, desde)
+        if queries:
+            items = select(snapshot, queries)
+            return subset_response(
+                request,
+                snapshot,
+                to_columns(items) if formato == FORMATO_COLUNAR else items,
+                variant,
+            )
+        if formato == FORMATO_COLUNAR:
+            return columnar_response(request, snapshot)
+        return snapshot_response(request, snapshot)
+
+    async def list(self, request):
+        try:
+            queries = self.get_queries(request)
+            formato = get_formato(request) if self.dataset.h3 else ""
+        except ValueError as error:
+            return Response({"error": str(error)}, status=400)
+        desde = get_desde(request) if self.dataset.h3 else None
+        if desde and (queries or formato):
+            return Response(
+                {
+                    "error": 'Parameter "desde" can\'t be combined with other parameters.'
+                },
+                status=400,
+            )
+        if (desde or formato) and getattr(request.accepted_renderer, "tabular", False):
+            return Response(
+                {
+                    "error": f'Format "{request.accepted_renderer.format}" can\'t be '
+                    'combined with "desde" or "formato".'
+                },
+                status=400,
+            )
+        if desde:
+            variant = f"desde={desde}"
+        else:
+            variant = "&".join(
+                filter(None, [get_variant(queries), formato and f"formato={formato}"])
+            )
+        try:
+            version = await self.dataset.aget_version()
+            response = get_not_modified_response(request, version, variant)
+            if response is None:
+                snapshot = await self.dataset.aget_snapshot()
+                self.dataset.validate(snapshot)
+                version = snapshot
+                response = await run_in_thread(
+                    self.build_response,
+                    request,
+                    snapshot,
+                    queries,
+                    formato,
+                    desde,
+                    variant,
+                )
+            if version.version is not None:
+                response["X-Versao"] = version.version
+            return set_staleness(response, version.staleness)
+        except Exception:
+            return Response(
+                {"error": "Something went wrong. Try again later."},
+                status=500,
+            )
+
+
+class DatasetLastUpdateViewSet(AsyncViewSetMixin, LoggingMixin, ViewSet):
+    """Serves the last update time of a dataset"""
+
+    dataset: Dataset = None
+
+    async def list(self, request):
+        try:
+            # Read from the update key alone, without loading the payload. That's the version
+            # of the snapshot the payload endpoint serves, or an older one while it falls back
+            # to the last known good snapshot.
+            version = await self.dataset.aget_version()
+            if isinstance(version, Snapshot) and not self.dataset.is_valid(version):
+                version = (
+                    await last_known_good.afall_back(self.dataset.data_key) or version
+                )
+            if self.dataset.raw_last_update:
+                data = RedisPal._deserialize(version.raw_update)
+                assert data is not None
+                response = Response(data)
+            else:
+                last_update = format_last_update(version)
+                assert last_update is not None
+                response = Response(last_update)
+            return set_staleness(response, version.staleness)
+        except Exception:
+            return Response(
+                {"error": "Something went wrong. Try again later."},
+                status=500,
+            )
+
+
+def _view_class_name(name: str) -> str:
+    return "".join(part.capitalize() for part in name.split("_")) + "View"
+
+
+def build_viewset(
+    base: type,
+    dataset: Dataset,
+    name: str,
+    summary: str,
+    doc: str,
+    manual_parameters: List[openapi.Parameter] = None,
+):
+    """Build a ViewSet class bound to a dataset, with its Swagger documentation"""
+    viewset = type(_view_class_name(name), (base,), {"dataset": dataset})
+    return method_decorator(
+        name="list",
+        decorator=swagger_auto_schema(
+            operation_summary=summary,
+            operation_description=doc,
+            manual_parameters=manual_parameters,
+        ),
+    )(viewset)
+
+
+class DatasetRegistry:
+    """The collection of every dataset we serve, grouped by router"""
+
+    def __init__(self, datasets: Iterable[Dataset]):
+        self._datasets: Dict[str, Dict[str, Dataset]] = defaultdict(dict)
+        for dataset in datasets:
+            self.register(dataset)
+
+    def register(self, dataset: Dataset):
+        assert dataset.name not in self._datasets[dataset.group]
+        self._datasets[dataset.group][dataset.name] = dataset
+
+    def get(self, group: str, name: str) -> Dataset:
+        return self._datasets[group][name]
+
+    def find(self, name: str) -> Dataset:
+        """
+        Find a dataset by its path (`group/name`) or by its name alone, in which case the
+        first group registered with that name wins.
+
+        Raises:
+            KeyError: If there's no such dataset.
+        """
+        group, _, name = name.rpartition("/")
+        for datasets in (
+            [self._datasets.get(group, {})] if group else self._datasets.values()
+        ):
+            if name in datasets:
+                return datasets[name]
+        raise KeyError(name)
+
+    def get_group(self, group: str) -> List[Dataset]:
+        return list(self._datasets[group].values())
+
+    def all(self) -> List[Dataset]:
+        return [d for datasets in self._datasets.values() for d in datasets.values()]
+
+    def register_routes(self, router: BaseRouter, group: str):
+        """Register the payload and last update endpoints of a group's datasets"""
+        for dataset in self.get_group(group):
+            router.register(
+                dataset.name,
+                build_viewset(
+                    DatasetViewSet,
+                    dataset,
+                    dataset.name,
+                    dataset.summary,
+                    dataset.description,
+                    H3_PARAMETERS if dataset.h3 else None,
+                ),
+                basename=dataset.name,
+            )
+            router.register(
+                dataset.update_name,
+                build_viewset(
+                    DatasetLastUpdateViewSet,
+                    dataset,
+                    dataset.update_name,
+                    dataset.update_summary,
+                    dataset.update_description,
+                ),
+                basename=dataset.update_name,
+            )
+
+    @staticmethod
+    def _group_by_target(
+        datasets: List[Dataset],
+    ) -> Dict[str, Tuple[List[Dataset], List[Tuple[str, str]], Optional[float]]]:
+        """Group datasets by Redis target, along with their keys and check interval"""
+        by_target: Dict[str, List[Dataset]] = defaultdict(list)
+        for dataset in datasets:
+            by_target[dataset.target].append(dataset)
+        groups = {}
+        for target, target_datasets in by_target.items():
+            intervals = [d.check_interval for d in target_datasets if d.check_interval]
+            groups[target] = (
+                target_datasets,
+                [(d.data_key, d.update_key) for d in target_datasets],
+                min(intervals) if intervals else None,
+            )
+        return groups
+
+    def get_snapshots(self, datasets: List[Dataset]) -> List[Snapshot]:
+        """
+        Get the current snapshots of several datasets, with a single batched read per Redis
+        target. Falls back to the last known good snapshots like `Dataset.get_snapshot`.
+        """
+        snapshots: Dict[int, Snapshot] = {}
+        for target, group in self._group_by_target(datasets).items():
+            target_datasets, keys, check_interval = group
+            try:
+                target_snapshots = snapshot_cache.get_many(
+                    get_redis_client(target), keys, check_interval=check_interval
+                )
+            except Exception as error:
+                target_snapshots = [d.fall_back(error) for d in target_datasets]
+            else:
+                target_snapshots = [
+                    dataset.settle(snapshot)
+                    for dataset, snapshot in zip(target_datasets, target_snapshots)
+                ]
+            for dataset, snapshot in zip(target_datasets, target_snapshots):
+                snapshots[id(dataset)] = snapshot
+        return [snapshots[id(dataset)] for dataset in datasets]
+
+    async def aget_snapshots(self, datasets: List[Dataset]) -> List[Snapshot]:
+        """Same as `get_snapshots`, on the event loop"""
+        snapshots: Dict[int, Snapshot] = {}
+        for target, group in self._group_by_target(datasets).items():
+            target_datasets, keys, check_interval = group
+            try:
+                target_snapshots = await snapshot_cache.aget_many(
+                    get_async_redis_client(target), keys, check_interval=check_interval
+                )
+            except Exception as error:
+                target_snapshots = [await d.afall_back(error) for d in target_datasets]
+            else:
+                target_snapshots = [
+                    await dataset.asettle(snapshot)
+                    for dataset, snapshot in zip(target_datasets, target_snapshots)
+                ]
+            for dataset, snapshot in zip(target_datasets, target_snapshots):
+                snapshots[id(dataset)] = snapshot
+        return [snapshots[id(dataset)] for dataset in datasets]
+
+    def prewarm(self):
+        """Load the snapshots of every dataset marked for prewarming into the cache"""
+        self.get_snapshots([dataset for dataset in self.all() if dataset.prewarm])
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+"""
+Deltas between versions of H3 snapshots.
+
+Clients polling a dataset can send the version they hold (``?desde=<versao>``, as given by the
+``X-Versao`` header or a previous delta) and get back only the hexagons that were added, removed
+or changed since then. Deltas are computed once per pair of versions and kept alongside the
+newer snapshot. Clients holding a version that fell out of the snapshot history get the full
+payload instead.
+"""
+from typing import Optional
+
+from django.http.response import HttpResponseBase
+from drf_yasg import openapi
+from rest_framework.request import Request
+
+from api_dados_rio.custom.responses import representation_response
+from api_dados_rio.custom.snapshots import Snapshot, snapshot_cache
+
+DELTA_PARAMETERS = [
+    openapi.Parameter(
+        "desde",
+        openapi.IN_QUERY,
+        description="Versão dos dados já obtida pelo cliente (cabeçalho `X-Versao` ou campo "
+        "`versao` de uma resposta anterior). Retorna apenas os hexágonos (H3) adicionados, "
+        "removidos ou alterados desde essa versão, ou todos os dados (com `completo` igual a "
+        "`true`) se ela não for mais recente.",
+        type=openapi.TYPE_STRING,
+        required=False,
+    ),
+]
+
+
+def get_desde(request: Request) -> Optional[str]:
+    """Version a client asks a delta from, if any"""
+    return request.query_params.get("desde", "").strip() or None
+
+
+def compute_delta(previous: Snapshot, snapshot: Snapshot) -> dict:
+    """Hexagons added, removed and changed from one snapshot to another"""
+    before = {item["id_h3"]: item for item in previous.data if "id_h3" in item}
+    after = {item["id_h3"]: item for item in snapshot.data if "id_h3" in item}
+    return {
+        "versao": snapshot.version,
+        "desde": previous.version,
+        "completo": False,
+        "adicionados": [item for id_h3, item in after.items() if id_h3 not in before],
+        "removidos": [id_h3 for id_h3 in before if id_h3 not in after],
+        "alterados": [
+            item
+            for id_h3, item in after.items()
+            if id_h3 in before and before[id_h3] != item
+        ],
+    }
+
+
+def delta_response(
+    request: Request, snapshot: Snapshot, desde: str
+) -> HttpResponseBase:
+    """Respond with the changes of a snapshot since a version, or in full if it's unknown"""
+    previous = snapshot_cache.get_previous(snapshot.key, desde)
+    if previous is None:
+        return representation_response(
+            request,
+            snapshot,
+            "delta.full",
+            lambda snapshot: {
+                "versao": snapshot.version,
+                "completo": True,
+                "dados": snapshot.data,
+            },
+            f"desde={desde}",
+        )
+    return representation_response(
+        request,
+        snapshot,
+        f"delta.{desde}",
+        lambda snapshot: compute_delta(previous, snapshot),
+        f"desde={desde}",
+    )
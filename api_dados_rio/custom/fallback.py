@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+"""
+Last known good snapshots of datasets, served when Redis can't give us a usable one.
+
+Every valid snapshot read from Redis is remembered per data key, in memory and, when
+``LAST_KNOWN_GOOD_DIR`` is set, on local disk, so that a worker started while Redis is down
+still has something to serve. Snapshots are written to disk by a background thread, so neither
+pickling nor writing holds up requests, and only if the file doesn't hold that version yet, as
+every worker reads the same versions. When a read fails, or a dataset comes back empty, the
+last known good snapshot is served instead. Those copies are only ever served as fallbacks, so
+each one carries its own staleness, the time since it was last confirmed current (see
+`set_staleness`).
+While the circuit breaker of a Redis target is open, reads fail fast and are answered from here
+without a round trip to Redis, so a Redis blip doesn't turn into a retry storm.
+"""
+import logging
+import os
+import pickle
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from time import time
+from typing import Dict, Optional
+
+from django.conf import settings
+from django.http.response import HttpResponseBase
+
+from api_dados_rio.custom.snapshots import Snapshot
+from api_dados_rio.custom.viewsets import run_in_thread
+
+logger = logging.getLogger(__name__)
+
+
+class LastKnownGood:
+    """Last known good snapshots by data key"""
+
+    def __init__(self, directory: Optional[str]):
+        self.directory = directory or None
+        # Copies of the snapshots read from Redis, only ever served as fallbacks
+        self._snapshots: Dict[str, Snapshot] = {}
+        self._lock = threading.Lock()
+        self._writer: Optional[ThreadPoolExecutor] = None
+        self._writer_pid: Optional[int] = None
+
+    def remember(self, snapshot: Snapshot):
+        """Remember a valid snapshot just read from Redis"""
+        with self._lock:
+            previous = self._snapshots.get(snapshot.key)
+            changed = previous is None or previous.version != snapshot.version
+            if changed:
+                # Without derived artifacts, which are bounded by the snapshot cache only
+                previous = self._snapshots[snapshot.key] = snapshot.archived()
+            previous.confirmed_at = time()
+        if changed and self.directory:
+            self._get_writer().submit(self._save, snapshot)
+
+    def fall_back(self, data_key: str) -> Optional[Snapshot]:
+        """Get the last known good snapshot of a data key, along with its staleness"""
+        with self._lock:
+            snapshot = self._snapshots.get(data_key)
+        if snapshot is None and self.directory:
+            snapshot = self._load(data_key)
+        return snapshot
+
+    async def afall_back(self, data_key: str) -> Optional[Snapshot]:
+        """Same as `fall_back`, reading the disk off the event loop"""
+        with self._lock:
+            snapshot = self._snapshots.get(data_key)
+        if snapshot is None and self.directory:
+            snapshot = await run_in_thread(self._load, data_key)
+        return snapshot
+
+    def flush(self):
+        """Wait for the snapshots being saved to disk"""
+        if self.directory:
+            self._get_writer().submit(lambda: None).result()
+
+    def clear(self):
+        with self._lock:
+            self._snapshots.clear()
+
+    def _get_writer(self) -> ThreadPoolExecutor:
+        """Get the thread saving snapshots to disk, starting it on first use in this process"""
+        with self._lock:
+            if self._writer is None or self._writer_pid != os.getpid():
+                # Threads aren't inherited by forked workers
+                self._writer = ThreadPoolExecutor(
+                    max_workers=1, thread_name_prefix="last_known_good"
+                )
+                self._writer_pid = os.getpid()
+            return self._writer
+
+    def _path(self, data_key: str) -> str:
+        return os.path.join(self.directory, f"{data_key}.pickle")
+
+    def _get_saved_version(self, data_key: str) -> Optional[str]:
+        """Version of the snapshot of a data key saved to disk, reading its header only"""
+        try:
+            with open(self._path(data_key), "rb") as file:
+                return pickle.load(file).get("version")
+        except Exception:
+            return None
+
+    def _save(self, snapshot: Snapshot):
+        """
+        Write a snapshot to disk, unless it's there already, atomically so other workers never
+        read partial files. The payload follows a header, so its version can be read alone.
+        """
+        if snapshot.version is not None and (
+            self._get_saved_version(snapshot.key) == snapshot.version
+        ):
+            return
+        path = None
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            fd, path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            with os.fdopen(fd, "wb") as file:
+                pickle.dump(
+                    {
+                        "version": snapshot.version,
+                        "last_update": snapshot.last_update,
+                        "size": snapshot.payload_size,
+                        "raw_update": snapshot.raw_update,
+                        "confirmed_at": time(),
+                    },
+                    file,
+                    protocol=pickle.HIGHEST_PROTOCOL,
+                )
+                pickle.dump(snapshot.data, file, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(path, self._path(snapshot.key))
+        except Exception:
+            logger.exception("Failed to save the last known good %s", snapshot.key)
+            if path is not None and os.path.exists(path):
+                os.remove(path)
+
+    def _load(self, data_key: str) -> Optional[Snapshot]:
+        """Read the snapshot of a data key saved to disk, if there's one"""
+        try:
+            with open(self._path(data_key), "rb") as file:
+                saved = pickle.load(file)
+                # Files written before the header was split from the payload hold both
+                data = saved["data"] if "data" in saved else pickle.load(file)
+        except FileNotFoundError:
+            return None
+        except Exception:
+            logger.exception("Failed to load the last known good %s", data_key)
+            return None
+        snapshot = Snapshot(
+            data_key,
+            saved["version"],
+            saved["last_update"],
+            data,
+            saved["size"],
+            saved.get("raw_update"),
+        )
+        snapshot.confirmed_at = saved["confirmed_at"]
+        with self._lock:
+            return self._snapshots.setdefault(data_key, snapshot)
+
+
+def set_staleness(
+    response: HttpResponseBase, staleness: Optional[float]
+) -> HttpResponseBase:
+    """Flag a response served from a last known good snapshot, with its age in seconds"""
+    if staleness is not None:
+        response["Warning"] = '110 - "Response is Stale"'
+        response["X-Defasagem"] = str(int(staleness))
+    return response
+
+
+last_known_good = LastKnownGood(getattr(settings, "LAST_KNOWN_GOOD_DIR", None))
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+"""
+Process-wide cache of H3 cell geometry. The geometry of a cell never changes, so it's computed
+once per cell and reused by every snapshot version.
+"""
+import json
+import math
+from functools import lru_cache
+from typing import Tuple
+
+import h3
+
+# Half the circumference of the Earth in Web Mercator (EPSG:3857), in meters
+MERCATOR_ORIGIN_SHIFT = math.pi * 6378137
+
+Ring = Tuple[Tuple[float, float], ...]
+
+
+@lru_cache(maxsize=None)
+def get_centroid(id_h3: str) -> Tuple[float, float]:
+    """(lat, lon) of the centroid of an H3 cell"""
+    return h3.h3_to_geo(id_h3)
+
+
+@lru_cache(maxsize=None)
+def get_boundary(id_h3: str) -> Ring:
+    """Closed ring of (lon, lat) vertices of the boundary of an H3 cell"""
+    return tuple(h3.h3_to_geo_boundary(id_h3, geo_json=True))
+
+
+@lru_cache(maxsize=None)
+def get_geometry_json(id_h3: str) -> bytes:
+    """GeoJSON polygon of the boundary of an H3 cell, already rendered, or null if invalid"""
+    if not h3.h3_is_valid(id_h3):
+        return b"null"
+    ring = [list(vertex) for vertex in get_boundary(id_h3)]
+    return json.dumps(
+        {"type": "Polygon", "coordinates": [ring]}, separators=(",", ":")
+    ).encode()
+
+
+def to_mercator(lon: float, lat: float) -> Tuple[float, float]:
+    """Project a point to Web Mercator, in meters"""
+    x = lon * MERCATOR_ORIGIN_SHIFT / 180
+    y = math.log(math.tan((90 + lat) * math.pi / 360)) * MERCATOR_ORIGIN_SHIFT / math.pi
+    return x, y
+
+
+def from_mercator(x: float, y: float) -> Tuple[float, float]:
+    """(lon, lat) of a point given in Web Mercator meters"""
+    lon = x / MERCATOR_ORIGIN_SHIFT * 180
+    lat = math.degrees(2 * math.atan(math.exp(y / MERCATOR_ORIGIN_SHIFT * math.pi)))
+    return lon, lat - 90
+
+
+@lru_cache(maxsize=None)
+def get_mercator_boundary(id_h3: str) -> Ring:
+    """Boundary of an H3 cell projected to Web Mercator, for vector tiles"""
+    return tuple(to_mercator(lon, lat) for lon, lat in get_boundary(id_h3))
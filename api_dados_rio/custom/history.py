@@ -0,0 +1,272 @@
+# -*- coding: utf-8 -*-
+"""
+Rolling history of the 15-minute rainfall of each H3 hexagon.
+
+Every version of a 15-minute dataset is recorded in a ring buffer of 15-minute slots (a NumPy
+array of slots by hexagon), keyed by the slot its last update falls in. Rainfall over any window
+that's a multiple of 15 minutes (e.g. ``45min`` or ``9h``), and the time series of a hexagon, are
+then differences of cumulative sums over the slots, computed for every hexagon at once. The
+cumulative sums are rebuilt only when a new version is recorded.
+
+When ``RAIN_HISTORY_DIR`` is set, a single writer (`python manage.py record_rain_history`)
+records every version published and saves the ring buffer there, and workers only read it back
+whenever it changes, so every worker serves the same history and it survives restarts. Without a
+directory, each worker records the versions it reads itself.
+"""
+import logging
+import os
+import re
+import tempfile
+import threading
+from datetime import datetime, timezone as dt_timezone
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from django.utils import timezone
+
+from api_dados_rio.custom.snapshots import Snapshot
+
+logger = logging.getLogger(__name__)
+
+# Length of a slot of the ring buffer, in seconds
+SLOT_SECONDS = 15 * 60
+
+WINDOW_PATTERN = re.compile(r"^(\d+)(min|h)$")
+
+
+def parse_window(janela: str, max_slots: int) -> int:
+    """
+    Number of slots in a window written as `45min` or `9h`.
+
+    Raises:
+        ValueError: If the window is malformed, isn't a multiple of 15 minutes or is longer
+            than the history.
+    """
+    match = WINDOW_PATTERN.match((janela or "").strip().lower())
+    if not match:
+        raise ValueError('Parameter "janela" must be formatted as <n>min or <n>h.')
+    minutes = int(match.group(1)) * (60 if match.group(2) == "h" else 1)
+    if minutes <= 0 or minutes % 15:
+        raise ValueError('Parameter "janela" must be a multiple of 15 minutes.')
+    if minutes // 15 > max_slots:
+        raise ValueError(f'Parameter "janela" must be at most {max_slots * 15 // 60}h.')
+    return minutes // 15
+
+
+def get_slot(last_update: datetime) -> int:
+    """Index of the 15-minute slot a timestamp falls in"""
+    if timezone.is_naive(last_update):
+        last_update = timezone.make_aware(last_update)
+    return int(last_update.timestamp() // SLOT_SECONDS)
+
+
+def slot_time(slot: int) -> datetime:
+    """
+    Time of a 15-minute slot, in the current time zone: the last update of the snapshots it
+    holds, rounded down to 15 minutes
+    """
+    return timezone.localtime(
+        datetime.fromtimestamp(slot * SLOT_SECONDS, tz=dt_timezone.utc)
+    )
+
+
+class RainHistory:
+    """Ring buffer of 15-minute rainfall snapshots, by slot and hexagon"""
+
+    def __init__(self, field: str, size: int, directory: Optional[str] = None):
+        """
+        Args:
+            field: Field of the snapshot items holding the 15-minute rainfall.
+            size: Number of 15-minute slots to keep (e.g. 384 for 96 hours).
+            directory: Where to save the ring buffer, if anywhere.
+        """
+        self.field = field
+        self.size = size
+        self.directory = directory or None
+        # Rainfall by slot position and hexagon column (NaN where unknown)
+        self._values = np.full((size, 0), np.nan, dtype=np.float32)
+        # Slot held by each position of the ring, or -1
+        self._slots = np.full(size, -1, dtype=np.int64)
+        self._columns: Dict[str, int] = {}
+        self._bairros: Dict[str, Optional[str]] = {}
+        self._versions: Dict[int, str] = {}
+        self._last_slot = -1
+        self._cumulative: Optional[Tuple[np.ndarray, np.ndarray]] = None
+        # Identity of the file last loaded, to tell when it's replaced
+        self._loaded: Optional[Tuple[int, int]] = None
+        self._lock = threading.Lock()
+        if self.directory:
+            self.reload()
+
+    @property
+    def last_slot(self) -> int:
+        """Latest slot recorded, or -1"""
+        return self._last_slot
+
+    def observe(self, snapshot: Snapshot) -> bool:
+        """
+        Record a snapshot, unless its version was already recorded. Returns whether it was.
+        """
+        if snapshot.version is None or snapshot.last_update is None:
+            return False
+        slot = get_slot(snapshot.last_update)
+        if self._versions.get(slot) == snapshot.version:
+            return False
+        with self._lock:
+            if slot <= self._last_slot - self.size:
+                return False
+            ids = []
+            values = []
+            for item in snapshot.data:
+                id_h3 = item.get("id_h3")
+                value = item.get(self.field)
+                if not id_h3 or not isinstance(value, (int, float)):
+                    continue
+                ids.append(str(id_h3))
+                values.append(value)
+                self._bairros[str(id_h3)] = item.get("bairro")
+            self._add_columns(ids)
+            position = slot % self.size
+            if self._slots[position] != slot:
+                self._values[position] = np.nan
+                self._slots[position] = slot
+            self._values[position, [self._columns[id_h3] for id_h3 in ids]] = values
+            self._versions = {
+                s: v for s, v in self._versions.items() if s > slot - self.size
+            }
+            self._versions[slot] = snapshot.version
+            self._last_slot = max(self._last_slot, slot)
+            self._cumulative = None
+        return True
+
+    def get_window(self, slots: int) -> Tuple[List[dict], float]:
+        """
+        Rainfall of every hexagon over the last `slots` slots, along with the share of those
+        slots that were recorded
+        """
+        with self._lock:
+            cumulative, recorded = self._get_cumulative()
+            totals = cumulative[-1] - cumulative[-1 - slots]
+            coverage = float(recorded[-slots:].mean()) if self._last_slot >= 0 else 0.0
+            items = [
+                {
+                    "id_h3": id_h3,
+                    "bairro": self._bairros.get(id_h3),
+                    "quantidade": round(float(totals[column]), 2),
+                }
+                for id_h3, column in self._columns.items()
+            ]
+        return items, coverage
+
+    def get_series(self, id_h3: str, slots: int) -> List[dict]:
+        """
+        Rainfall of a hexagon over windows of `slots` slots ending at each recorded slot
+
+        Raises:
+            KeyError: If the hexagon was never recorded.
+        """
+        with self._lock:
+            column = self._columns[id_h3]
+            cumulative, recorded = self._get_cumulative()
+            sums = cumulative[slots:, column] - cumulative[:-slots, column]
+            # Window ending at each position of the chronological order (last one is newest)
+            start = len(sums) - self.size
+            ends = sums[start:]
+            first_slot = self._last_slot - self.size + 1
+            return [
+                {
+                    "horario": slot_time(first_slot + offset),
+                    "quantidade": round(float(ends[offset]), 2),
+                }
+                for offset in np.flatnonzero(recorded)
+            ]
+
+    def _get_cumulative(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Cumulative sums of rainfall over the slots in chronological order (with a leading row
+        of zeros, and padded with as many zero rows as slots so any window fits), and whether
+        each slot was recorded. Must hold the lock.
+        """
+        if self._cumulative is None:
+            first_slot = self._last_slot - self.size + 1
+            slots = np.arange(first_slot, self._last_slot + 1)
+            positions = slots % self.size
+            recorded = (self._slots[positions] == slots) & (slots >= 0)
+            ordered = np.where(
+                recorded[:, None], np.nan_to_num(self._values[positions]), 0
+            )
+            padded = np.zeros((2 * self.size + 1, ordered.shape[1]), dtype=np.float64)
+            start = self.size + 1
+            padded[start:] = ordered
+            self._cumulative = (np.cumsum(padded, axis=0), recorded)
+        return self._cumulative
+
+    def _add_columns(self, ids: List[str]):
+        """Make room for hexagons never seen before. Must hold the lock."""
+        new = [id_h3 for id_h3 in dict.fromkeys(ids) if id_h3 not in self._columns]
+        if not new:
+            return
+        for id_h3 in new:
+            self._columns[id_h3] = len(self._columns)
+        self._values = np.pad(
+            self._values, ((0, 0), (0, len(new))), constant_values=np.nan
+        )
+
+    def _path(self) -> str:
+        return os.path.join(self.directory, f"rain_history_{self.field}.npz")
+
+    def save(self):
+        """Write the ring buffer to the directory, atomically"""
+        path = None
+        try:
+            with self._lock:
+                state = {
+                    "values": self._values.copy(),
+                    "slots": self._slots.copy(),
+                    "ids": np.array(list(self._columns), dtype=str),
+                    "bairros": np.array(
+                        [self._bairros.get(id_h3) or "" for id_h3 in self._columns],
+                        dtype=str,
+                    ),
+                }
+            os.makedirs(self.directory, exist_ok=True)
+            fd, path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            with os.fdopen(fd, "wb") as file:
+                np.savez(file, **state)
+            os.replace(path, self._path())
+        except Exception:
+            logger.exception("Failed to save the rain history")
+            if path is not None and os.path.exists(path):
+                os.remove(path)
+
+    def reload(self):
+        """Read the ring buffer saved to the directory back, if it changed since last read"""
+        try:
+            stat = os.stat(self._path())
+        except FileNotFoundError:
+            return
+        if (stat.st_ino, stat.st_mtime_ns) == self._loaded:
+            return
+        try:
+            with np.load(self._path()) as saved:
+                values, slots = saved["values"], saved["slots"]
+                ids, bairros = list(saved["ids"]), list(saved["bairros"])
+        except FileNotFoundError:
+            return
+        except Exception:
+            logger.exception("Failed to load the rain history")
+            return
+        if len(slots) != self.size or values.shape != (self.size, len(ids)):
+            logger.warning("Discarding a rain history of a different size")
+            return
+        with self._lock:
+            self._values = values.astype(np.float32)
+            self._slots = slots.astype(np.int64)
+            self._columns = {str(id_h3): column for column, id_h3 in enumerate(ids)}
+            self._bairros = {
+                str(id_h3): str(bairro) or None for id_h3, bairro in zip(ids, bairros)
+            }
+            self._versions = {}
+            self._last_slot = int(self._slots.max())
+            self._cumulative = None
+            self._loaded = (stat.st_ino, stat.st_mtime_ns)
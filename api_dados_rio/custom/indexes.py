@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+"""
+Server-side filtering of H3 snapshots.
+
+Queries are answered from indexes (e.g. value -> positions in the payload) that are built once
+per snapshot version and kept alongside it, so a request never scans the whole city.
+"""
+import unicodedata
+from typing import Callable, Dict, List, Optional, Set
+
+from drf_yasg import openapi
+from rest_framework.request import Request
+
+from api_dados_rio.custom.snapshots import Snapshot
+
+Index = Dict[str, List[int]]
+
+
+def normalize_bairro(value: str) -> str:
+    """Normalize a neighbourhood name so that matching ignores case, accents and spacing"""
+    value = unicodedata.normalize("NFKD", value)
+    value = "".join(char for char in value if not unicodedata.combining(char))
+    return " ".join(value.casefold().split())
+
+
+def build_index(
+    snapshot: Snapshot, field: str, normalize: Callable[[str], str] = None
+) -> Index:
+    """Map each value of a field to the positions of the items holding it"""
+    index: Index = {}
+    for position, item in enumerate(snapshot.data):
+        value = item.get(field) if isinstance(item, dict) else None
+        if value is None:
+            continue
+        value = str(value)
+        if normalize:
+            value = normalize(value)
+        index.setdefault(value, []).append(position)
+    return index
+
+
+# Filters supported by H3 datasets: query parameter -> how its values are normalized
+FILTERS: Dict[str, Optional[Callable[[str], str]]] = {
+    "id_h3": None,
+    "bairro": normalize_bairro,
+}
+
+FILTER_PARAMETERS = [
+    openapi.Parameter(
+        "id_h3",
+        openapi.IN_QUERY,
+        description="Retorna apenas os hexágonos (H3) informados. Aceita vários valores, "
+        "repetindo o parâmetro ou separando-os por vírgula.",
+        type=openapi.TYPE_STRING,
+        required=False,
+    ),
+    openapi.Parameter(
+        "bairro",
+        openapi.IN_QUERY,
+        description="Retorna apenas os hexágonos (H3) dos bairros informados, sem diferenciar "
+        "maiúsculas ou acentos. Aceita vários valores, repetindo o parâmetro ou separando-os "
+        "por vírgula.",
+        type=openapi.TYPE_STRING,
+        required=False,
+    ),
+]
+
+
+def get_index(snapshot: Snapshot, field: str) -> Index:
+    """Get the index of a field for a snapshot, building it once per version"""
+    return snapshot.derive(
+        f"index.{field}", lambda snapshot: build_index(snapshot, field, FILTERS[field])
+    )
+
+
+class Query:
+    """A server-side selection of the items of a snapshot"""
+
+    @property
+    def variant(self) -> str:
+        """Canonical representation of the query, used to tell representations apart"""
+        raise NotImplementedError
+
+    def match(self, snapshot: Snapshot) -> Set[int]:
+        """Positions of the items of a snapshot matching the query"""
+        raise NotImplementedError
+
+
+class FieldFilter(Query):
+    """Items whose field holds any of the given values"""
+
+    def __init__(self, field: str, values: List[str]):
+        self.field = field
+        self.values = values
+
+    @property
+    def variant(self) -> str:
+        return f"{self.field}={','.join(self.values)}"
+
+    def match(self, snapshot: Snapshot) -> Set[int]:
+        index = get_index(snapshot, self.field)
+        return {position for value in self.values for position in index.get(value, ())}
+
+
+def get_filters(request: Request) -> List[FieldFilter]:
+    """
+    Read the filters of a request. Each one may be repeated and/or hold comma-separated values.
+    Values are normalized and deduplicated, so equivalent requests get the same filters.
+    """
+    filters = []
+    for field, normalize in FILTERS.items():
+        values = {
+            normalize(value) if normalize else value
+            for param in request.query_params.getlist(field)
+            for value in (value.strip() for value in param.split(","))
+            if value
+        }
+        if values:
+            filters.append(FieldFilter(field, sorted(values)))
+    return filters
+
+
+def get_variant(queries: List[Query]) -> str:
+    """Canonical representation of a list of queries"""
+    return "&".join(query.variant for query in queries)
+
+
+def select(snapshot: Snapshot, queries: List[Query]) -> List[dict]:
+    """Items of a snapshot matching every query, in their original order"""
+    positions = None
+    for query in queries:
+        matches = query.match(snapshot)
+        positions = matches if positions is None else positions & matches
+    return [snapshot.data[position] for position in sorted(positions or ())]
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+"""
+Prometheus metrics, served at ``/metrics/``.
+
+Each gunicorn worker keeps its own metrics. When ``PROMETHEUS_MULTIPROC_DIR`` is set (as done by
+``start-server.sh``), they're written there and aggregated across every worker on scrape.
+
+Metrics aren't public: nginx doesn't serve them, so they're scraped from gunicorn directly (port
+8000), and only by clients in ``METRICS_ALLOWED_NETWORKS`` or bearing ``METRICS_TOKEN``.
+"""
+import hmac
+from ipaddress import ip_address, ip_network
+from os import getenv
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+CIRCUIT_BREAKER_STATE = Gauge(
+    "circuit_breaker_state",
+    "State of a circuit breaker (0: closed, 1: half-open, 2: open)",
+    ["breaker"],
+    multiprocess_mode="max",
+)
+CIRCUIT_BREAKER_TRANSITIONS = Counter(
+    "circuit_breaker_transitions",
+    "Times a circuit breaker changed to a state",
+    ["breaker", "state"],
+)
+CIRCUIT_BREAKER_CALLS = Counter(
+    "circuit_breaker_calls",
+    "Calls through a circuit breaker, by outcome (success, slow, failure or rejected)",
+    ["breaker", "outcome"],
+)
+COR_COMANDO_TOKEN_REFRESHES = Counter(
+    "cor_comando_token_refreshes",
+    "Logins to comando's API, by reason (missing, expiring or rejected) and outcome",
+    ["reason", "outcome"],
+)
+COR_COMANDO_REQUEST_DURATION = Histogram(
+    "cor_comando_request_duration_seconds",
+    "Duration of each attempt of a request to comando's API, by endpoint (URL path) and "
+    "outcome (status code, timeout or error)",
+    ["endpoint", "outcome"],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20),
+)
+COR_COMANDO_RETRIES = Counter(
+    "cor_comando_retries",
+    "Retries of requests to comando's API, by endpoint (URL path)",
+    ["endpoint"],
+)
+SINGLE_FLIGHT_CALLS = Counter(
+    "single_flight_calls",
+    "Cache misses coalesced by single-flight, by role (leader, waiter, shared or timeout)",
+    ["role"],
+)
+
+STREAMS_OPEN = Gauge(
+    "streams_open",
+    "Server-Sent Events streams currently open",
+    multiprocess_mode="livesum",
+)
+STREAMS_REJECTED = Counter(
+    "streams_rejected",
+    "Streams refused for exceeding the limit of a worker or of a client",
+    ["limit"],
+)
+
+
+def is_scraper(request) -> bool:
+    """Whether a request may read the metrics"""
+    token = getattr(settings, "METRICS_TOKEN", "")
+    authorization = request.META.get("HTTP_AUTHORIZATION", "")
+    if token and hmac.compare_digest(authorization, f"Bearer {token}"):
+        return True
+    if "HTTP_X_FORWARDED_FOR" in request.META:
+        # Proxied by nginx, so it may come from anywhere
+        return False
+    try:
+        address = ip_address(request.META.get("REMOTE_ADDR", ""))
+    except ValueError:
+        return False
+    return any(
+        address in ip_network(network, strict=False)
+        for network in getattr(settings, "METRICS_ALLOWED_NETWORKS", [])
+    )
+
+
+def metrics_view(request):
+    """Expose the metrics of this process, or of every worker in multiprocess mode"""
+    if not is_scraper(request):
+        return HttpResponseForbidden()
+    registry = REGISTRY
+    if getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    return HttpResponse(generate_latest(registry), content_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+"""
+Process-wide Redis connection pools.
+
+Each Redis target (the main instance at ``REDIS_URL`` and the Skupper instance) gets a single
+connection pool, created lazily on first use inside each gunicorn worker and reused by every
+request afterwards. Pools are fork-safe: ``redis-py`` drops inherited connections when it
+detects it is running in a new process.
+
+Code running on the event loop of an ASGI worker gets asyncio clients instead, pooled the same
+way (one pool per target and event loop). They return raw values, which must be deserialized
+with ``RedisPal._deserialize``.
+
+Every command goes through the circuit breaker of its target (``redis.<target>``), so while a
+target is down, commands fail fast with `CircuitOpen` instead of waiting on it.
+"""
+import asyncio
+import threading
+from os import getenv
+from typing import Callable, Dict, Tuple
+
+import redis.asyncio
+from django.conf import settings
+from redis import BlockingConnectionPool
+from redis_pal import RedisPal
+
+from api_dados_rio.custom.breakers import CircuitBreaker, get_breaker
+
+REDIS_TARGET_MAIN = "main"
+REDIS_TARGET_SKUPPER = "skupper"
+
+_clients: Dict[str, "GuardedRedisPal"] = {}
+_clients_lock = threading.Lock()
+_async_clients: Dict[Tuple[str, asyncio.AbstractEventLoop], "GuardedAsyncRedis"] = {}
+
+
+class GuardedRedisPal(RedisPal):
+    """RedisPal client running its commands through a circuit breaker"""
+
+    breaker: CircuitBreaker = None
+
+    def execute_command(self, *args, **options):
+        with self.breaker.guard():
+            return super().execute_command(*args, **options)
+
+
+class GuardedAsyncRedis(redis.asyncio.Redis):
+    """Asyncio Redis client running its commands through a circuit breaker"""
+
+    breaker: CircuitBreaker = None
+
+    async def execute_command(self, *args, **options):
+        with self.breaker.guard():
+            return await super().execute_command(*args, **options)
+
+
+def get_redis_breaker(target: str) -> CircuitBreaker:
+    """Get the circuit breaker of a Redis target"""
+    return get_breaker(
+        f"redis.{target}", getattr(settings, "REDIS_SLOW_CALL_DURATION", 1)
+    )
+
+
+def get_pool_options() -> dict:
+    """Connection pool options shared by every Redis target"""
+    return {
+        "max_connections": getattr(settings, "REDIS_POOL_MAX_CONNECTIONS", 10),
+        "timeout": getattr(settings, "REDIS_POOL_TIMEOUT", 2),
+        "socket_timeout": getattr(settings, "REDIS_SOCKET_TIMEOUT", 2),
+        "socket_connect_timeout": getattr(settings, "REDIS_SOCKET_CONNECT_TIMEOUT", 2),
+        "socket_keepalive": True,
+        "health_check_interval": getattr(settings, "REDIS_HEALTH_CHECK_INTERVAL", 30),
+    }
+
+
+def _build_main_pool() -> BlockingConnectionPool:
+    redis_url = getenv("REDIS_URL")
+    assert redis_url is not None
+    return BlockingConnectionPool.from_url(redis_url, **get_pool_options())
+
+
+def _build_skupper_pool(
+    pool_class: type = BlockingConnectionPool,
+) -> BlockingConnectionPool:
+    return pool_class(
+        host=getenv("SKUPPER_REDIS_HOST"),
+        port=int(getenv("SKUPPER_REDIS_PORT")),
+        db=int(getenv("SKUPPER_REDIS_DB")),
+        password=getenv("SKUPPER_REDIS_PASSWORD"),
+        **get_pool_options(),
+    )
+
+
+def _build_async_main_pool() -> redis.asyncio.BlockingConnectionPool:
+    redis_url = getenv("REDIS_URL")
+    assert redis_url is not None
+    return redis.asyncio.BlockingConnectionPool.from_url(
+        redis_url, **get_pool_options()
+    )
+
+
+def _build_async_skupper_pool() -> redis.asyncio.BlockingConnectionPool:
+    return _build_skupper_pool(redis.asyncio.BlockingConnectionPool)
+
+
+POOL_BUILDERS: Dict[str, Callable[[], BlockingConnectionPool]] = {
+    REDIS_TARGET_MAIN: _build_main_pool,
+    REDIS_TARGET_SKUPPER: _build_skupper_pool,
+}
+
+ASYNC_POOL_BUILDERS: Dict[str, Callable[[], redis.asyncio.BlockingConnectionPool]] = {
+    REDIS_TARGET_MAIN: _build_async_main_pool,
+    REDIS_TARGET_SKUPPER: _build_async_skupper_pool,
+}
+
+
+def get_redis_client(target: str = REDIS_TARGET_MAIN) -> GuardedRedisPal:
+    """Get the pooled client for a Redis target, creating its pool on first use"""
+    client = _clients.get(target)
+    if client is not None:
+        return client
+    with _clients_lock:
+        client = _clients.get(target)
+        if client is None:
+            client = GuardedRedisPal(connection_pool=POOL_BUILDERS[target]())
+            client.breaker = get_redis_breaker(target)
+            _clients[target] = client
+    return client
+
+
+def get_async_redis_client(target: str = REDIS_TARGET_MAIN) -> GuardedAsyncRedis:
+    """
+    Get the pooled asyncio client for a Redis target on the running event loop, creating its
+    pool on first use. Must be called from a coroutine.
+    """
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get((target, loop))
+    if client is None:
+        # Forget the clients of event loops that are gone (e.g. from async_to_sync calls)
+        for key in [key for key in _async_clients if key[1].is_closed()]:
+            del _async_clients[key]
+        client = GuardedAsyncRedis(connection_pool=ASYNC_POOL_BUILDERS[target]())
+        client.breaker = get_redis_breaker(target)
+        _async_clients[(target, loop)] = client
+    return client
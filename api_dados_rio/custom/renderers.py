@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+from datetime import datetime
+from typing import Optional
+
+import msgpack
+import pyarrow as pa
+import pyarrow.parquet as pq
+from django.utils import timezone
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+from api_dados_rio.custom.geometry import get_geometry_json
+from api_dados_rio.custom.tables import to_table
+
+
+def render_error(data, renderer_context: Optional[dict]) -> Optional[bytes]:
+    """
+    Render the body of an error response as JSON, along with its Content-Type, for formats
+    that don't represent errors. Returns None if the response isn't an error.
+    """
+    response = (renderer_context or {}).get("response")
+    if response is None or response.status_code < 400:
+        return None
+    response["Content-Type"] = JSONRenderer.media_type
+    return JSONRenderer().render(data)
+
+
+class MessagePackRenderer(BaseRenderer):
+    """
+    Renders data as MessagePack (`Accept: application/msgpack` or `?format=msgpack`).
+
+    Datetimes are encoded natively, as MessagePack timestamps (naive ones are taken to be in
+    the default time zone). Any other type MessagePack doesn't know is converted the same way
+    as by the JSON renderer.
+    """
+
+    media_type = "application/msgpack"
+    format = "msgpack"
+    charset = None
+    render_style = "binary"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None) -> bytes:
+        if data is None:
+            return b""
+        return msgpack.packb(data, default=self.default, use_bin_type=True)
+
+    @staticmethod
+    def default(value):
+        if isinstance(value, datetime):
+            if timezone.is_naive(value):
+                value = timezone.make_aware(value)
+            return msgpack.Timestamp.from_datetime(value)
+        return JSONEncoder().default(value)
+
+
+class TableRenderer(BaseRenderer):
+    """
+    Base class of the renderers of tabular formats, which only represent lists of objects
+    (one row per object, one typed column per field). Error responses are rendered as JSON, and
+    any other object as a table with a single row.
+    """
+
+    charset = None
+    render_style = "binary"
+    # Only lists of objects can be rendered
+    tabular = True
+    # Whether the rendered bytes are already compressed, so they shouldn't be compressed again
+    compressed = False
+
+    def render(self, data, accepted_media_type=None, renderer_context=None) -> bytes:
+        if data is None:
+            return b""
+        error = render_error(data, renderer_context)
+        if error is not None:
+            return error
+        return self.write(to_table(data if isinstance(data, list) else [data]))
+
+    def write(self, table: pa.Table) -> bytes:
+        raise NotImplementedError
+
+
+class ArrowRenderer(TableRenderer):
+    """
+    Renders data as an Apache Arrow IPC stream (`?format=arrow`), e.g. for
+    `pyarrow.ipc.open_stream(content).read_pandas()`. Buffers are left uncompressed by Arrow
+    (the response itself is still compressed over HTTP), so readers can use them zero-copy.
+    """
+
+    media_type = "application/vnd.apache.arrow.stream"
+    format = "arrow"
+
+    def write(self, table: pa.Table) -> bytes:
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        return sink.getvalue().to_pybytes()
+
+
+class ParquetRenderer(TableRenderer):
+    """Renders data as a Parquet file (`?format=parquet`), e.g. for `pandas.read_parquet`"""
+
+    media_type = "application/vnd.apache.parquet"
+    format = "parquet"
+    compressed = True
+
+    def write(self, table: pa.Table) -> bytes:
+        sink = pa.BufferOutputStream()
+        pq.write_table(table, sink, compression="zstd")
+        return sink.getvalue().to_pybytes()
+
+
+class MapboxVectorTileRenderer(BaseRenderer):
+    """
+    Renders Mapbox Vector Tiles (`Accept: application/vnd.mapbox-vector-tile`). Tiles are
+    encoded by the view, so their bytes are passed through as they are.
+    """
+
+    media_type = "application/vnd.mapbox-vector-tile"
+    format = "mvt"
+    charset = None
+    render_style = "binary"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None) -> bytes:
+        if data is None:
+            return b""
+        return data
+
+
+class ProtobufTileRenderer(MapboxVectorTileRenderer):
+    """Same as `MapboxVectorTileRenderer`, for clients asking for `application/x-protobuf`"""
+
+    media_type = "application/x-protobuf"
+    format = "pbf"
+
+
+class GeoJSONRenderer(BaseRenderer):
+    """
+    Renders a list of H3 hexagons as a GeoJSON FeatureCollection (`?format=geojson`), with
+    the boundary of each cell as its geometry and the whole item as its properties. Boundaries
+    come already rendered from the geometry cache, so only the properties are rendered per
+    snapshot. Any other object is rendered as plain JSON, and so are errors, as
+    `application/json`.
+    """
+
+    media_type = "application/geo+json"
+    format = "geojson"
+    charset = None
+    # Only lists of objects can be rendered
+    tabular = True
+
+    def render(self, data, accepted_media_type=None, renderer_context=None) -> bytes:
+        if data is None:
+            return b""
+        error = render_error(data, renderer_context)
+        if error is not None:
+            return error
+        renderer = JSONRenderer()
+        if not isinstance(data, list):
+            return renderer.render(data)
+        features = []
+        for item in data:
+            id_h3 = item.get("id_h3")
+            features.append(
+                b"".join(
+                    [
+                        b'{"type":"Feature","geometry":',
+                        get_geometry_json(id_h3) if isinstance(id_h3, str) else b"null",
+                        b',"properties":',
+                        renderer.render(item),
+                        b"}",
+                    ]
+                )
+            )
+        return b'{"type":"FeatureCollection","features":[' + b",".join(features) + b"]}"
@@ -0,0 +1,341 @@
+# -*- coding: utf-8 -*-
+import gzip
+import hashlib
+from typing import Any, Callable, Dict, Optional
+
+import brotli
+from django.http import HttpResponse
+from django.http.response import HttpResponseBase
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, parse_etags, quote_etag
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.response import Response
+
+from api_dados_rio.custom.snapshots import Snapshot, SnapshotVersion
+
+# Payloads smaller than this are not worth compressing
+MIN_COMPRESSION_SIZE = 1024
+
+# Compressors by content-coding, in order of preference. Each variant is built only once per
+# snapshot version, so we can afford high compression levels.
+COMPRESSORS: Dict[str, Callable[[bytes], bytes]] = {
+    "br": lambda content: brotli.compress(content, quality=9),
+    "gzip": lambda content: gzip.compress(content, compresslevel=9, mtime=0),
+}
+
+# Compressors for representations built on every request (e.g. filtered subsets), which can't
+# amortize the cost of high compression levels
+FAST_COMPRESSORS: Dict[str, Callable[[bytes], bytes]] = {
+    "br": lambda content: brotli.compress(content, quality=5),
+    "gzip": lambda content: gzip.compress(content, compresslevel=6, mtime=0),
+}
+
+
+# Negotiated formats served as bytes rendered once per snapshot version. Other formats (e.g. the
+# browsable API) go through the regular DRF response.
+PRERENDERED_FORMATS = ("json", "msgpack", "arrow", "parquet", "geojson", "mvt", "pbf")
+
+
+def render_json(snapshot: Snapshot) -> bytes:
+    """Render a snapshot payload exactly as DRF's JSONRenderer would"""
+    return JSONRenderer().render(snapshot.data)
+
+
+def format_last_update(version: SnapshotVersion) -> Optional[str]:
+    """Format the last update of a dataset version like the `ultima_atualizacao_*` endpoints"""
+    if version.last_update is None:
+        return None
+    return version.last_update.strftime("%d/%m/%Y %H:%M:%S")
+
+
+def render_batch_json(snapshots: Dict[str, Snapshot]) -> bytes:
+    """
+    Render several named snapshots as a single JSON object, reusing the JSON already rendered
+    for each of them
+    """
+    renderer = JSONRenderer()
+    parts = []
+    for name, snapshot in snapshots.items():
+        parts.append(
+            b"".join(
+                [
+                    renderer.render(name),
+                    b':{"ultima_atualizacao":',
+                    renderer.render(format_last_update(snapshot)),
+                    b',"dados":',
+                    snapshot.derive("json", render_json),
+                    b"}",
+                ]
+            )
+        )
+    return b"{" + b",".join(parts) + b"}"
+
+
+def get_accepted_encodings(request: Request) -> Dict[str, float]:
+    """Parse the Accept-Encoding header into a mapping of content-coding to quality"""
+    encodings = {}
+    for item in request.META.get("HTTP_ACCEPT_ENCODING", "").split(","):
+        encoding, _, params = item.partition(";")
+        encoding = encoding.strip().lower()
+        if not encoding:
+            continue
+        quality = 1.0
+        params = params.strip().replace(" ", "")
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        encodings[encoding] = quality
+    return encodings
+
+
+def choose_encoding(request: Request) -> Optional[str]:
+    """Choose the preferred content-coding we support among the ones the client accepts"""
+    accepted = get_accepted_encodings(request)
+    for encoding in COMPRESSORS:
+        if accepted.get(encoding, accepted.get("*", 0.0)) > 0:
+            return encoding
+    return None
+
+
+def encoded_response(
+    request: Request,
+    snapshot: Snapshot,
+    name: str,
+    render: Callable[[Snapshot], bytes],
+    content_type: str,
+    compress: bool = True,
+) -> HttpResponse:
+    """
+    Respond with an artifact rendered from a snapshot, compressed with the best content-coding
+    accepted by the client (unless `compress` is false). Both the rendered artifact and its
+    compressed variants are built only once per snapshot version.
+    """
+    content = snapshot.derive(name, render)
+    encoding = (
+        choose_encoding(request) if compress and is_compressible(content) else None
+    )
+    if encoding:
+        content = snapshot.derive(
+            f"{name}.{encoding}",
+            lambda snapshot: COMPRESSORS[encoding](snapshot.derive(name, render)),
+        )
+    response = HttpResponse(content, content_type=content_type)
+    if encoding:
+        response["Content-Encoding"] = encoding
+    patch_vary_headers(response, ("Accept-Encoding",))
+    return response
+
+
+def is_compressible(content: bytes) -> bool:
+    return len(content) >= MIN_COMPRESSION_SIZE
+
+
+def is_precompressed(request: Request) -> bool:
+    """Whether the negotiated format is compressed on its own (e.g. Parquet)"""
+    return getattr(request.accepted_renderer, "compressed", False)
+
+
+def is_prerendered(request: Request) -> bool:
+    """Whether the negotiated format is served as bytes rendered once per snapshot version"""
+    return request.accepted_renderer.format in PRERENDERED_FORMATS
+
+
+def get_etag(
+    request: Request,
+    version: SnapshotVersion,
+    variant: str = None,
+    encoding: str = None,
+) -> Optional[str]:
+    """
+    Strong ETag for the representation of a dataset version that would be served to this
+    request. It's derived from the update key only, so it can be computed without loading the
+    payload. `variant` tells apart different representations of the same version, such as
+    filtered subsets, and `encoding` the content-coding its body is compressed with, if any.
+    """
+    if version.version is None:
+        return None
+    format = request.accepted_renderer.format
+    if format != "json":
+        variant = f"{variant}&format={format}" if variant else f"format={format}"
+    tag = version.version
+    if variant:
+        tag = f"{tag}-{hashlib.sha1(variant.encode()).hexdigest()[:16]}"
+    return quote_etag(f"{tag}-{encoding}" if encoding else tag)
+
+
+def get_last_modified(version: SnapshotVersion) -> Optional[int]:
+    """Timestamp of the last update of a dataset version, if its update key carries one"""
+    if version.last_update is None:
+        return None
+    last_update = version.last_update
+    if timezone.is_naive(last_update):
+        last_update = timezone.make_aware(last_update)
+    return int(last_update.timestamp())
+
+
+def set_validators(
+    response: HttpResponseBase,
+    request: Request,
+    version: SnapshotVersion,
+    variant: str = None,
+    encoding: str = None,
+) -> HttpResponseBase:
+    """
+    Set the ETag and Last-Modified headers of a dataset version on a response, whose body is
+    compressed with `encoding` (by default, its Content-Encoding)
+    """
+    etag = get_etag(
+        request, version, variant, encoding or response.get("Content-Encoding")
+    )
+    last_modified = get_last_modified(version)
+    if etag:
+        response["ETag"] = etag
+    if last_modified is not None:
+        response["Last-Modified"] = http_date(last_modified)
+    patch_vary_headers(response, ("Accept", "Accept-Encoding"))
+    return response
+
+
+def get_not_modified_response(
+    request: Request, version: SnapshotVersion, variant: str = None
+) -> Optional[HttpResponseBase]:
+    """
+    Answer If-None-Match / If-Modified-Since requests for a dataset version. Returns a 304
+    (or 412) response when the client's copy is still current, or None if the payload must be
+    served.
+    """
+    if not is_prerendered(request):
+        return None
+    # Bodies are only compressed when they're large enough, which isn't known until the payload
+    # is loaded, so the client's copy may have been served either way
+    encoding = None if is_precompressed(request) else choose_encoding(request)
+    requested = parse_etags(request.META.get("HTTP_IF_NONE_MATCH", ""))
+    if get_etag(request, version, variant, encoding) not in requested:
+        encoding = None
+    response = get_conditional_response(
+        request,
+        etag=get_etag(request, version, variant, encoding),
+        last_modified=get_last_modified(version),
+    )
+    if response is None:
+        return None
+    return set_validators(response, request, version, variant, encoding)
+
+
+def representation_response(
+    request: Request,
+    snapshot: Snapshot,
+    name: str,
+    build: Callable[[Snapshot], Any],
+    variant: str = None,
+) -> HttpResponseBase:
+    """
+    Respond with a representation of a snapshot, as built by `build`. In pre-rendered formats,
+    the representation is built, rendered and compressed only once per snapshot version and
+    then served as raw bytes, skipping DRF's rendering, along with the validators clients can
+    use for conditional requests. Other negotiated formats (e.g. the browsable API) still go
+    through the regular DRF response.
+    """
+    if not is_prerendered(request):
+        return Response(build(snapshot))
+    renderer = request.accepted_renderer
+    response = encoded_response(
+        request,
+        snapshot,
+        f"{name}.{renderer.format}" if name else renderer.format,
+        lambda snapshot: renderer.render(build(snapshot)),
+        content_type=renderer.media_type,
+        compress=not is_precompressed(request),
+    )
+    return set_validators(response, request, snapshot, variant)
+
+
+def snapshot_response(request: Request, snapshot: Snapshot) -> HttpResponseBase:
+    """Respond with a snapshot payload"""
+    return representation_response(
+        request, snapshot, "", lambda snapshot: snapshot.data
+    )
+
+
+def subset_response(
+    request: Request, snapshot: Snapshot, data: Any, variant: str
+) -> HttpResponseBase:
+    """
+    Respond with a subset of a snapshot payload (or another representation of it), such as the
+    result of a filter. Subsets are small and vary per request, so they're rendered and
+    compressed on the fly.
+    """
+    if not is_prerendered(request):
+        return Response(data)
+    renderer = request.accepted_renderer
+    content = renderer.render(data)
+    encoding = (
+        choose_encoding(request)
+        if not is_precompressed(request) and is_compressible(content)
+        else None
+    )
+    if encoding:
+        content = FAST_COMPRESSORS[encoding](content)
+    response = HttpResponse(content, content_type=renderer.media_type)
+    if encoding:
+        response["Content-Encoding"] = encoding
+    return set_validators(response, request, snapshot, variant)
+
+
+def get_batch_version(snapshots: Dict[str, Snapshot]) -> SnapshotVersion:
+    """Combined version of several named snapshots, which changes whenever any of them does"""
+    version = None
+    if all(snapshot.version is not None for snapshot in snapshots.values()):
+        tags = "|".join(f"{name}={s.version}" for name, s in snapshots.items())
+        version = hashlib.sha1(tags.encode()).hexdigest()[:16]
+    last_updates = [s.last_update for s in snapshots.values() if s.last_update]
+    last_update = max(last_updates) if len(last_updates) == len(snapshots) else None
+    return SnapshotVersion(version, last_update)
+
+
+def build_batch(snapshots: Dict[str, Snapshot]) -> Dict[str, dict]:
+    return {
+        name: {
+            "ultima_atualizacao": format_last_update(snapshot),
+            "dados": snapshot.data,
+        }
+        for name, snapshot in snapshots.items()
+    }
+
+
+def batch_snapshot_response(
+    request: Request, snapshots: Dict[str, Snapshot]
+) -> HttpResponseBase:
+    """
+    Respond with several snapshot payloads keyed by name, each one along with its last update.
+    The rendered (and compressed) body is cached alongside the first snapshot, under the
+    combined version of the batch, so it's only built once per combination of versions.
+    """
+    if not is_prerendered(request):
+        return Response(build_batch(snapshots))
+    version = get_batch_version(snapshots)
+    not_modified = get_not_modified_response(request, version)
+    if not_modified is not None:
+        return not_modified
+    renderer = request.accepted_renderer
+
+    def render(_: Optional[Snapshot]) -> bytes:
+        if renderer.format == "json":
+            return render_batch_json(snapshots)
+        return renderer.render(build_batch(snapshots))
+
+    if version.version is None:
+        response = HttpResponse(render(None), content_type=renderer.media_type)
+    else:
+        response = encoded_response(
+            request,
+            next(iter(snapshots.values())),
+            f"batch.{version.version}.{renderer.format}",
+            render,
+            content_type=renderer.media_type,
+        )
+    return set_validators(response, request, version)
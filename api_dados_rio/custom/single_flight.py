@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+"""
+Single-flight coalescing of expensive fetches across every worker, through the Django cache
+(Redis, in production).
+
+When a cached result expires, every concurrent request would otherwise fetch it again at once.
+With `single_flight`, the first caller for a key takes a lock (an atomic ``cache.add`` of a
+token of its own) and fetches; the others poll for its result, which is shared for
+``SINGLE_FLIGHT_RESULT_TTL`` seconds, long enough for callers that just missed the flight to pick
+it up too. A caller gives up waiting after ``SINGLE_FLIGHT_TIMEOUT`` seconds, which is also how
+long the lock lives if its holder dies, so it must outlast the slowest fetch. The lock is only
+released by the caller holding it: if it expired anyway, it may belong to another caller by then.
+"""
+import secrets
+from time import monotonic, sleep
+from typing import Any, Callable, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+
+from api_dados_rio.custom.metrics import SINGLE_FLIGHT_CALLS
+
+# How often waiters check for the result, in seconds
+POLL_INTERVAL = 0.05
+
+# Deletes a key only if it still holds the given value
+RELEASE_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+
+def release_lock(lock_key: str, token: int):
+    """Delete a lock, unless it expired and was taken by another caller meanwhile"""
+    client = getattr(cache, "client", None)
+    if hasattr(client, "get_client"):
+        # django-redis stores integers as they are, so Redis can compare them atomically
+        client.get_client(write=True).eval(
+            RELEASE_SCRIPT, 1, cache.make_key(lock_key), token
+        )
+    elif cache.get(lock_key) == token:
+        cache.delete(lock_key)
+
+
+def single_flight(key: str, fetch: Callable[[], Any]) -> Optional[Any]:
+    """
+    Fetch a result at most once at a time for a key, cluster-wide. `fetch` must return a
+    picklable result other than None. Returns None if we timed out waiting for another worker.
+    """
+    lock_key = f"single_flight_{key}_lock"
+    result_key = f"single_flight_{key}_result"
+    timeout = getattr(settings, "SINGLE_FLIGHT_TIMEOUT", 30)
+    result = cache.get(result_key)
+    if result is not None:
+        SINGLE_FLIGHT_CALLS.labels("shared").inc()
+        return result
+    token = secrets.randbits(62)
+    if cache.add(lock_key, token, timeout=timeout):
+        SINGLE_FLIGHT_CALLS.labels("leader").inc()
+        try:
+            result = fetch()
+            cache.set(
+                result_key,
+                result,
+                timeout=getattr(settings, "SINGLE_FLIGHT_RESULT_TTL", 10),
+            )
+            return result
+        finally:
+            release_lock(lock_key, token)
+    deadline = monotonic() + timeout
+    while monotonic() < deadline:
+        sleep(POLL_INTERVAL)
+        result = cache.get(result_key)
+        if result is not None:
+            SINGLE_FLIGHT_CALLS.labels("waiter").inc()
+            return result
+    SINGLE_FLIGHT_CALLS.labels("timeout").inc()
+    return None
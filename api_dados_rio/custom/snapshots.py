@@ -0,0 +1,445 @@
+# -*- coding: utf-8 -*-
+"""
+Per-worker cache of decoded dataset snapshots.
+
+Datasets published on Redis by our pipelines are stored as a pickled payload under a data key
+(e.g. ``data_last_15min_rain``) and a companion update key (e.g.
+``data_last_15min_rain_update``) that changes whenever a new payload is published. Instead of
+fetching and unpickling the whole payload on every request, we keep the decoded payload in
+memory and only reload it when the raw value of the update key changes. The update key itself
+is checked at most once every ``SNAPSHOT_CACHE_CHECK_INTERVAL`` seconds.
+
+The last ``SNAPSHOT_HISTORY_SIZE`` versions replaced by a newer one are kept per data key (without
+their derived artifacts), so that responses can be expressed relative to a recent version.
+
+Memory is bounded by ``SNAPSHOT_CACHE_MAX_ENTRIES`` and ``SNAPSHOT_CACHE_MAX_BYTES`` with least
+recently used eviction across datasets, enforced both when a snapshot is stored and when an
+artifact is derived from it. History is given up before current snapshots, and the derived
+artifacts of the most recently used snapshot last. The byte bound only counts serialized bytes:
+the pickled size of each payload, history included, plus its derived byte strings (rendered and
+compressed representations). Decoded payloads and the other derived artifacts (filter indexes,
+spatial indexes, column arrays and deltas) aren't counted, though they go with their snapshot
+when it's evicted, so actual memory use is a multiple of the bound.
+
+Every read has an ``a``-prefixed counterpart taking an asyncio client, for async views.
+"""
+import hashlib
+import threading
+from collections import OrderedDict, deque
+from datetime import datetime
+from time import monotonic, time
+from typing import (
+    Any,
+    Callable,
+    Deque,
+    Dict,
+    Generator,
+    List,
+    Optional,
+    Tuple,
+)
+
+from django.conf import settings
+from redis import Redis
+from redis.asyncio import Redis as AsyncRedis
+from redis_pal import RedisPal
+
+
+def get_raw(client: Redis, key: str) -> Optional[bytes]:
+    """Get the raw (still serialized) value of a key, bypassing RedisPal deserialization"""
+    return Redis.get(client, key)
+
+
+def parse_last_update(raw_update: Optional[bytes]) -> Optional[datetime]:
+    """Extract the update timestamp from the raw value of an update key, if there's one"""
+    if raw_update is None:
+        return None
+    try:
+        value = RedisPal._deserialize(raw_update)
+    except Exception:
+        return None
+    if isinstance(value, list) and len(value) > 0:
+        value = value[0]
+    if isinstance(value, dict):
+        value = value.get("last_update")
+    if isinstance(value, datetime):
+        return value
+    return None
+
+
+class SnapshotVersion:
+    """The version of a dataset, as given by the raw value of its update key"""
+
+    def __init__(
+        self,
+        version: Optional[str],
+        last_update: Optional[datetime],
+        raw_update: Optional[bytes] = None,
+    ):
+        self.version = version
+        self.last_update = last_update
+        self.raw_update = raw_update
+        # When a last known good snapshot, served as a fallback, was last confirmed current
+        self.confirmed_at: Optional[float] = None
+
+    @classmethod
+    def from_raw_update(cls, raw_update: Optional[bytes]) -> "SnapshotVersion":
+        version = hashlib.sha1(raw_update).hexdigest()[:16] if raw_update else None
+        return cls(version, parse_last_update(raw_update), raw_update)
+
+    @property
+    def staleness(self) -> Optional[float]:
+        """Seconds since this version was last confirmed current, if it's a fallback"""
+        if self.confirmed_at is None:
+            return None
+        return max(0.0, time() - self.confirmed_at)
+
+
+class Snapshot(SnapshotVersion):
+    """A decoded dataset payload and the version of the update key it was loaded with"""
+
+    def __init__(
+        self,
+        key: str,
+        version: Optional[str],
+        last_update: Optional[datetime],
+        data: Any,
+        size: int,
+        raw_update: Optional[bytes] = None,
+    ):
+        super().__init__(version, last_update, raw_update)
+        self.key = key
+        self.data = data
+        self.payload_size = size
+        self.checked_at = monotonic()
+        self._derived: Dict[str, Any] = {}
+        # Locks of the artifacts being built, so concurrent callers wait for a single build
+        self._building: Dict[str, threading.Lock] = {}
+        self._building_lock = threading.Lock()
+        # Cache holding this snapshot, told whenever a derived artifact makes it grow
+        self._owner: Optional["SnapshotCache"] = None
+
+    @property
+    def size(self) -> int:
+        """
+        Size counted against the cache's byte bound: serialized payload size plus every derived
+        byte string. Decoded objects, such as indexes, aren't counted.
+        """
+        return self.payload_size + sum(
+            len(value) for value in self._derived.values() if isinstance(value, bytes)
+        )
+
+    def derive(self, name: str, builder: Callable[["Snapshot"], Any]) -> Any:
+        """
+        Get an artifact derived from this snapshot (e.g. its rendered JSON), building it only
+        once. Since snapshots are immutable, derived artifacts live as long as the version.
+        Callers asking for an artifact while it's being built wait for that build. Blocks, so
+        async code should call it through `run_in_thread`.
+        """
+        try:
+            return self._derived[name]
+        except KeyError:
+            pass
+        with self._building_lock:
+            lock = self._building.setdefault(name, threading.Lock())
+        try:
+            with lock:
+                try:
+                    return self._derived[name]
+                except KeyError:
+                    pass
+                value = self._derived[name] = builder(self)
+        finally:
+            with self._building_lock:
+                if self._building.get(name) is lock:
+                    del self._building[name]
+        if isinstance(value, bytes) and self._owner is not None:
+            self._owner.evict()
+        return value
+
+    def forget(self, size: int) -> int:
+        """
+        Drop derived byte strings, oldest first, until at least `size` bytes were freed.
+        Returns the number of bytes freed.
+        """
+        freed = 0
+        for name, value in list(self._derived.items()):
+            if freed >= size:
+                break
+            if isinstance(value, bytes) and self._derived.pop(name, None) is not None:
+                freed += len(value)
+        return freed
+
+    def archived(self) -> "Snapshot":
+        """A copy of this snapshot without its derived artifacts, to be kept in history"""
+        return Snapshot(
+            self.key,
+            self.version,
+            self.last_update,
+            self.data,
+            self.payload_size,
+            self.raw_update,
+        )
+
+
+class SnapshotCache:
+    """LRU cache of dataset snapshots, revalidated against their update keys"""
+
+    def __init__(
+        self,
+        max_entries: int,
+        max_bytes: int,
+        check_interval: float,
+        history_size: int = 0,
+    ):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.check_interval = check_interval
+        self.history_size = history_size
+        self._entries: "OrderedDict[str, Snapshot]" = OrderedDict()
+        self._history: Dict[str, Deque[Snapshot]] = {}
+        self._lock = threading.Lock()
+
+    def get_version(
+        self,
+        client: Redis,
+        data_key: str,
+        update_key: str,
+        check_interval: Optional[float] = None,
+    ) -> SnapshotVersion:
+        """
+        Get the current version of a dataset without loading its payload. If the cached
+        snapshot is still current, the snapshot itself is returned. `check_interval` overrides
+        the cache's default interval between update key checks.
+        """
+        snapshot, fresh = self._lookup(data_key, check_interval)
+        if fresh:
+            return snapshot
+        return self._revalidate(
+            snapshot, SnapshotVersion.from_raw_update(get_raw(client, update_key))
+        )
+
+    def get(
+        self,
+        client: Redis,
+        data_key: str,
+        update_key: str,
+        check_interval: Optional[float] = None,
+    ) -> Snapshot:
+        """Get the snapshot for a data key, reloading it only if its update key changed"""
+        return self.get_many(client, [(data_key, update_key)], check_interval)[0]
+
+    async def aget_version(
+        self,
+        client: AsyncRedis,
+        data_key: str,
+        update_key: str,
+        check_interval: Optional[float] = None,
+    ) -> SnapshotVersion:
+        """Same as `get_version`, with an asyncio client"""
+        snapshot, fresh = self._lookup(data_key, check_interval)
+        if fresh:
+            return snapshot
+        return self._revalidate(
+            snapshot, SnapshotVersion.from_raw_update(await client.get(update_key))
+        )
+
+    async def aget(
+        self,
+        client: AsyncRedis,
+        data_key: str,
+        update_key: str,
+        check_interval: Optional[float] = None,
+    ) -> Snapshot:
+        """Same as `get`, with an asyncio client"""
+        return (await self.aget_many(client, [(data_key, update_key)], check_interval))[
+            0
+        ]
+
+    def get_many(
+        self,
+        client: Redis,
+        keys: List[Tuple[str, str]],
+        check_interval: Optional[float] = None,
+    ) -> List[Snapshot]:
+        """
+        Get the snapshots for several ``(data_key, update_key)`` pairs at once. The update keys
+        of stale snapshots and the data keys of datasets we don't hold yet are read in a single
+        MGET; only datasets that changed since they were cached need a second MGET. Payloads
+        are always read in the same MGET as their update key, so their versions match.
+        """
+        steps = self._get_many(keys, check_interval)
+        try:
+            mget_keys = next(steps)
+            while True:
+                mget_keys = steps.send(Redis.mget(client, mget_keys))
+        except StopIteration as result:
+            return result.value
+
+    async def aget_many(
+        self,
+        client: AsyncRedis,
+        keys: List[Tuple[str, str]],
+        check_interval: Optional[float] = None,
+    ) -> List[Snapshot]:
+        """Same as `get_many`, with an asyncio client"""
+        steps = self._get_many(keys, check_interval)
+        try:
+            mget_keys = next(steps)
+            while True:
+                mget_keys = steps.send(await client.mget(mget_keys))
+        except StopIteration as result:
+            return result.value
+
+    def _get_many(
+        self, keys: List[Tuple[str, str]], check_interval: Optional[float]
+    ) -> Generator[List[str], List[Optional[bytes]], List[Snapshot]]:
+        """
+        Steps of `get_many`, independent of the Redis client: yields the keys to read with
+        each MGET, is sent back their raw values and returns the snapshots.
+        """
+        snapshots: Dict[str, Snapshot] = {}
+        stale: List[Tuple[str, str, Optional[Snapshot]]] = []
+        for data_key, update_key in keys:
+            snapshot, fresh = self._lookup(data_key, check_interval)
+            if fresh:
+                snapshots[data_key] = snapshot
+            else:
+                stale.append((data_key, update_key, snapshot))
+        if not stale:
+            return [snapshots[data_key] for data_key, _ in keys]
+        update_keys = [update_key for _, update_key, _ in stale]
+        cold_keys = [data_key for data_key, _, snapshot in stale if snapshot is None]
+        raw_values = iter((yield update_keys + cold_keys))
+        raw_updates = [next(raw_values) for _ in update_keys]
+        raw_cold = dict(zip(cold_keys, raw_values))
+        changed: List[Tuple[str, str]] = []
+        for (data_key, update_key, snapshot), raw_update in zip(stale, raw_updates):
+            current = self._revalidate(
+                snapshot, SnapshotVersion.from_raw_update(raw_update)
+            )
+            if isinstance(current, Snapshot):
+                snapshots[data_key] = current
+            elif data_key in raw_cold:
+                snapshots[data_key] = self._load(data_key, current, raw_cold[data_key])
+            else:
+                changed.append((data_key, update_key))
+        if changed:
+            # Read the update keys again, as they may have changed once more meanwhile
+            mget_keys = [key for pair in changed for key in reversed(pair)]
+            raw_changed = iter((yield mget_keys))
+            # Raw values come in (update, data) pairs
+            for (data_key, _), raw_update, raw_data in zip(
+                changed, raw_changed, raw_changed
+            ):
+                snapshots[data_key] = self._load(
+                    data_key, SnapshotVersion.from_raw_update(raw_update), raw_data
+                )
+        return [snapshots[data_key] for data_key, _ in keys]
+
+    def get_previous(self, data_key: str, version: str) -> Optional[Snapshot]:
+        """Get a recent snapshot of a data key by its version, if we still hold it"""
+        with self._lock:
+            snapshot = self._entries.get(data_key)
+            if snapshot is not None and snapshot.version == version:
+                return snapshot
+            for snapshot in self._history.get(data_key, ()):
+                if snapshot.version == version:
+                    return snapshot
+        return None
+
+    def clear(self):
+        with self._lock:
+            for snapshot in self._entries.values():
+                snapshot._owner = None
+            self._entries.clear()
+            self._history.clear()
+
+    def evict(self):
+        """Evict until the cache fits its bounds again, e.g. after a snapshot grew"""
+        with self._lock:
+            self._evict()
+
+    def _lookup(
+        self, data_key: str, check_interval: Optional[float] = None
+    ) -> Tuple[Optional[Snapshot], bool]:
+        """Get the cached snapshot of a data key and whether it was checked recently"""
+        if check_interval is None:
+            check_interval = self.check_interval
+        with self._lock:
+            snapshot = self._entries.get(data_key)
+            if snapshot is None:
+                return None, False
+            self._entries.move_to_end(data_key)
+            return snapshot, monotonic() - snapshot.checked_at < check_interval
+
+    def _revalidate(
+        self, snapshot: Optional[Snapshot], current: SnapshotVersion
+    ) -> SnapshotVersion:
+        """Return the cached snapshot if it matches the current version, else the version"""
+        unchanged = snapshot is not None and snapshot.version == current.version
+        if unchanged and current.version is not None:
+            snapshot.checked_at = monotonic()
+            return snapshot
+        return current
+
+    def _load(
+        self, data_key: str, current: SnapshotVersion, raw_data: Optional[bytes]
+    ) -> Snapshot:
+        """Decode a freshly read payload and cache it, unless the data key was empty"""
+        snapshot = Snapshot(
+            key=data_key,
+            version=current.version,
+            last_update=current.last_update,
+            data=RedisPal._deserialize(raw_data),
+            size=len(raw_data) if raw_data else 0,
+            raw_update=current.raw_update,
+        )
+        if snapshot.data is not None:
+            self._store(snapshot)
+        return snapshot
+
+    def _store(self, snapshot: Snapshot):
+        with self._lock:
+            previous = self._entries.pop(snapshot.key, None)
+            replaced = previous is not None and previous.version != snapshot.version
+            if replaced and self.history_size > 0:
+                self._history.setdefault(
+                    snapshot.key, deque(maxlen=self.history_size)
+                ).append(previous.archived())
+            if previous is not None:
+                previous._owner = None
+            snapshot._owner = self
+            self._entries[snapshot.key] = snapshot
+            self._evict()
+
+    def _evict(self):
+        """Evict until the cache fits its bounds. Must hold the lock."""
+        # Derived artifacts grow snapshots after they are stored, so sizes are summed here
+        size = sum(entry.size for entry in self._entries.values())
+        size += sum(s.size for history in self._history.values() for s in history)
+        # Give up the oldest history first
+        for history in self._history.values():
+            while history and size > self.max_bytes:
+                size -= history.popleft().size
+        # Evict least recently used snapshots, but never the most recently used one
+        while len(self._entries) > 1 and (
+            len(self._entries) > self.max_entries or size > self.max_bytes
+        ):
+            key, evicted = self._entries.popitem(last=False)
+            evicted._owner = None
+            size -= evicted.size
+            size -= sum(s.size for s in self._history.pop(key, ()))
+        # The artifacts derived from it may still not fit on their own
+        for snapshot in self._entries.values():
+            if size <= self.max_bytes:
+                break
+            size -= snapshot.forget(size - self.max_bytes)
+
+
+snapshot_cache = SnapshotCache(
+    max_entries=getattr(settings, "SNAPSHOT_CACHE_MAX_ENTRIES", 32),
+    max_bytes=getattr(settings, "SNAPSHOT_CACHE_MAX_BYTES", 64 * 1024 * 1024),
+    check_interval=getattr(settings, "SNAPSHOT_CACHE_CHECK_INTERVAL", 5),
+    history_size=getattr(settings, "SNAPSHOT_HISTORY_SIZE", 4),
+)
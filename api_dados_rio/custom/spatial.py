@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+"""
+Spatial queries over H3 snapshots.
+
+Hexagons are indexed by the centroid of their cell on a regular lat/lon grid, built once per
+snapshot version. Bounding-box and point-radius queries only look at the grid buckets they
+overlap and then check the centroids inside them.
+"""
+import math
+from typing import Dict, List, Optional, Set, Tuple
+
+from drf_yasg import openapi
+from rest_framework.request import Request
+
+from api_dados_rio.custom.geometry import get_centroid
+from api_dados_rio.custom.indexes import Query
+from api_dados_rio.custom.snapshots import Snapshot
+
+# Size, in degrees, of the grid buckets (about 1 km at Rio's latitude)
+GRID_SIZE = 0.01
+
+EARTH_RADIUS_M = 6371008.8
+
+# Meters per degree of latitude
+METERS_PER_DEGREE = math.pi * EARTH_RADIUS_M / 180
+
+SPATIAL_PARAMETERS = [
+    openapi.Parameter(
+        "bbox",
+        openapi.IN_QUERY,
+        description="Retorna apenas os hexágonos (H3) cujo centro está dentro do retângulo "
+        "informado, no formato minlon,minlat,maxlon,maxlat.",
+        type=openapi.TYPE_STRING,
+        required=False,
+    ),
+    openapi.Parameter(
+        "lat",
+        openapi.IN_QUERY,
+        description="Latitude do ponto central de uma busca por raio. Requer `lon` e `raio_m`.",
+        type=openapi.TYPE_NUMBER,
+        required=False,
+    ),
+    openapi.Parameter(
+        "lon",
+        openapi.IN_QUERY,
+        description="Longitude do ponto central de uma busca por raio. Requer `lat` e `raio_m`.",
+        type=openapi.TYPE_NUMBER,
+        required=False,
+    ),
+    openapi.Parameter(
+        "raio_m",
+        openapi.IN_QUERY,
+        description="Raio, em metros, de uma busca por raio. Retorna apenas os hexágonos (H3) "
+        "cujo centro está a essa distância do ponto informado. Requer `lat` e `lon`.",
+        type=openapi.TYPE_NUMBER,
+        required=False,
+    ),
+]
+
+
+def haversine(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Great-circle distance between two points, in meters"""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2
+    a += math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(math.sqrt(a))
+
+
+def _bucket(value: float) -> int:
+    return math.floor(value / GRID_SIZE)
+
+
+class SpatialIndex:
+    """Grid of the centroids of the hexagons of a snapshot"""
+
+    def __init__(self, snapshot: Snapshot):
+        self.centroids: Dict[int, Tuple[float, float]] = {}
+        self.grid: Dict[Tuple[int, int], List[int]] = {}
+        for position, item in enumerate(snapshot.data):
+            id_h3 = item.get("id_h3") if isinstance(item, dict) else None
+            if not id_h3:
+                continue
+            try:
+                lat, lon = get_centroid(str(id_h3))
+            except Exception:
+                continue
+            self.centroids[position] = (lat, lon)
+            self.grid.setdefault((_bucket(lon), _bucket(lat)), []).append(position)
+        if self.grid:
+            xs = [x for x, _ in self.grid]
+            ys = [y for _, y in self.grid]
+            self.extent = (min(xs), min(ys), max(xs), max(ys))
+        else:
+            self.extent = None
+
+    def _candidates(
+        self, minlon: float, minlat: float, maxlon: float, maxlat: float
+    ) -> List[int]:
+        """Positions in the grid buckets overlapping a bounding box"""
+        if self.extent is None:
+            return []
+        xmin, ymin, xmax, ymax = self.extent
+        candidates = []
+        for x in range(max(_bucket(minlon), xmin), min(_bucket(maxlon), xmax) + 1):
+            for y in range(max(_bucket(minlat), ymin), min(_bucket(maxlat), ymax) + 1):
+                candidates.extend(self.grid.get((x, y), ()))
+        return candidates
+
+    def query_bbox(
+        self, minlon: float, minlat: float, maxlon: float, maxlat: float
+    ) -> Set[int]:
+        """Positions of the hexagons whose centroid lies inside a bounding box"""
+        matches = set()
+        for position in self._candidates(minlon, minlat, maxlon, maxlat):
+            lat, lon = self.centroids[position]
+            if minlon <= lon <= maxlon and minlat <= lat <= maxlat:
+                matches.add(position)
+        return matches
+
+    def query_radius(self, lat: float, lon: float, radius_m: float) -> Set[int]:
+        """Positions of the hexagons whose centroid lies within a distance of a point"""
+        dlat = radius_m / METERS_PER_DEGREE
+        cos_lat = math.cos(math.radians(lat))
+        dlon = dlat / cos_lat if cos_lat > 1e-9 else 360.0
+        matches = set()
+        for position in self._candidates(
+            lon - dlon, lat - dlat, lon + dlon, lat + dlat
+        ):
+            if haversine(lat, lon, *self.centroids[position]) <= radius_m:
+                matches.add(position)
+        return matches
+
+
+def get_spatial_index(snapshot: Snapshot) -> SpatialIndex:
+    """Get the spatial index of a snapshot, building it once per version"""
+    return snapshot.derive("index.spatial", SpatialIndex)
+
+
+class BBoxQuery(Query):
+    """Hexagons whose centroid lies inside a bounding box"""
+
+    def __init__(self, minlon: float, minlat: float, maxlon: float, maxlat: float):
+        self.bbox = (minlon, minlat, maxlon, maxlat)
+
+    @property
+    def variant(self) -> str:
+        return "bbox=" + ",".join(repr(value) for value in self.bbox)
+
+    def match(self, snapshot: Snapshot) -> Set[int]:
+        return get_spatial_index(snapshot).query_bbox(*self.bbox)
+
+
+class RadiusQuery(Query):
+    """Hexagons whose centroid lies within a distance of a point"""
+
+    def __init__(self, lat: float, lon: float, radius_m: float):
+        self.lat = lat
+        self.lon = lon
+        self.radius_m = radius_m
+
+    @property
+    def variant(self) -> str:
+        return f"lat={self.lat!r}&lon={self.lon!r}&raio_m={self.radius_m!r}"
+
+    def match(self, snapshot: Snapshot) -> Set[int]:
+        return get_spatial_index(snapshot).query_radius(
+            self.lat, self.lon, self.radius_m
+        )
+
+
+def _parse_float(value: str) -> Optional[float]:
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    return value if math.isfinite(value) else None
+
+
+def get_spatial_queries(request: Request) -> List[Query]:
+    """
+    Read the spatial queries of a request.
+
+    Raises:
+        ValueError: If the parameters are malformed.
+    """
+    queries = []
+    bbox = request.query_params.get("bbox")
+    if bbox:
+        values = [_parse_float(value) for value in bbox.split(",")]
+        if len(values) != 4 or None in values:
+            raise ValueError(
+                'Parameter "bbox" must be formatted as minlon,minlat,maxlon,maxlat.'
+            )
+        minlon, minlat, maxlon, maxlat = values
+        if minlon > maxlon or minlat > maxlat:
+            raise ValueError(
+                'Parameter "bbox" must have minlon <= maxlon and minlat <= maxlat.'
+            )
+        queries.append(BBoxQuery(minlon, minlat, maxlon, maxlat))
+    params = [request.query_params.get(param) for param in ("lat", "lon", "raio_m")]
+    if any(params):
+        lat, lon, radius_m = [_parse_float(value) for value in params]
+        if lat is None or lon is None or radius_m is None:
+            raise ValueError(
+                'Parameters "lat", "lon" and "raio_m" must be given together as numbers.'
+            )
+        if not -90 <= lat <= 90 or not -180 <= lon <= 180 or radius_m <= 0:
+            raise ValueError(
+                'Parameters "lat" and "lon" must be valid coordinates and "raio_m" must be '
+                "greater than zero."
+            )
+        queries.append(RadiusQuery(lat, lon, radius_m))
+    return queries
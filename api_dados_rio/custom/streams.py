@@ -0,0 +1,433 @@
+# -*- coding: utf-8 -*-
+"""
+Server-Sent Events streams of dataset updates.
+
+Every worker process runs a single watcher per Redis target, shared by all of its open streams.
+The watcher listens to keyspace notifications on the update keys of every dataset (when the
+Redis server has them enabled) and also reads all of those keys with a single MGET every
+``STREAM_POLL_INTERVAL`` seconds, so updates are picked up either way. When a dataset changes,
+its event is rendered once and fanned out to the queue of each stream following it, so an open
+stream costs an idle connection rather than a poll.
+
+The streams are served by a plain ASGI application, since Django 4.1 can't stream responses
+asynchronously. As it bypasses Django's middleware, it sets the CORS headers configured for
+django-cors-headers itself, and caps the streams open in each worker, in total
+(``STREAM_MAX_CONNECTIONS``) and per client (``STREAM_MAX_CONNECTIONS_PER_CLIENT``), told apart
+like DRF's throttling does.
+"""
+import asyncio
+import logging
+import re
+from typing import Dict, List, Optional, Set, Tuple
+from urllib.parse import parse_qs
+
+from corsheaders.conf import conf as cors_conf
+from django.conf import settings
+from rest_framework.renderers import JSONRenderer
+
+from api_dados_rio.custom.datasets import Dataset, DatasetRegistry
+from api_dados_rio.custom.metrics import STREAMS_OPEN, STREAMS_REJECTED
+from api_dados_rio.custom.redis_pool import get_async_redis_client
+from api_dados_rio.custom.responses import format_last_update, render_json
+from api_dados_rio.custom.snapshots import Snapshot, SnapshotVersion
+from api_dados_rio.custom.viewsets import run_in_thread
+
+logger = logging.getLogger(__name__)
+
+# Name of the events sent when a dataset is updated
+EVENT_NAME = "atualizacao"
+
+
+def render_event(
+    dataset: Dataset, version: SnapshotVersion, snapshot: Snapshot = None
+) -> bytes:
+    """Render the event announcing a dataset version, with its payload if a snapshot is given"""
+    renderer = JSONRenderer()
+    parts = [
+        f"event: {EVENT_NAME}\ndata: ".encode(),
+        b'{"dataset":',
+        renderer.render(dataset.path),
+        b',"versao":',
+        renderer.render(version.version),
+        b',"ultima_atualizacao":',
+        renderer.render(format_last_update(version)),
+    ]
+    if snapshot is not None:
+        parts.extend([b',"dados":', snapshot.derive("json", render_json)])
+    parts.append(b"}\n\n")
+    return b"".join(parts)
+
+
+def get_header(scope, name: bytes) -> Optional[str]:
+    """Value of a request header, if it was sent"""
+    for key, value in scope.get("headers", []):
+        if key.lower() == name:
+            return value.decode("latin-1")
+    return None
+
+
+def get_client(scope) -> str:
+    """Identify the client of a request, the same way DRF's throttling does"""
+    forwarded_for = get_header(scope, b"x-forwarded-for")
+    if forwarded_for:
+        return "".join(forwarded_for.split())
+    client = scope.get("client")
+    return client[0] if client else ""
+
+
+def get_cors_headers(scope, preflight: bool = False) -> List[Tuple[bytes, bytes]]:
+    """Access-Control headers of a response, as django-cors-headers would set them"""
+    origin = get_header(scope, b"origin")
+    if origin is None:
+        return []
+    allowed = any(
+        [
+            cors_conf.CORS_ALLOW_ALL_ORIGINS,
+            origin in cors_conf.CORS_ALLOWED_ORIGINS,
+            *(
+                re.match(regex, origin)
+                for regex in cors_conf.CORS_ALLOWED_ORIGIN_REGEXES
+            ),
+        ]
+    )
+    if cors_conf.CORS_ALLOW_ALL_ORIGINS and not cors_conf.CORS_ALLOW_CREDENTIALS:
+        headers = [(b"access-control-allow-origin", b"*")]
+    elif allowed:
+        headers = [
+            (b"access-control-allow-origin", origin.encode("latin-1")),
+            (b"vary", b"origin"),
+        ]
+    else:
+        return []
+    if cors_conf.CORS_ALLOW_CREDENTIALS:
+        headers.append((b"access-control-allow-credentials", b"true"))
+    if preflight:
+        headers += [
+            (
+                b"access-control-allow-headers",
+                ", ".join(cors_conf.CORS_ALLOW_HEADERS).encode(),
+            ),
+            (
+                b"access-control-allow-methods",
+                ", ".join(cors_conf.CORS_ALLOW_METHODS).encode(),
+            ),
+        ]
+        if cors_conf.CORS_PREFLIGHT_MAX_AGE:
+            headers.append(
+                (
+                    b"access-control-max-age",
+                    str(cors_conf.CORS_PREFLIGHT_MAX_AGE).encode(),
+                )
+            )
+    elif cors_conf.CORS_EXPOSE_HEADERS:
+        headers.append(
+            (
+                b"access-control-expose-headers",
+                ", ".join(cors_conf.CORS_EXPOSE_HEADERS).encode(),
+            )
+        )
+    return headers
+
+
+class Subscriber:
+    """An open stream: the datasets it follows and the queue of events waiting to be sent"""
+
+    def __init__(self, datasets: List[Dataset], payload: bool, max_pending: int):
+        self.datasets = datasets
+        self.payload = payload
+        self.queue: "asyncio.Queue[Optional[bytes]]" = asyncio.Queue(max_pending + 1)
+        self.max_pending = max_pending
+
+    def push(self, event: bytes):
+        """
+        Queue an event. A stream that falls too far behind is closed (by queueing None), since
+        clients reconnect and get the current versions anyway.
+        """
+        if self.queue.qsize() < self.max_pending:
+            self.queue.put_nowait(event)
+            return
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.queue.put_nowait(None)
+
+
+class DatasetWatcher:
+    """Watches the update keys of every dataset and notifies subscribers of new versions"""
+
+    def __init__(self, registry: DatasetRegistry, poll_interval: float):
+        self.registry = registry
+        self.poll_interval = poll_interval
+        self._versions: Dict[Dataset, SnapshotVersion] = {}
+        self._subscribers: Set[Subscriber] = set()
+        self._tasks: List[asyncio.Task] = []
+        self._ready: Dict[str, asyncio.Event] = {}
+
+    def get_targets(self) -> Dict[str, List[Dataset]]:
+        targets: Dict[str, List[Dataset]] = {}
+        for dataset in self.registry.all():
+            targets.setdefault(dataset.target, []).append(dataset)
+        return targets
+
+    async def subscribe(self, subscriber: Subscriber):
+        """Add a subscriber, starting the watcher if needed, once versions are known"""
+        self._subscribers.add(subscriber)
+        if not self._tasks:
+            for target, datasets in self.get_targets().items():
+                self._ready[target] = asyncio.Event()
+                self._tasks.append(asyncio.ensure_future(self._watch(target, datasets)))
+        targets = {dataset.target for dataset in subscriber.datasets}
+        await asyncio.gather(*[self._ready[target].wait() for target in targets])
+
+    def unsubscribe(self, subscriber: Subscriber):
+        """Remove a subscriber, stopping the watcher when nobody is listening anymore"""
+        self._subscribers.discard(subscriber)
+        if not self._subscribers:
+            for task in self._tasks:
+                task.cancel()
+            self._tasks = []
+            self._versions.clear()
+
+    async def get_event(self, dataset: Dataset, payload: bool) -> Optional[bytes]:
+        """Render the event for the current version of a dataset, if it's known"""
+        version = self._versions.get(dataset)
+        if version is None or version.version is None:
+            return None
+        if payload:
+            try:
+                snapshot = await dataset.aget_snapshot()
+                if snapshot.version != version.version:
+                    # The snapshot cache hasn't noticed the new version yet
+                    snapshot = await dataset.aget_snapshot(check_interval=0)
+                dataset.validate(snapshot)
+                return await run_in_thread(
+                    snapshot.derive,
+                    f"event.{dataset.path}",
+                    lambda snapshot: render_event(dataset, snapshot, snapshot),
+                )
+            except Exception:
+                logger.exception("Failed to load the payload of %s", dataset)
+        return render_event(dataset, version)
+
+    async def _watch(self, target: str, datasets: List[Dataset]):
+        try:
+            client = get_async_redis_client(target)
+        except Exception:
+            logger.exception("Failed to connect to %s", target)
+            self._ready[target].set()
+            return
+        db = client.connection_pool.connection_kwargs.get("db", 0)
+        pubsub = client.pubsub()
+        try:
+            await pubsub.subscribe(
+                *[f"__keyspace@{db}__:{dataset.update_key}" for dataset in datasets]
+            )
+        except Exception:
+            logger.warning("Keyspace notifications unavailable on %s", target)
+            pubsub = None
+        try:
+            while True:
+                try:
+                    await self._check(client, datasets)
+                except Exception:
+                    logger.exception("Failed to check dataset versions on %s", target)
+                self._ready[target].set()
+                pubsub = await self._wait(pubsub)
+        finally:
+            if pubsub is not None:
+                await pubsub.reset()
+
+    async def _wait(self, pubsub):
+        """
+        Wait for a keyspace notification or for the poll interval to elapse. Returns the pubsub
+        connection to keep waiting on, which is dropped if it fails.
+        """
+        if pubsub is not None:
+            try:
+                await pubsub.get_message(
+                    ignore_subscribe_messages=True, timeout=self.poll_interval
+                )
+                return pubsub
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.warning("Lost keyspace notifications, polling only")
+                await pubsub.reset()
+        await asyncio.sleep(self.poll_interval)
+        return None
+
+    async def _check(self, client, datasets: List[Dataset]):
+        raw_updates = await client.mget([dataset.update_key for dataset in datasets])
+        changed = []
+        for dataset, raw_update in zip(datasets, raw_updates):
+            current = SnapshotVersion.from_raw_update(raw_update)
+            previous = self._versions.get(dataset)
+            self._versions[dataset] = current
+            if previous is not None and previous.version != current.version:
+                changed.append(dataset)
+        for dataset in changed:
+            await self._broadcast(dataset)
+
+    async def _broadcast(self, dataset: Dataset):
+        subscribers = [s for s in self._subscribers if dataset in s.datasets]
+        if not subscribers:
+            return
+        event = await self.get_event(dataset, payload=False)
+        payload_event = None
+        if any(subscriber.payload for subscriber in subscribers):
+            payload_event = await self.get_event(dataset, payload=True)
+        for subscriber in subscribers:
+            if subscriber.payload and payload_event is not None:
+                subscriber.push(payload_event)
+            elif event is not None:
+                subscriber.push(event)
+
+
+class StreamApplication:
+    """
+    ASGI application streaming dataset updates, e.g.
+    `GET /v2/stream/?datasets=precipitacao_15min,clima_radar/precipitacao_15min&dados=true`.
+
+    Datasets are given by name or, when a name is shared by several groups, by `group/name`.
+    Every stream starts with the current version of each dataset, followed by an event each
+    time one of them is updated. With `dados=true`, events also carry the new payload.
+    """
+
+    def __init__(self, registry: DatasetRegistry):
+        self.registry = registry
+        self.watcher = DatasetWatcher(
+            registry, getattr(settings, "STREAM_POLL_INTERVAL", 5)
+        )
+        self.heartbeat_interval = getattr(settings, "STREAM_HEARTBEAT_INTERVAL", 15)
+        self.max_pending = getattr(settings, "STREAM_MAX_PENDING_EVENTS", 32)
+        self.max_streams = getattr(settings, "STREAM_MAX_CONNECTIONS", 1000)
+        self.max_streams_per_client = getattr(
+            settings, "STREAM_MAX_CONNECTIONS_PER_CLIENT", 4
+        )
+        # Streams open in this worker, by client
+        self._streams: Dict[str, int] = {}
+
+    async def __call__(self, scope, receive, send):
+        assert scope["type"] == "http"
+        cors_headers = get_cors_headers(scope, preflight=scope["method"] == "OPTIONS")
+        if scope["method"] == "OPTIONS":
+            await self.send_response(send, 200, b"", cors_headers)
+            return
+        if scope["method"] != "GET":
+            await self.send_error(send, 405, "Method not allowed.", cors_headers)
+            return
+        params = parse_qs(scope["query_string"].decode())
+        names = [
+            name.strip()
+            for param in params.get("datasets", [])
+            for name in param.split(",")
+            if name.strip()
+        ]
+        try:
+            datasets = list(dict.fromkeys(self.registry.find(name) for name in names))
+        except KeyError as error:
+            await self.send_error(
+                send, 400, f"Unknown dataset: {error.args[0]}.", cors_headers
+            )
+            return
+        if not datasets:
+            await self.send_error(
+                send,
+                400,
+                'Parameter "datasets" must be a comma-separated list.',
+                cors_headers,
+            )
+            return
+        client = get_client(scope)
+        if sum(self._streams.values()) >= self.max_streams:
+            STREAMS_REJECTED.labels("worker").inc()
+            await self.send_error(
+                send, 503, "Too many open streams. Try again later.", cors_headers
+            )
+            return
+        if self._streams.get(client, 0) >= self.max_streams_per_client:
+            STREAMS_REJECTED.labels("client").inc()
+            logger.warning("Too many open streams from %s", client)
+            await self.send_error(
+                send, 429, "Too many open streams from this client.", cors_headers
+            )
+            return
+        payload = params.get("dados", [""])[-1].lower() in ("1", "true", "sim")
+        subscriber = Subscriber(datasets, payload, self.max_pending)
+        disconnected = asyncio.ensure_future(self.wait_disconnect(receive))
+        self._streams[client] = self._streams.get(client, 0) + 1
+        STREAMS_OPEN.inc()
+        try:
+            await self.watcher.subscribe(subscriber)
+            headers = [
+                (b"content-type", b"text/event-stream; charset=utf-8"),
+                (b"cache-control", b"no-cache"),
+                (b"x-accel-buffering", b"no"),
+                *cors_headers,
+            ]
+            await send(
+                {"type": "http.response.start", "status": 200, "headers": headers}
+            )
+            initial = [b"retry: 5000\n\n"]
+            for dataset in datasets:
+                event = await self.watcher.get_event(dataset, payload)
+                if event is not None:
+                    initial.append(event)
+            await self.send_body(send, b"".join(initial))
+            await self.stream(send, subscriber, disconnected)
+        finally:
+            self.watcher.unsubscribe(subscriber)
+            disconnected.cancel()
+            STREAMS_OPEN.dec()
+            self._streams[client] -= 1
+            if not self._streams[client]:
+                del self._streams[client]
+
+    async def stream(self, send, subscriber: Subscriber, disconnected: asyncio.Future):
+        """Send queued events, and heartbeats while idle, until the client goes away"""
+        while True:
+            event = asyncio.ensure_future(subscriber.queue.get())
+            done, _ = await asyncio.wait(
+                {event, disconnected},
+                timeout=self.heartbeat_interval,
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+            if disconnected in done:
+                event.cancel()
+                return
+            if event not in done:
+                event.cancel()
+                await self.send_body(send, b": ping\n\n")
+                continue
+            if event.result() is None:
+                await self.send_body(send, b"", more_body=False)
+                return
+            await self.send_body(send, event.result())
+
+    @staticmethod
+    async def wait_disconnect(receive):
+        while (await receive())["type"] != "http.disconnect":
+            pass
+
+    @staticmethod
+    async def send_body(send, body: bytes, more_body: bool = True):
+        await send({"type": "http.response.body", "body": body, "more_body": more_body})
+
+    @staticmethod
+    async def send_response(
+        send, status: int, body: bytes, headers: List[Tuple[bytes, bytes]]
+    ):
+        await send(
+            {"type": "http.response.start", "status": status, "headers": headers}
+        )
+        await send({"type": "http.response.body", "body": body})
+
+    @classmethod
+    async def send_error(
+        cls, send, status: int, error: str, headers: List[Tuple[bytes, bytes]] = None
+    ):
+        await cls.send_response(
+            send,
+            status,
+            JSONRenderer().render({"error": error}),
+            [(b"content-type", b"application/json"), *(headers or [])],
+        )
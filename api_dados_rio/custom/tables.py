@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+"""
+Typed tables built from lists of objects, backing the Apache Arrow and Parquet renderings of
+H3 snapshots (``?format=arrow`` and ``?format=parquet``). Like in the columnar representation,
+text fields taking only a few distinct values are dictionary-encoded.
+"""
+from typing import Any, List
+
+import pyarrow as pa
+from rest_framework.utils.encoders import JSONEncoder
+
+# A field is dictionary-encoded when it has at most this share of distinct values
+MAX_DICTIONARY_RATIO = 0.25
+
+
+def is_low_cardinality(values: List[Any]) -> bool:
+    """Whether a column takes few enough distinct values to be dictionary-encoded"""
+    return len(set(values)) <= max(1, len(values) * MAX_DICTIONARY_RATIO)
+
+
+def to_array(values: List[Any]) -> pa.Array:
+    """
+    Typed Arrow array for a column, with text columns of few distinct values
+    dictionary-encoded (they become categoricals in pandas). Columns mixing types that Arrow
+    can't reconcile are kept as JSON text.
+    """
+    try:
+        array = pa.array(values)
+    except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError):
+        encoder = JSONEncoder()
+        array = pa.array(
+            [
+                value
+                if value is None or isinstance(value, str)
+                else encoder.encode(value)
+                for value in values
+            ],
+            type=pa.string(),
+        )
+    if pa.types.is_string(array.type) and is_low_cardinality(array.to_pylist()):
+        array = array.dictionary_encode()
+    return array
+
+
+def to_table(items: List[dict]) -> pa.Table:
+    """Turn a list of objects into an Arrow table with one typed column per field"""
+    fields = list(dict.fromkeys(field for item in items for field in item))
+    return pa.table(
+        {field: to_array([item.get(field) for item in items]) for field in fields}
+    )
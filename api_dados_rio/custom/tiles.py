@@ -0,0 +1,246 @@
+# -*- coding: utf-8 -*-
+"""
+Mapbox Vector Tiles of H3 snapshots, e.g. `/v2/tiles/precipitacao_15min/12/1517/2323.mvt`.
+
+A tile holds the hexagons overlapping it in a single layer named after the dataset, with the
+fields of each item as feature properties. Hexagons are picked with the spatial index of the
+snapshot and projected to Web Mercator once per cell, by the geometry cache.
+
+Tiles are built on demand and kept in a per-worker LRU cache keyed by dataset version and tile
+coordinates (plus content-coding), bounded by ``TILE_CACHE_MAX_ENTRIES`` and
+``TILE_CACHE_MAX_BYTES``, so each tile is built once per version. They carry the same validators
+as the other representations of the dataset version, so nginx or a CDN can revalidate them.
+"""
+import math
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Tuple
+
+import h3
+import mapbox_vector_tile
+from django.conf import settings
+from django.http import HttpResponse
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+from rest_framework.throttling import ScopedRateThrottle
+from rest_framework.utils.encoders import JSONEncoder
+from rest_framework.viewsets import ViewSet
+from rest_framework_tracking.mixins import LoggingMixin
+from shapely.geometry import Polygon
+
+from api_dados_rio.custom.datasets import Dataset, DatasetRegistry
+from api_dados_rio.custom.fallback import set_staleness
+from api_dados_rio.custom.geometry import (
+    MERCATOR_ORIGIN_SHIFT,
+    from_mercator,
+    get_mercator_boundary,
+)
+from api_dados_rio.custom.renderers import (
+    MapboxVectorTileRenderer,
+    ProtobufTileRenderer,
+)
+from api_dados_rio.custom.responses import (
+    COMPRESSORS,
+    choose_encoding,
+    get_not_modified_response,
+    is_compressible,
+    set_validators,
+)
+from api_dados_rio.custom.snapshots import Snapshot
+from api_dados_rio.custom.spatial import METERS_PER_DEGREE, get_spatial_index
+from api_dados_rio.custom.viewsets import AsyncViewSetMixin, run_in_thread
+
+MAX_ZOOM = 22
+
+# Resolution of the tile grid, as in the MVT specification
+EXTENT = 4096
+
+
+class TileCache:
+    """LRU cache of rendered tiles, bounded in number and in total size"""
+
+    def __init__(self, max_entries: int, max_bytes: int):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[Hashable, bytes]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, build: Callable[[], bytes]) -> bytes:
+        """Get a tile, building it if it's not cached"""
+        with self._lock:
+            content = self._entries.get(key)
+            if content is not None:
+                self._entries.move_to_end(key)
+                return content
+        content = build()
+        with self._lock:
+            if key not in self._entries:
+                self._entries[key] = content
+                self._size += len(content)
+            self._entries.move_to_end(key)
+            while self._entries and (
+                len(self._entries) > self.max_entries or self._size > self.max_bytes
+            ):
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+        return content
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+
+tile_cache = TileCache(
+    max_entries=getattr(settings, "TILE_CACHE_MAX_ENTRIES", 4096),
+    max_bytes=getattr(settings, "TILE_CACHE_MAX_BYTES", 64 * 1024 * 1024),
+)
+
+
+def get_tile_bounds(z: int, x: int, y: int) -> Tuple[float, float, float, float]:
+    """Bounds of a tile in Web Mercator meters (minx, miny, maxx, maxy)"""
+    size = 2 * MERCATOR_ORIGIN_SHIFT / 2**z
+    minx = -MERCATOR_ORIGIN_SHIFT + x * size
+    maxy = MERCATOR_ORIGIN_SHIFT - y * size
+    return minx, maxy - size, minx + size, maxy
+
+
+def get_margin(snapshot: Snapshot) -> float:
+    """
+    Upper bound, in degrees of latitude, of the distance from the centroid of any hexagon of a
+    snapshot to its boundary. Hexagons whose centroid lies this far outside a tile may still
+    overlap it. Built once per version.
+    """
+    index = get_spatial_index(snapshot)
+    resolutions = {
+        h3.h3_get_resolution(str(snapshot.data[position]["id_h3"]))
+        for position in index.centroids
+    }
+    radius = max(
+        (h3.edge_length(resolution, unit="m") for resolution in resolutions),
+        default=0,
+    )
+    # Cells get distorted away from the center of their icosahedron face
+    return 1.5 * radius / METERS_PER_DEGREE
+
+
+def to_properties(item: dict) -> Dict[str, Any]:
+    """Feature properties of an item. MVT has no nulls, lists or objects."""
+    properties = {}
+    for field, value in item.items():
+        if value is None:
+            continue
+        if isinstance(value, (list, tuple, dict)):
+            value = JSONEncoder().encode(value)
+        elif not isinstance(value, (bool, int, float, str)):
+            value = str(value)
+        properties[field] = value
+    return properties
+
+
+def build_tile(dataset: Dataset, snapshot: Snapshot, z: int, x: int, y: int) -> bytes:
+    """Cut the hexagons of a snapshot overlapping a tile into a vector tile"""
+    bounds = get_tile_bounds(z, x, y)
+    minlon, minlat = from_mercator(bounds[0], bounds[1])
+    maxlon, maxlat = from_mercator(bounds[2], bounds[3])
+    dlat = snapshot.derive("tiles.margin", get_margin)
+    cos_lat = math.cos(math.radians(max(abs(minlat), abs(maxlat))))
+    dlon = dlat / cos_lat if cos_lat > 1e-9 else 360.0
+    positions = get_spatial_index(snapshot).query_bbox(
+        minlon - dlon, minlat - dlat, maxlon + dlon, maxlat + dlat
+    )
+    features = []
+    for position in sorted(positions):
+        item = snapshot.data[position]
+        features.append(
+            {
+                "geometry": Polygon(get_mercator_boundary(str(item["id_h3"]))),
+                "properties": to_properties(item),
+            }
+        )
+    return mapbox_vector_tile.encode(
+        [{"name": dataset.name, "features": features}],
+        default_options={"quantize_bounds": bounds, "extents": EXTENT},
+    )
+
+
+class TileViewSet(AsyncViewSetMixin, LoggingMixin, ViewSet):
+    """Serves vector tiles of the H3 datasets of a registry"""
+
+    registry: DatasetRegistry = None
+
+    # Tiles are only served as MVT, which is negotiated like any other format (so a request
+    # accepting something else gets a 406)
+    renderer_classes = [MapboxVectorTileRenderer, ProtobufTileRenderer]
+
+    # Maps fetch many tiles at once, so they get their own (looser) rate limit
+    throttle_classes = [ScopedRateThrottle]
+    throttle_scope = "tiles"
+
+    async def retrieve(self, request, dataset: str, z: str, x: str, y: str):
+        try:
+            dataset = self.registry.find(dataset)
+        except KeyError:
+            dataset = None
+        if dataset is None or not dataset.h3:
+            return Response({"error": "Unknown dataset."}, status=404)
+        z, x, y = int(z), int(x), int(y)
+        if z > MAX_ZOOM or x >= 2**z or y >= 2**z:
+            return Response({"error": "Invalid tile coordinates."}, status=400)
+        variant = f"tile={z}/{x}/{y}"
+        try:
+            version = await dataset.aget_version()
+            response = get_not_modified_response(request, version, variant)
+            if response is None:
+                snapshot = await dataset.aget_snapshot()
+                dataset.validate(snapshot)
+                version = snapshot
+                response = await run_in_thread(
+                    self.tile_response, request, dataset, snapshot, z, x, y
+                )
+                set_validators(response, request, snapshot, variant)
+            if version.version is not None:
+                response["X-Versao"] = version.version
+            return set_staleness(response, version.staleness)
+        except Exception:
+            return Response(
+                {"error": "Something went wrong. Try again later."},
+                status=500,
+            )
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if isinstance(response, Response):
+            # Only errors go through DRF's rendering, and they aren't tiles
+            response.accepted_renderer = JSONRenderer()
+            response.accepted_media_type = JSONRenderer.media_type
+        return response
+
+    @staticmethod
+    def tile_response(
+        request, dataset: Dataset, snapshot: Snapshot, z: int, x: int, y: int
+    ) -> HttpResponse:
+        """Respond with a tile, compressed with the best content-coding the client accepts"""
+        if snapshot.version is None:
+            # Without a version, there's nothing to key the cache on
+            content = build_tile(dataset, snapshot, z, x, y)
+            encoding = choose_encoding(request) if is_compressible(content) else None
+            if encoding:
+                content = COMPRESSORS[encoding](content)
+        else:
+            key = (dataset.path, snapshot.version, z, x, y)
+            content = tile_cache.get(
+                key, lambda: build_tile(dataset, snapshot, z, x, y)
+            )
+            encoding = choose_encoding(request) if is_compressible(content) else None
+            if encoding:
+                content = tile_cache.get(
+                    key + (encoding,), lambda: COMPRESSORS[encoding](content)
+                )
+        response = HttpResponse(
+            content, content_type=request.accepted_renderer.media_type
+        )
+        if encoding:
+            response["Content-Encoding"] = encoding
+        return response
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+"""
+Async ViewSets.
+
+DRF only dispatches requests synchronously, which under ASGI means every request of a worker is
+handled by the same thread. ViewSets using `AsyncViewSetMixin` are served as native Django async
+views instead: their handlers (e.g. `async def list`) run on the event loop, so they can wait on
+asyncio clients without holding a thread. The synchronous parts of DRF's request cycle
+(authentication, throttling, content negotiation and request logging) still run as usual, in
+the single thread Django keeps for synchronous code, so request logging reuses its database
+connection, which is closed at the end of each request like in any other view. CPU-heavy work
+of the handlers (rendering and compressing payloads) goes through `run_in_thread`, so it
+doesn't stall every other request of the worker.
+"""
+import asyncio
+import functools
+from typing import Any, Callable
+
+from asgiref.sync import sync_to_async
+
+
+async def run_in_thread(function: Callable[..., Any], *args, **kwargs) -> Any:
+    """
+    Run a CPU-heavy function in the thread pool, off the event loop. It must not touch the
+    database, as it may run on any thread.
+    """
+    return await sync_to_async(function, thread_sensitive=False)(*args, **kwargs)
+
+
+class AsyncViewSetMixin:
+    """Serve a ViewSet as a Django async view. Must come before DRF classes in the bases."""
+
+    @classmethod
+    def as_view(cls, actions=None, **initkwargs):
+        view = super().as_view(actions, **initkwargs)
+
+        async def async_view(request, *args, **kwargs):
+            return await view(request, *args, **kwargs)
+
+        # Keep the attributes DRF and drf-yasg read from the view (cls, actions, csrf_exempt...)
+        return functools.update_wrapper(async_view, view)
+
+    async def dispatch(self, request, *args, **kwargs):
+        """Same as `APIView.dispatch`, awaiting async handlers"""
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            await sync_to_async(self.initial)(request, *args, **kwargs)
+            if request.method.lower() in self.http_method_names:
+                handler = getattr(
+                    self, request.method.lower(), self.http_method_not_allowed
+                )
+            else:
+                handler = self.http_method_not_allowed
+            response = handler(request, *args, **kwargs)
+            if asyncio.iscoroutine(response):
+                response = await response
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = await sync_to_async(self.finalize_response)(
+            request, response, *args, **kwargs
+        )
+        return self.response
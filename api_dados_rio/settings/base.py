@@ -46,6 +46,8 @@ INSTALLED_APPS = [
     "rest_framework_tracking",
     "drf_yasg",
     "api_dados_rio.v1.cor.comando",
+    "api_dados_rio.v2.adm_cor_comando",
+    "api_dados_rio.v2.clima_pluviometro",
     "health_check",
     "health_check.db",
     "health_check.cache",
@@ -107,6 +109,101 @@ CACHES = {
 CACHE_TTL_SHORT = 60 * 5  # 5 minutes
 CACHE_TTL_LONG = 60 * 60 * 24  # 1 day
 
+# Redis connection pools used by the v2 data views (see api_dados_rio.custom.redis_pool)
+REDIS_POOL_MAX_CONNECTIONS = int(getenv("REDIS_POOL_MAX_CONNECTIONS", "10"))
+# Seconds to wait for a free connection when the pool is exhausted
+REDIS_POOL_TIMEOUT = float(getenv("REDIS_POOL_TIMEOUT", "2"))
+REDIS_SOCKET_TIMEOUT = float(getenv("REDIS_SOCKET_TIMEOUT", "2"))
+REDIS_SOCKET_CONNECT_TIMEOUT = float(getenv("REDIS_SOCKET_CONNECT_TIMEOUT", "2"))
+REDIS_HEALTH_CHECK_INTERVAL = int(getenv("REDIS_HEALTH_CHECK_INTERVAL", "30"))
+
+# In-process cache of dataset snapshots (see api_dados_rio.custom.snapshots). MAX_BYTES only
+# counts serialized bytes (pickled payloads and rendered/compressed representations), not decoded
+# payloads, indexes, column arrays or deltas, so workers use a multiple of it.
+SNAPSHOT_CACHE_CHECK_INTERVAL = float(getenv("SNAPSHOT_CACHE_CHECK_INTERVAL", "5"))
+SNAPSHOT_CACHE_MAX_ENTRIES = int(getenv("SNAPSHOT_CACHE_MAX_ENTRIES", "32"))
+SNAPSHOT_CACHE_MAX_BYTES = int(getenv("SNAPSHOT_CACHE_MAX_BYTES", "67108864"))  # 64 MiB
+SNAPSHOT_HISTORY_SIZE = int(getenv("SNAPSHOT_HISTORY_SIZE", "4"))
+
+# Last known good snapshots, served while Redis is unavailable (see
+# api_dados_rio.custom.fallback). Snapshots are also saved to LAST_KNOWN_GOOD_DIR, if set.
+LAST_KNOWN_GOOD_DIR = getenv("LAST_KNOWN_GOOD_DIR", "")
+
+# Circuit breakers around Redis and the COR Comando API (see api_dados_rio.custom.breakers)
+CIRCUIT_BREAKER_WINDOW = int(getenv("CIRCUIT_BREAKER_WINDOW", "20"))
+CIRCUIT_BREAKER_MIN_CALLS = int(getenv("CIRCUIT_BREAKER_MIN_CALLS", "5"))
+CIRCUIT_BREAKER_ERROR_RATE = float(getenv("CIRCUIT_BREAKER_ERROR_RATE", "0.5"))
+CIRCUIT_BREAKER_SLOW_CALL_RATE = float(getenv("CIRCUIT_BREAKER_SLOW_CALL_RATE", "0.5"))
+CIRCUIT_BREAKER_OPEN_DURATION = float(getenv("CIRCUIT_BREAKER_OPEN_DURATION", "30"))
+# Calls slower than these many seconds count towards the slow call rate
+REDIS_SLOW_CALL_DURATION = float(getenv("REDIS_SLOW_CALL_DURATION", "1"))
+COR_COMANDO_SLOW_CALL_DURATION = float(getenv("COR_COMANDO_SLOW_CALL_DURATION", "10"))
+
+# Prometheus metrics (see api_dados_rio.custom.metrics), only served to clients in these
+# networks (comma-separated CIDRs) or bearing METRICS_TOKEN
+METRICS_ALLOWED_NETWORKS = [
+    network.strip()
+    for network in getenv(
+        "METRICS_ALLOWED_NETWORKS",
+        "127.0.0.0/8,10.0.0.0/8,172.16.0.0/12,192.168.0.0/16",
+    ).split(",")
+    if network.strip()
+]
+METRICS_TOKEN = getenv("METRICS_TOKEN", "")
+
+# Token of the COR Comando API, shared through the cache (see api_dados_rio.custom.cor_comando).
+# Its lifetime is read from the token when it's a JWT, or assumed to be COR_COMANDO_TOKEN_TTL.
+COR_COMANDO_TOKEN_TTL = float(getenv("COR_COMANDO_TOKEN_TTL", "1800"))
+COR_COMANDO_TOKEN_REFRESH_MARGIN = float(
+    getenv("COR_COMANDO_TOKEN_REFRESH_MARGIN", "60")
+)
+COR_COMANDO_TOKEN_LOCK_TIMEOUT = float(getenv("COR_COMANDO_TOKEN_LOCK_TIMEOUT", "10"))
+
+# Pooled client of the COR Comando API (see api_dados_rio.custom.cor_comando). Timeouts are in
+# seconds; COR_COMANDO_DEADLINE bounds a request including all of its retries.
+COR_COMANDO_POOL_MAXSIZE = int(getenv("COR_COMANDO_POOL_MAXSIZE", "10"))
+COR_COMANDO_CONNECT_TIMEOUT = float(getenv("COR_COMANDO_CONNECT_TIMEOUT", "3"))
+COR_COMANDO_READ_TIMEOUT = float(getenv("COR_COMANDO_READ_TIMEOUT", "10"))
+COR_COMANDO_DEADLINE = float(getenv("COR_COMANDO_DEADLINE", "20"))
+COR_COMANDO_RETRIES = int(getenv("COR_COMANDO_RETRIES", "2"))
+COR_COMANDO_BACKOFF_FACTOR = float(getenv("COR_COMANDO_BACKOFF_FACTOR", "0.5"))
+
+# Coalescing of concurrent cache misses across workers (see api_dados_rio.custom.single_flight).
+# The lock lives, and waiters wait, SINGLE_FLIGHT_TIMEOUT seconds, so it must outlast the slowest
+# fetch. A call to comando's API ends by COR_COMANDO_DEADLINE; the default adds one attempt on top.
+SINGLE_FLIGHT_TIMEOUT = float(getenv("SINGLE_FLIGHT_TIMEOUT", "0")) or (
+    COR_COMANDO_DEADLINE + COR_COMANDO_CONNECT_TIMEOUT + COR_COMANDO_READ_TIMEOUT
+)
+SINGLE_FLIGHT_RESULT_TTL = int(getenv("SINGLE_FLIGHT_RESULT_TTL", "10"))
+
+# Background refresher of the COR Comando cache (`python manage.py refresh_cor_cache`). Keys are
+# refreshed every COR_REFRESH_RATIO of their TTL, up to COR_REFRESH_JITTER of that earlier.
+COR_REFRESH_RATIO = float(getenv("COR_REFRESH_RATIO", "0.8"))
+COR_REFRESH_JITTER = float(getenv("COR_REFRESH_JITTER", "0.1"))
+COR_REFRESH_CONCURRENCY = int(getenv("COR_REFRESH_CONCURRENCY", "4"))
+COR_REFRESH_RETRY_INTERVAL = float(getenv("COR_REFRESH_RETRY_INTERVAL", "30"))
+
+# Server-Sent Events streams of dataset updates (see api_dados_rio.custom.streams)
+STREAM_POLL_INTERVAL = float(getenv("STREAM_POLL_INTERVAL", "5"))
+STREAM_HEARTBEAT_INTERVAL = float(getenv("STREAM_HEARTBEAT_INTERVAL", "15"))
+STREAM_MAX_PENDING_EVENTS = int(getenv("STREAM_MAX_PENDING_EVENTS", "32"))
+# Streams each worker keeps open at most, in total and per client
+STREAM_MAX_CONNECTIONS = int(getenv("STREAM_MAX_CONNECTIONS", "1000"))
+STREAM_MAX_CONNECTIONS_PER_CLIENT = int(
+    getenv("STREAM_MAX_CONNECTIONS_PER_CLIENT", "4")
+)
+
+# In-process cache of vector tiles (see api_dados_rio.custom.tiles)
+TILE_CACHE_MAX_ENTRIES = int(getenv("TILE_CACHE_MAX_ENTRIES", "4096"))
+TILE_CACHE_MAX_BYTES = int(getenv("TILE_CACHE_MAX_BYTES", "67108864"))  # 64 MiB
+
+# Rolling history of 15-minute rainfall (see api_dados_rio.custom.history), in 15-minute slots.
+# When RAIN_HISTORY_DIR is set, `python manage.py record_rain_history` records it there, checking
+# for a new version every RAIN_HISTORY_POLL_INTERVAL seconds, and workers read it back.
+RAIN_HISTORY_SIZE = int(getenv("RAIN_HISTORY_SIZE", "384"))  # 96 hours
+RAIN_HISTORY_DIR = getenv("RAIN_HISTORY_DIR", LAST_KNOWN_GOOD_DIR)
+RAIN_HISTORY_POLL_INTERVAL = float(getenv("RAIN_HISTORY_POLL_INTERVAL", "60"))
+
 # Password validation
 # https://docs.djangoproject.com/en/4.1/ref/settings/#auth-password-validators
 
@@ -151,6 +248,11 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 # REST Framework
 # https://www.django-rest-framework.org/
 REST_FRAMEWORK = {
+    "DEFAULT_RENDERER_CLASSES": [
+        "rest_framework.renderers.JSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+        "api_dados_rio.custom.renderers.MessagePackRenderer",
+    ],
     "DEFAULT_PAGINATION_CLASS": "rest_framework.pagination.PageNumberPagination",
     "DEFAULT_PERMISSION_CLASSES": [
         "rest_framework.permissions.IsAuthenticatedOrReadOnly",
@@ -160,6 +262,7 @@ REST_FRAMEWORK = {
     ],
     "DEFAULT_THROTTLE_RATES": {
         "anon": "60/minute",
+        "tiles": "600/minute",
     },
     "PAGE_SIZE": 20,
 }
@@ -21,6 +21,7 @@ from drf_yasg import openapi
 from drf_yasg.views import get_schema_view
 from rest_framework import permissions
 
+from api_dados_rio.custom.metrics import metrics_view
 from api_dados_rio.custom.routers import IndexRouter
 from api_dados_rio.v1.urls import urlpatterns as v1_urlpatterns
 from api_dados_rio.v2.urls import urlpatterns as v2_urlpatterns
@@ -47,6 +48,7 @@ schema_view = get_schema_view(
 base_urlpatterns = [
     path("admin/", admin.site.urls),
     path("healthcheck/", include("health_check.urls")),
+    path("metrics/", metrics_view),
     path("v1/", include(v1_urlpatterns)),
     path("v2/", include(v2_urlpatterns)),
     path(
@@ -8,13 +8,12 @@ from django.core.cache.backends.base import DEFAULT_TIMEOUT
 from django.utils.decorators import method_decorator
 from drf_yasg import openapi
 from drf_yasg.utils import swagger_auto_schema
-import requests
-from requests.adapters import HTTPAdapter, Retry
 from rest_framework.request import Request
 from rest_framework.response import Response
 from rest_framework.viewsets import ViewSet
 from rest_framework_tracking.mixins import LoggingMixin
 
+from api_dados_rio.custom.cor_comando import get_url
 from api_dados_rio.v1 import (
     v1_deprecated,
     v1_deprecated_message,
@@ -36,35 +35,6 @@ class ResponseWithDeprecationHeaders(Response):
             self[header] = value
 
 
-def get_token():
-    """Get token to access comando's API"""
-    # Acessar username e password
-    host = getattr(settings, "API_URL_LOGIN")
-    username = getattr(settings, "API_USERNAME")
-    password = getattr(settings, "API_PASSWORD")
-    payload = {"username": username, "password": password}
-    return requests.post(host, json=payload).text
-
-
-def get_url(url, parameters: dict = None, token: str = None):  # pylint: disable=W0102
-    """Make request to comando's API"""
-    if not parameters:
-        parameters = {}
-    if not token:
-        token = get_token()
-    sess = requests.Session()
-    retries = Retry(total=5, backoff_factor=1.5)
-    sess.mount("http://", HTTPAdapter(max_retries=retries))
-    headers = {"Authorization": token}
-
-    try:
-        response = sess.get(url, json=parameters, headers=headers)
-        response = response.json()
-    except Exception as exc:
-        response = {"error": exc}
-    return response
-
-
 @method_decorator(
     name="list",
     decorator=swagger_auto_schema(
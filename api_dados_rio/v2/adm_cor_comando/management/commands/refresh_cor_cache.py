@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+"""
+Keeps the data cached by the adm_cor_comando endpoints warm, so requests never wait on comando's
+API: `python manage.py refresh_cor_cache`.
+
+Open eventos, today's eventos and the activities of every open evento are refreshed every
+``COR_REFRESH_RATIO`` of ``CACHE_TTL_SHORT``, and POPs every ``COR_REFRESH_RATIO`` of
+``CACHE_TTL_LONG``, so they're replaced before they expire. Each refresh is scheduled up to
+``COR_REFRESH_JITTER`` of its interval earlier, so refreshes don't line up, and the activities
+are fetched with at most ``COR_REFRESH_CONCURRENCY`` requests in flight. Failed refreshes are
+retried after ``COR_REFRESH_RETRY_INTERVAL`` seconds. Upstream load is then a steady rate that
+doesn't depend on traffic.
+
+Runs until it gets SIGTERM or SIGINT, or refreshes everything once with `--once` (e.g. from a
+CronJob).
+"""
+import logging
+import random
+import signal
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from time import monotonic
+from typing import Callable, Dict, List, NamedTuple
+
+import pendulum
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+
+from api_dados_rio.custom.cor_comando import get_url
+from api_dados_rio.v2.adm_cor_comando.views import (
+    CACHE_TTL_LONG,
+    CACHE_TTL_SHORT,
+    EVENTOS_DATE_FORMAT,
+    cache_eventos_abertos,
+    cache_eventos_by_date,
+    get_evento_date,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class Refresh(NamedTuple):
+    """A set of cache keys refreshed together, every `ttl` times the refresh ratio"""
+
+    name: str
+    run: Callable[["Command"], bool]
+    ttl: float
+
+
+def is_error(result) -> bool:
+    return isinstance(result, dict) and bool(result.get("error"))
+
+
+class Command(BaseCommand):
+    help = "Keep the COR Comando data cached by the adm_cor_comando endpoints warm"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Refresh everything once and exit.",
+        )
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=getattr(settings, "COR_REFRESH_CONCURRENCY", 4),
+            help="Maximum number of requests to comando's API in flight.",
+        )
+
+    def handle(self, *args, **options):
+        self.stopping = threading.Event()
+        refreshes = [
+            Refresh(
+                "eventos_abertos", Command.refresh_eventos_abertos, CACHE_TTL_SHORT
+            ),
+            Refresh("eventos", Command.refresh_eventos_today, CACHE_TTL_SHORT),
+            Refresh(
+                "atividades_evento", Command.refresh_atividades_evento, CACHE_TTL_SHORT
+            ),
+            Refresh("pops", Command.refresh_pops, CACHE_TTL_LONG),
+        ]
+        with ThreadPoolExecutor(max_workers=max(1, options["concurrency"])) as pool:
+            self.pool = pool
+            if options["once"]:
+                failed = [r.name for r in refreshes if not self.run_refresh(r)]
+                if failed:
+                    raise SystemExit(f"Failed to refresh: {', '.join(failed)}")
+                return
+            for signum in (signal.SIGTERM, signal.SIGINT):
+                signal.signal(signum, lambda *_: self.stopping.set())
+            self.run_forever(refreshes)
+
+    def run_forever(self, refreshes: List[Refresh]):
+        """Run each refresh whenever it's due, until stopped"""
+        ratio = getattr(settings, "COR_REFRESH_RATIO", 0.8)
+        jitter = getattr(settings, "COR_REFRESH_JITTER", 0.1)
+        retry_interval = getattr(settings, "COR_REFRESH_RETRY_INTERVAL", 30)
+        due_at: Dict[str, float] = {refresh.name: monotonic() for refresh in refreshes}
+        while not self.stopping.is_set():
+            for refresh in refreshes:
+                if due_at[refresh.name] > monotonic() or self.stopping.is_set():
+                    continue
+                if self.run_refresh(refresh):
+                    interval = refresh.ttl * ratio
+                    interval -= random.uniform(0, jitter * interval)
+                else:
+                    interval = retry_interval
+                due_at[refresh.name] = monotonic() + interval
+            self.stopping.wait(max(0, min(due_at.values()) - monotonic()))
+        logger.info("Stopped refreshing the COR cache")
+
+    def run_refresh(self, refresh: Refresh) -> bool:
+        """Run a refresh, logging its outcome"""
+        started_at = monotonic()
+        try:
+            succeeded = refresh.run(self)
+        except Exception:
+            logger.exception("Failed to refresh %s", refresh.name)
+            return False
+        if succeeded:
+            logger.info("Refreshed %s in %.2fs", refresh.name, monotonic() - started_at)
+        else:
+            logger.warning("Failed to refresh %s", refresh.name)
+        return succeeded
+
+    def refresh_eventos_abertos(self) -> bool:
+        result = get_url(getattr(settings, "API_URL_LIST_EVENTOS_ABERTOS"))
+        if is_error(result):
+            return False
+        cache_eventos_abertos(result)
+        return True
+
+    def refresh_eventos_today(self) -> bool:
+        """Refresh today's eventos, as fetched by `EventosView` for a single day"""
+        now = pendulum.now(tz=settings.TIME_ZONE)
+        today = datetime(now.year, now.month, now.day)
+        result = get_url(
+            getattr(settings, "API_URL_LIST_EVENTOS"),
+            parameters={
+                "inicio": today.strftime(EVENTOS_DATE_FORMAT),
+                "fim": (today + timedelta(days=1)).strftime(EVENTOS_DATE_FORMAT),
+            },
+        )
+        if is_error(result):
+            return False
+        # Today is cached even without eventos, so it's never a cache miss
+        eventos_by_date = {today: []}
+        for evento in result["eventos"]:
+            eventos_by_date.setdefault(get_evento_date(evento), []).append(evento)
+        cache_eventos_by_date(eventos_by_date)
+        return True
+
+    def refresh_atividades_evento(self) -> bool:
+        """Refresh the activities of every open evento, a few at a time"""
+        eventos_abertos = cache.get("eventos_abertos") or cache.get(
+            "eventos_abertos_backup"
+        )
+        if not eventos_abertos:
+            return False
+        base_url = getattr(settings, "API_URL_LIST_ATIVIDADES_EVENTOS")
+
+        def refresh(evento_id) -> bool:
+            if self.stopping.is_set():
+                return False
+            result = get_url(f"{base_url}?eventoId={evento_id}")
+            if is_error(result):
+                return False
+            cache.set(f"atividades_evento_{evento_id}", result, timeout=CACHE_TTL_SHORT)
+            return True
+
+        evento_ids = [evento["id"] for evento in eventos_abertos.get("eventos", [])]
+        return all(list(self.pool.map(refresh, evento_ids)))
+
+    def refresh_pops(self) -> bool:
+        result = get_url(getattr(settings, "API_URL_LIST_POPS"))
+        if is_error(result):
+            return False
+        cache.set("pops", result, timeout=CACHE_TTL_LONG)
+        return True
@@ -9,45 +9,53 @@ from django.utils.decorators import method_decorator
 from drf_yasg import openapi
 from drf_yasg.utils import swagger_auto_schema
 import pendulum
-import requests
-from requests.adapters import HTTPAdapter, Retry
 from rest_framework.request import Request
 from rest_framework.response import Response
 from rest_framework.viewsets import ViewSet
 from rest_framework_tracking.mixins import LoggingMixin
 
+from api_dados_rio.custom.cor_comando import get_url_once
+
 # Cache timeout
 CACHE_TTL_SHORT = getattr(settings, "CACHE_TTL_SHORT", DEFAULT_TIMEOUT)
 CACHE_TTL_LONG = getattr(settings, "CACHE_TTL_LONG", DEFAULT_TIMEOUT)
 
+# Date formats of comando's API and of the cache keys of each day of eventos
+EVENTOS_DATE_FORMAT = "%Y-%m-%d %H:%M:%S.0"
+EVENTOS_KEY_DATE_FORMAT = "%Y_%m_%d"
+
+
+def get_evento_date(evento: dict) -> datetime:
+    """Day an evento started at, at midnight"""
+    evento_date = datetime.strptime(evento["inicio"], EVENTOS_DATE_FORMAT)
+    return evento_date.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def get_eventos_key(date: datetime) -> str:
+    """Cache key of the eventos of a day"""
+    return f"eventos_{date.strftime(EVENTOS_KEY_DATE_FORMAT)}"
 
-def get_token():
-    """Get token to access comando's API"""
-    # Acessar username e password
-    host = getattr(settings, "API_URL_LOGIN")
-    username = getattr(settings, "API_USERNAME")
-    password = getattr(settings, "API_PASSWORD")
-    payload = {"username": username, "password": password}
-    return requests.post(host, json=payload).text
 
+def cache_eventos_by_date(eventos_by_date: Dict[datetime, List]):
+    """Cache the eventos of each day under its own key, in a single round trip"""
+    cache.set_many(
+        {
+            get_eventos_key(date): {"eventos": eventos}
+            for date, eventos in eventos_by_date.items()
+        },
+        timeout=CACHE_TTL_SHORT,
+    )
 
-def get_url(url, parameters: dict = None, token: str = None):  # pylint: disable=W0102
-    """Make request to comando's API"""
-    if not parameters:
-        parameters = {}
-    if not token:
-        token = get_token()
-    sess = requests.Session()
-    retries = Retry(total=5, backoff_factor=1.5)
-    sess.mount("http://", HTTPAdapter(max_retries=retries))
-    headers = {"Authorization": token}
 
-    try:
-        response = sess.get(url, json=parameters, headers=headers)
-        response = response.json()
-    except Exception as exc:
-        response = {"error": exc}
-    return response
+def cache_eventos_abertos(result: dict):
+    """Cache the open eventos, along with the backup served when comando's API fails"""
+    cache.set("eventos_abertos", result, timeout=CACHE_TTL_SHORT)
+    cache.set("eventos_abertos_backup", result, timeout=None)
+    cache.set(
+        "eventos_abertos_backup_last_updated",
+        pendulum.now(tz=settings.TIME_ZONE).strftime("%Y-%m-%d %H:%M:%S"),
+        timeout=None,
+    )
 
 
 @method_decorator(
@@ -84,7 +92,7 @@ class PopsView(LoggingMixin, ViewSet):
             pops = cache.get(key)
             return Response(pops, status=200)
         try:
-            result = get_url(url)
+            result = get_url_once(key, url)
             if "error" in result and result["error"]:
                 return Response(
                     {
@@ -151,7 +159,7 @@ class EventosAbertosView(LoggingMixin, ViewSet):
             pops = cache.get(key)
             return Response(pops, status=200)
         try:
-            result = get_url(url)
+            result = get_url_once(key, url)
             if "error" in result and result["error"]:
                 if key_backup in cache:
                     result = cache.get(key_backup)
@@ -165,13 +173,7 @@ class EventosAbertosView(LoggingMixin, ViewSet):
                     },
                     status=502,
                 )
-            cache.set(key, result, timeout=CACHE_TTL_SHORT)
-            cache.set(key_backup, result, timeout=None)
-            cache.set(
-                key_backup_last_updated,
-                pendulum.now(tz=settings.TIME_ZONE).strftime("%Y-%m-%d %H:%M:%S"),
-                timeout=None,
-            )
+            cache_eventos_abertos(result)
             return Response(result, status=200)
         except Exception:
             if key_backup in cache:
@@ -241,8 +243,8 @@ class EventosAbertosView(LoggingMixin, ViewSet):
 class EventosView(LoggingMixin, ViewSet):
     def list(self, request: Request):
         # Set some date formats we're going to use
-        date_format = "%Y-%m-%d %H:%M:%S.0"
-        redis_date_format = "%Y_%m_%d"
+        date_format = EVENTOS_DATE_FORMAT
+        redis_date_format = EVENTOS_KEY_DATE_FORMAT
         # These are base stuff we wanna use for fetching data
         base_key = "eventos"
         url = getattr(settings, "API_URL_LIST_EVENTOS")
@@ -293,18 +295,19 @@ class EventosView(LoggingMixin, ViewSet):
         # Keep track of the minimum and maximum dates we're fetching data for
         min_date = None
         max_date = None
-        from_cache = []
+        from_cache = set()
         results = {"eventos": []}
+        # Get every date we have in cache at once
+        keys = {date: get_eventos_key(date) for date in dates}
+        cached = cache.get_many(list(keys.values()))
         # Loop through dates and check if we have data in cache
         for date in dates:
-            key = f"{base_key}_{date.strftime(redis_date_format)}"
+            result = cached.get(keys[date])
             # If we find it in cache, add it to the results and continue
-            if key in cache:
-                result = cache.get(key)
-                if result and "eventos" in result:
-                    results["eventos"].extend(result["eventos"])
-                    from_cache.append(date)
-                    continue
+            if result and "eventos" in result:
+                results["eventos"].extend(result["eventos"])
+                from_cache.add(date)
+                continue
             # We're not in cache, save the date to use as a parameter
             if min_date is None or date < min_date:
                 min_date = date
@@ -321,7 +324,15 @@ class EventosView(LoggingMixin, ViewSet):
             "fim": max_date.strftime(date_format),
         }
         try:
-            result = get_url(url, parameters=date_range)
+            # Concurrent requests missing the same days share a single upstream call
+            range_key = "_".join(
+                [
+                    base_key,
+                    min_date.strftime(redis_date_format),
+                    max_date.strftime(redis_date_format),
+                ]
+            )
+            result = get_url_once(range_key, url, parameters=date_range)
             # If something happened, just return a 500
             if "error" in result and result["error"]:
                 return Response(
@@ -331,26 +342,18 @@ class EventosView(LoggingMixin, ViewSet):
                     status=502,
                 )
             # Now we need to check for overlaps in data (and also cache it)
-            cache_dates: Dict[str, List] = {}
+            cache_dates: Dict[datetime, List] = {}
             for evento in result["eventos"]:
-                # Parse the date
-                evento_date = datetime.strptime(evento["inicio"], date_format)
-                # Reset to midnight
-                evento_date = evento_date.replace(
-                    hour=0, minute=0, second=0, microsecond=0
-                )
+                # Parse the date, reset to midnight
+                evento_date = get_evento_date(evento)
                 # If this date is not in `from_cache`, add it to the results
                 if evento_date not in from_cache:
                     results["eventos"].append(evento)
                 # Now we split dates into cache_dates keys and append the evento to the list
                 # in the cache_dates key
-                if evento_date not in cache_dates:
-                    cache_dates[evento_date] = []
-                cache_dates[evento_date].append(evento)
-            # Finally we loop through cache_dates and cache the data
-            for date, eventos in cache_dates.items():
-                key = f"{base_key}_{date.strftime(redis_date_format)}"
-                cache.set(key, {"eventos": eventos}, timeout=CACHE_TTL_SHORT)
+                cache_dates.setdefault(evento_date, []).append(evento)
+            # Finally we cache the data of each date
+            cache_eventos_by_date(cache_dates)
             return Response(results, status=200)
         except Exception:
             return Response(
@@ -409,7 +412,7 @@ class AtividadesEventoView(LoggingMixin, ViewSet):
             atividades = cache.get(key)
             return Response(atividades, status=200)
         try:
-            result = get_url(url)
+            result = get_url_once(key, url)
             if "error" in result and result["error"]:
                 return Response(
                     {
@@ -473,7 +476,7 @@ class AtividadesPopView(LoggingMixin, ViewSet):
             atividades = cache.get(key)
             return Response(atividades, status=200)
         try:
-            result = get_url(url)
+            result = get_url_once(key, url)
             if "error" in result and result["error"]:
                 return Response(
                     {
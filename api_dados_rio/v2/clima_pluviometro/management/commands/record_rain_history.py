@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""
+Single writer of the rolling rain history served by the clima_pluviometro endpoints:
+`python manage.py record_rain_history`.
+
+The update key of the 15-minute rain gauge dataset is checked every
+``RAIN_HISTORY_POLL_INTERVAL`` seconds, and every new version published is recorded in the
+history and saved to ``RAIN_HISTORY_DIR``, where workers read it back from. The history then
+doesn't depend on which versions each worker happened to read, and is written by one process
+only.
+
+Runs until it gets SIGTERM or SIGINT, or records the current version once with `--once` (e.g.
+from a CronJob).
+"""
+import logging
+import signal
+import threading
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from api_dados_rio.v2.datasets import DATASETS, RAIN_HISTORY
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = "Record every version of the 15-minute rain gauge data in the rain history"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Record the current version once and exit.",
+        )
+
+    def handle(self, *args, **options):
+        if not RAIN_HISTORY.directory:
+            raise CommandError(
+                "RAIN_HISTORY_DIR must be set to share the rain history."
+            )
+        self.dataset = next(
+            dataset for dataset in DATASETS.all() if dataset.history is RAIN_HISTORY
+        )
+        if options["once"]:
+            if not self.record():
+                raise SystemExit("Failed to record the rain history")
+            return
+        self.stopping = threading.Event()
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(signum, lambda *_: self.stopping.set())
+        interval = getattr(settings, "RAIN_HISTORY_POLL_INTERVAL", 60)
+        while not self.stopping.is_set():
+            self.record()
+            self.stopping.wait(interval)
+        logger.info("Stopped recording the rain history")
+
+    def record(self) -> bool:
+        """Record the current version, if it's new, and save the history"""
+        try:
+            snapshot = self.dataset.get_snapshot(check_interval=0)
+            if not self.dataset.is_valid(snapshot):
+                logger.warning("Not recording an invalid %s snapshot", self.dataset)
+                return False
+            if RAIN_HISTORY.observe(snapshot):
+                RAIN_HISTORY.save()
+                logger.info("Recorded version %s of %s", snapshot.version, self.dataset)
+        except Exception:
+            logger.exception("Failed to record the rain history")
+            return False
+        return True
@@ -1,263 +1,108 @@
 # -*- coding: utf-8 -*-
 # flake8: noqa: E501
-from os import getenv
-
 from django.utils.decorators import method_decorator
+from drf_yasg import openapi
 from drf_yasg.utils import swagger_auto_schema
-from redis_pal import RedisPal
 from rest_framework.response import Response
 from rest_framework.viewsets import ViewSet
 from rest_framework_tracking.mixins import LoggingMixin
 
-
-# Views for last 15 min
-@method_decorator(
-    name="list",
-    decorator=swagger_auto_schema(
-        operation_summary="Retorna a quantidade de chuva precipitada em cada hexágono (H3) nos últimos 15 minutos",
-        operation_description="""
-        **Resultado**: Retorna uma lista contendo todos os hexágonos (H3) com a quantidade de chuva
-        precipitada para os últimos 15 minutos, em milímetros (mm):
-
-        ```json
-        [
-            {
-                "id_h3": "88a8a03989fffff",
-                "bairro": "Guaratiba",
-                "chuva_15min": 0.0,
-                "estacoes": null,
-                "status": "sem chuva",
-                "color": "#ffffff"
-            },
-            ...
-        ]
-        ```
-
-        **Política de cache**: O resultado é armazenado em cache por um período de 5 minutos.
-        """,
-    ),
+from api_dados_rio.custom.fallback import set_staleness
+from api_dados_rio.custom.history import parse_window, slot_time
+from api_dados_rio.custom.responses import batch_snapshot_response
+from api_dados_rio.custom.snapshots import Snapshot
+from api_dados_rio.custom.viewsets import AsyncViewSetMixin, run_in_thread
+from api_dados_rio.v2.datasets import DATASETS, RAIN_HISTORY
+
+# Rain gauge datasets by time window, used by the batched view
+RAIN_WINDOWS = {
+    dataset.name.replace("precipitacao_", "", 1): dataset
+    for dataset in DATASETS.get_group("clima_pluviometro")
+}
+
+# Rain gauge dataset feeding the rolling history
+RAIN_HISTORY_DATASET = next(
+    dataset for dataset in RAIN_WINDOWS.values() if dataset.history is RAIN_HISTORY
 )
-class Last15MinRainView(LoggingMixin, ViewSet):
-    def list(self, request):
-        data_key = "data_last_15min_rain"
-        try:
-            redis_url = getenv("REDIS_URL")
-            assert redis_url is not None
-            redis = RedisPal.from_url(redis_url)
-            # Get data and set cache
-            data = redis.get(data_key)
-            assert data is not None
-            assert isinstance(data, list)
-            assert len(data) > 0
-            return Response(data)
-        except Exception:
-            return Response(
-                {"error": "Something went wrong. Try again later."},
-                status=500,
-            )
 
 
+# Batched view for multiple windows
 @method_decorator(
     name="list",
     decorator=swagger_auto_schema(
-        operation_summary="Retorna o horário de atualização dos dados de chuva dos últimos 15 minutos",
+        operation_summary="Retorna a quantidade de chuva precipitada em cada hexágono (H3) para várias janelas de tempo de uma só vez",
         operation_description="""
-        **Resultado**: Retorna um texto contendo o horário de atualização dos dados de chuva:
-
-        ```
-        ""
-        ```
-
-        **Política de cache**: O resultado é armazenado em cache por um período de 5 minutos.
-        """,
-    ),
-)
-class LastUpdateRainView(LoggingMixin, ViewSet):
-    def list(self, request):
-        last_update_key = "data_last_15min_rain_update"
-        try:
-            redis_url = getenv("REDIS_URL")
-            assert redis_url is not None
-            redis = RedisPal.from_url(redis_url)
-            data = redis.get(last_update_key)
-            assert data is not None
-            assert isinstance(data, list)
-            assert len(data) > 0
-            result = data[0]
-            assert "last_update" in result
-            last_update = result["last_update"]
-            last_update_str = last_update.strftime("%d/%m/%Y %H:%M:%S")
-            return Response(last_update_str)
-        except Exception:
-            return Response(
-                {"error": "Something went wrong. Try again later."},
-                status=500,
-            )
-
-
-# Views for last 120 min
-@method_decorator(
-    name="list",
-    decorator=swagger_auto_schema(
-        operation_summary="Retorna a quantidade de chuva precipitada em cada hexágono (H3) nos últimos 120 minutos",
-        operation_description="""
-        **Resultado**: Retorna uma lista contendo todos os hexágonos (H3) com a quantidade de chuva
-        precipitada para os últimos 120 minutos, em milímetros (mm):
+        **Resultado**: Retorna um objeto contendo, para cada janela de tempo solicitada, o horário
+        de atualização dos dados e a lista de todos os hexágonos (H3) com a quantidade de chuva
+        precipitada nessa janela, em milímetros (mm):
 
         ```json
-        [
-            {
-                "id_h3": "88a8a03989fffff",
-                "bairro": "Guaratiba",
-                "quantidade": 0.0,
-                "estacoes": null,
-                "status": "sem chuva",
-                "color": "#ffffff"
+        {
+            "15min": {
+                "ultima_atualizacao": "18/10/2022 12:00:00",
+                "dados": [
+                    {
+                        "id_h3": "88a8a03989fffff",
+                        "bairro": "Guaratiba",
+                        "quantidade": 0.0,
+                        "estacoes": null,
+                        "status": "sem chuva",
+                        "color": "#ffffff"
+                    },
+                    ...
+                ]
             },
             ...
-        ]
-        ```
-
-        **Política de cache**: O resultado é armazenado em cache por um período de 5 minutos.
-        """,
-    ),
-)
-class Last120MinRainView(LoggingMixin, ViewSet):
-    def list(self, request):
-        data_key = "data_last_120min_rain"
-        try:
-            redis_url = getenv("REDIS_URL")
-            assert redis_url is not None
-            redis = RedisPal.from_url(redis_url)
-            # Get data and set cache
-            data = redis.get(data_key)
-            assert data is not None
-            assert isinstance(data, list)
-            assert len(data) > 0
-            return Response(data)
-        except Exception:
-            return Response(
-                {"error": "Something went wrong. Try again later."},
-                status=500,
-            )
-
-
-@method_decorator(
-    name="list",
-    decorator=swagger_auto_schema(
-        operation_summary="Retorna o horário de atualização dos dados de chuva dos últimos 120 minutos",
-        operation_description="""
-        **Resultado**: Retorna um texto contendo o horário de atualização dos dados de chuva:
-
-        ```
-        ""
+        }
         ```
 
         **Política de cache**: O resultado é armazenado em cache por um período de 5 minutos.
         """,
+        manual_parameters=[
+            openapi.Parameter(
+                "janelas",
+                openapi.IN_QUERY,
+                description="Lista de janelas de tempo separadas por vírgula (ex.: 15min,3h,24h). Valores possíveis: "
+                + ", ".join(RAIN_WINDOWS)
+                + ". Se omitido, retorna todas as janelas.",
+                type=openapi.TYPE_STRING,
+                required=False,
+            ),
+        ],
     ),
 )
-class LastUpdate120MinRainView(LoggingMixin, ViewSet):
-    def list(self, request):
-        last_update_key = "data_last_120min_rain_update"
-        try:
-            redis_url = getenv("REDIS_URL")
-            assert redis_url is not None
-            redis = RedisPal.from_url(redis_url)
-            data = redis.get(last_update_key)
-            assert data is not None
-            assert isinstance(data, list)
-            assert len(data) > 0
-            result = data[0]
-            assert "last_update" in result
-            last_update = result["last_update"]
-            last_update_str = last_update.strftime("%d/%m/%Y %H:%M:%S")
-            return Response(last_update_str)
-        except Exception:
+class RainView(AsyncViewSetMixin, LoggingMixin, ViewSet):
+    async def list(self, request):
+        janelas = request.query_params.get("janelas")
+        if janelas:
+            janelas = [
+                janela.strip() for janela in janelas.split(",") if janela.strip()
+            ]
+        else:
+            janelas = list(RAIN_WINDOWS)
+        if not janelas or any(janela not in RAIN_WINDOWS for janela in janelas):
             return Response(
-                {"error": "Something went wrong. Try again later."},
-                status=500,
+                {
+                    "error": f'Parameter "janelas" must be a comma-separated list of: {", ".join(RAIN_WINDOWS)}.'
+                },
+                status=400,
             )
-
-
-# Views for last 30 min
-@method_decorator(
-    name="list",
-    decorator=swagger_auto_schema(
-        operation_summary="Retorna a quantidade de chuva precipitada em cada hexágono (H3) nos últimos 30 minutos",
-        operation_description="""
-        **Resultado**: Retorna uma lista contendo todos os hexágonos (H3) com a quantidade de chuva
-        precipitada para os últimos 30 minutos, em milímetros (mm):
-
-        ```json
-        [
-            {
-                "id_h3": "88a8a03989fffff",
-                "bairro": "Guaratiba",
-                "quantidade": 0.0,
-                "estacoes": null,
-                "status": "sem chuva",
-                "color": "#ffffff"
-            },
-            ...
-        ]
-        ```
-
-        **Política de cache**: O resultado é armazenado em cache por um período de 5 minutos.
-        """,
-    ),
-)
-class Last30MinRainView(LoggingMixin, ViewSet):
-    def list(self, request):
-        data_key = "data_last_30min_rain"
+        # Remove duplicates and sort, so every ordering shares the same cached body
+        janelas = [janela for janela in RAIN_WINDOWS if janela in janelas]
         try:
-            redis_url = getenv("REDIS_URL")
-            assert redis_url is not None
-            redis = RedisPal.from_url(redis_url)
-            # Get data and set cache
-            data = redis.get(data_key)
-            assert data is not None
-            assert isinstance(data, list)
-            assert len(data) > 0
-            return Response(data)
-        except Exception:
-            return Response(
-                {"error": "Something went wrong. Try again later."},
-                status=500,
+            datasets = [RAIN_WINDOWS[janela] for janela in janelas]
+            snapshots = await DATASETS.aget_snapshots(datasets)
+            for dataset, snapshot in zip(datasets, snapshots):
+                dataset.validate(snapshot)
+            stalenesses = [
+                snapshot.staleness
+                for snapshot in snapshots
+                if snapshot.staleness is not None
+            ]
+            response = await run_in_thread(
+                batch_snapshot_response, request, dict(zip(janelas, snapshots))
             )
-
-
-@method_decorator(
-    name="list",
-    decorator=swagger_auto_schema(
-        operation_summary="Retorna o horário de atualização dos dados de chuva dos últimos 30 minutos",
-        operation_description="""
-        **Resultado**: Retorna um texto contendo o horário de atualização dos dados de chuva:
-
-        ```
-        ""
-        ```
-
-        **Política de cache**: O resultado é armazenado em cache por um período de 5 minutos.
-        """,
-    ),
-)
-class LastUpdate30MinRainView(LoggingMixin, ViewSet):
-    def list(self, request):
-        last_update_key = "data_last_30min_rain_update"
-        try:
-            redis_url = getenv("REDIS_URL")
-            assert redis_url is not None
-            redis = RedisPal.from_url(redis_url)
-            data = redis.get(last_update_key)
-            assert data is not None
-            assert isinstance(data, list)
-            assert len(data) > 0
-            result = data[0]
-            assert "last_update" in result
-            last_update = result["last_update"]
-            last_update_str = last_update.strftime("%d/%m/%Y %H:%M:%S")
-            return Response(last_update_str)
+            return set_staleness(response, max(stalenesses, default=None))
         except Exception:
             return Response(
                 {"error": "Something went wrong. Try again later."},
@@ -265,216 +110,87 @@ class LastUpdate30MinRainView(LoggingMixin, ViewSet):
             )
 
 
-# Views for last 60 min
-@method_decorator(
-    name="list",
-    decorator=swagger_auto_schema(
-        operation_summary="Retorna a quantidade de chuva precipitada em cada hexágono (H3) nos últimos 60 minutos",
-        operation_description="""
-        **Resultado**: Retorna uma lista contendo todos os hexágonos (H3) com a quantidade de chuva
-        precipitada para os últimos 60 minutos, em milímetros (mm):
+def get_history_slots(request) -> int:
+    """
+    Number of 15-minute slots of the `janela` query parameter (15 minutes if omitted).
 
-        ```json
-        [
-            {
-                "id_h3": "88a8a03989fffff",
-                "bairro": "Guaratiba",
-                "quantidade": 0.0,
-                "estacoes": null,
-                "status": "sem chuva",
-                "color": "#ffffff"
-            },
-            ...
-        ]
-        ```
+    Raises:
+        ValueError: If the window is invalid.
+    """
+    return parse_window(request.query_params.get("janela", "15min"), RAIN_HISTORY.size)
 
-        **Política de cache**: O resultado é armazenado em cache por um período de 5 minutos.
-        """,
-    ),
-)
-class Last60MinRainView(LoggingMixin, ViewSet):
-    def list(self, request):
-        data_key = "data_last_60min_rain"
-        try:
-            redis_url = getenv("REDIS_URL")
-            assert redis_url is not None
-            redis = RedisPal.from_url(redis_url)
-            # Get data and set cache
-            data = redis.get(data_key)
-            assert data is not None
-            assert isinstance(data, list)
-            assert len(data) > 0
-            return Response(data)
-        except Exception:
-            return Response(
-                {"error": "Something went wrong. Try again later."},
-                status=500,
-            )
-
-
-@method_decorator(
-    name="list",
-    decorator=swagger_auto_schema(
-        operation_summary="Retorna o horário de atualização dos dados de chuva dos últimos 60 minutos",
-        operation_description="""
-        **Resultado**: Retorna um texto contendo o horário de atualização dos dados de chuva:
 
-        ```
-        ""
-        ```
-
-        **Política de cache**: O resultado é armazenado em cache por um período de 5 minutos.
-        """,
-    ),
-)
-class LastUpdate60MinRainView(LoggingMixin, ViewSet):
-    def list(self, request):
-        last_update_key = "data_last_60min_rain_update"
-        try:
-            redis_url = getenv("REDIS_URL")
-            assert redis_url is not None
-            redis = RedisPal.from_url(redis_url)
-            data = redis.get(last_update_key)
-            assert data is not None
-            assert isinstance(data, list)
-            assert len(data) > 0
-            result = data[0]
-            assert "last_update" in result
-            last_update = result["last_update"]
-            last_update_str = last_update.strftime("%d/%m/%Y %H:%M:%S")
-            return Response(last_update_str)
-        except Exception:
-            return Response(
-                {"error": "Something went wrong. Try again later."},
-                status=500,
-            )
+async def refresh_history() -> Snapshot:
+    """
+    Bring the history up to date, returning the latest 15-minute snapshot served: read back
+    what the writer saved or, without a directory to share it, record the snapshot here
+    """
+    snapshot = await RAIN_HISTORY_DATASET.aget_snapshot()
+    if RAIN_HISTORY.directory:
+        await run_in_thread(RAIN_HISTORY.reload)
+    elif RAIN_HISTORY_DATASET.is_valid(snapshot):
+        await run_in_thread(RAIN_HISTORY.observe, snapshot)
+    return snapshot
 
 
-# Views for last 3h
+# Rainfall over arbitrary windows
 @method_decorator(
     name="list",
     decorator=swagger_auto_schema(
-        operation_summary="Retorna a quantidade de chuva precipitada em cada hexágono (H3) nas últimas 3 horas",
+        operation_summary="Retorna a quantidade de chuva precipitada em cada hexágono (H3) em uma janela de tempo qualquer",
         operation_description="""
-        **Resultado**: Retorna uma lista contendo todos os hexágonos (H3) com a quantidade de chuva
-        precipitada para as últimas 3 horas, em milímetros (mm):
+        **Resultado**: Retorna a quantidade de chuva precipitada em cada hexágono (H3) na janela
+        de tempo solicitada, em milímetros (mm), somando os dados de 15 minutos acumulados pela
+        API. `cobertura` é a fração da janela para a qual há dados de 15 minutos:
 
         ```json
-        [
-            {
-                "id_h3": "88a8a03989fffff",
-                "bairro": "Guaratiba",
-                "quantidade": 0.0,
-                "estacoes": null,
-                "status": "sem chuva",
-                "color": "#ffffff"
-            },
-            ...
-        ]
+        {
+            "janela": "45min",
+            "inicio": "2022-10-18T11:15:00-03:00",
+            "fim": "2022-10-18T12:00:00-03:00",
+            "cobertura": 1.0,
+            "dados": [
+                {
+                    "id_h3": "88a8a03989fffff",
+                    "bairro": "Guaratiba",
+                    "quantidade": 0.0
+                },
+                ...
+            ]
+        }
         ```
-
-        **Política de cache**: O resultado é armazenado em cache por um período de 5 minutos.
         """,
+        manual_parameters=[
+            openapi.Parameter(
+                "janela",
+                openapi.IN_QUERY,
+                description="Janela de tempo, em múltiplos de 15 minutos (ex.: 45min, 9h). Se omitido, 15min.",
+                type=openapi.TYPE_STRING,
+                required=False,
+            ),
+        ],
     ),
 )
-class Last3HRainView(LoggingMixin, ViewSet):
-    def list(self, request):
-        data_key = "data_last_3h_rain"
+class RainWindowView(AsyncViewSetMixin, LoggingMixin, ViewSet):
+    async def list(self, request):
         try:
-            redis_url = getenv("REDIS_URL")
-            assert redis_url is not None
-            redis = RedisPal.from_url(redis_url)
-            # Get data and set cache
-            data = redis.get(data_key)
-            assert data is not None
-            assert isinstance(data, list)
-            assert len(data) > 0
-            return Response(data)
-        except Exception:
-            return Response(
-                {"error": "Something went wrong. Try again later."},
-                status=500,
-            )
-
-
-@method_decorator(
-    name="list",
-    decorator=swagger_auto_schema(
-        operation_summary="Retorna o horário de atualização dos dados de chuva das últimas 3 horas",
-        operation_description="""
-        **Resultado**: Retorna um texto contendo o horário de atualização dos dados de chuva:
-
-        ```
-        ""
-        ```
-
-        **Política de cache**: O resultado é armazenado em cache por um período de 5 minutos.
-        """,
-    ),
-)
-class LastUpdate3HRainView(LoggingMixin, ViewSet):
-    def list(self, request):
-        last_update_key = "data_last_3h_rain_update"
+            slots = get_history_slots(request)
+        except ValueError as error:
+            return Response({"error": str(error)}, status=400)
         try:
-            redis_url = getenv("REDIS_URL")
-            assert redis_url is not None
-            redis = RedisPal.from_url(redis_url)
-            data = redis.get(last_update_key)
-            assert data is not None
-            assert isinstance(data, list)
-            assert len(data) > 0
-            result = data[0]
-            assert "last_update" in result
-            last_update = result["last_update"]
-            last_update_str = last_update.strftime("%d/%m/%Y %H:%M:%S")
-            return Response(last_update_str)
-        except Exception:
-            return Response(
-                {"error": "Something went wrong. Try again later."},
-                status=500,
+            snapshot = await refresh_history()
+            items, coverage = await run_in_thread(RAIN_HISTORY.get_window, slots)
+            last_slot = RAIN_HISTORY.last_slot
+            response = Response(
+                {
+                    "janela": request.query_params.get("janela", "15min"),
+                    "inicio": slot_time(last_slot - slots) if last_slot >= 0 else None,
+                    "fim": slot_time(last_slot) if last_slot >= 0 else None,
+                    "cobertura": round(coverage, 4),
+                    "dados": items,
+                }
             )
-
-
-# Views for last 6h
-@method_decorator(
-    name="list",
-    decorator=swagger_auto_schema(
-        operation_summary="Retorna a quantidade de chuva precipitada em cada hexágono (H3) nas últimas 6 horas",
-        operation_description="""
-        **Resultado**: Retorna uma lista contendo todos os hexágonos (H3) com a quantidade de chuva
-        precipitada para as últimas 6 horas, em milímetros (mm):
-
-        ```json
-        [
-            {
-                "id_h3": "88a8a03989fffff",
-                "bairro": "Guaratiba",
-                "quantidade": 0.0,
-                "estacoes": null,
-                "status": "sem chuva",
-                "color": "#ffffff"
-            },
-            ...
-        ]
-        ```
-
-        **Política de cache**: O resultado é armazenado em cache por um período de 5 minutos.
-        """,
-    ),
-)
-class Last6HRainView(LoggingMixin, ViewSet):
-    def list(self, request):
-        data_key = "data_last_6h_rain"
-        try:
-            redis_url = getenv("REDIS_URL")
-            assert redis_url is not None
-            redis = RedisPal.from_url(redis_url)
-            # Get data and set cache
-            data = redis.get(data_key)
-            assert data is not None
-            assert isinstance(data, list)
-            assert len(data) > 0
-            return Response(data)
+            return set_staleness(response, snapshot.staleness)
         except Exception:
             return Response(
                 {"error": "Something went wrong. Try again later."},
@@ -482,292 +198,71 @@ class Last6HRainView(LoggingMixin, ViewSet):
             )
 
 
+# Rainfall time series of a hexagon
 @method_decorator(
     name="list",
     decorator=swagger_auto_schema(
-        operation_summary="Retorna o horário de atualização dos dados de chuva das últimas 6 horas",
+        operation_summary="Retorna a série histórica de chuva precipitada em um hexágono (H3)",
         operation_description="""
-        **Resultado**: Retorna um texto contendo o horário de atualização dos dados de chuva:
-
-        ```
-        ""
-        ```
-
-        **Política de cache**: O resultado é armazenado em cache por um período de 5 minutos.
-        """,
-    ),
-)
-class LastUpdate6HRainView(LoggingMixin, ViewSet):
-    def list(self, request):
-        last_update_key = "data_last_6h_rain_update"
-        try:
-            redis_url = getenv("REDIS_URL")
-            assert redis_url is not None
-            redis = RedisPal.from_url(redis_url)
-            data = redis.get(last_update_key)
-            assert data is not None
-            assert isinstance(data, list)
-            assert len(data) > 0
-            result = data[0]
-            assert "last_update" in result
-            last_update = result["last_update"]
-            last_update_str = last_update.strftime("%d/%m/%Y %H:%M:%S")
-            return Response(last_update_str)
-        except Exception:
-            return Response(
-                {"error": "Something went wrong. Try again later."},
-                status=500,
-            )
-
-
-# Views for last 12h
-@method_decorator(
-    name="list",
-    decorator=swagger_auto_schema(
-        operation_summary="Retorna a quantidade de chuva precipitada em cada hexágono (H3) nas últimas 12 horas",
-        operation_description="""
-        **Resultado**: Retorna uma lista contendo todos os hexágonos (H3) com a quantidade de chuva
-        precipitada para as últimas 12 horas, em milímetros (mm):
+        **Resultado**: Retorna, para cada intervalo de 15 minutos acumulado pela API, a quantidade
+        de chuva precipitada no hexágono (H3) na janela de tempo solicitada terminando nesse
+        horário, em milímetros (mm):
 
         ```json
-        [
-            {
-                "id_h3": "88a8a03989fffff",
-                "bairro": "Guaratiba",
-                "quantidade": 0.0,
-                "estacoes": null,
-                "status": "sem chuva",
-                "color": "#ffffff"
-            },
-            ...
-        ]
+        {
+            "id_h3": "88a8a03989fffff",
+            "janela": "1h",
+            "dados": [
+                {
+                    "horario": "2022-10-18T12:00:00-03:00",
+                    "quantidade": 0.0
+                },
+                ...
+            ]
+        }
         ```
-
-        **Política de cache**: O resultado é armazenado em cache por um período de 5 minutos.
         """,
+        manual_parameters=[
+            openapi.Parameter(
+                "id_h3",
+                openapi.IN_QUERY,
+                description="Identificador do hexágono (H3).",
+                type=openapi.TYPE_STRING,
+                required=True,
+            ),
+            openapi.Parameter(
+                "janela",
+                openapi.IN_QUERY,
+                description="Janela de tempo de cada ponto da série, em múltiplos de 15 minutos (ex.: 45min, 9h). Se omitido, 15min.",
+                type=openapi.TYPE_STRING,
+                required=False,
+            ),
+        ],
     ),
 )
-class Last12HRainView(LoggingMixin, ViewSet):
-    def list(self, request):
-        data_key = "data_last_12h_rain"
+class RainHistoryView(AsyncViewSetMixin, LoggingMixin, ViewSet):
+    async def list(self, request):
+        id_h3 = request.query_params.get("id_h3", "").strip()
+        if not id_h3:
+            return Response({"error": 'Parameter "id_h3" is required.'}, status=400)
         try:
-            redis_url = getenv("REDIS_URL")
-            assert redis_url is not None
-            redis = RedisPal.from_url(redis_url)
-            # Get data and set cache
-            data = redis.get(data_key)
-            assert data is not None
-            assert isinstance(data, list)
-            assert len(data) > 0
-            return Response(data)
-        except Exception:
-            return Response(
-                {"error": "Something went wrong. Try again later."},
-                status=500,
-            )
-
-
-@method_decorator(
-    name="list",
-    decorator=swagger_auto_schema(
-        operation_summary="Retorna o horário de atualização dos dados de chuva das últimas 12 horas",
-        operation_description="""
-        **Resultado**: Retorna um texto contendo o horário de atualização dos dados de chuva:
-
-        ```
-        ""
-        ```
-
-        **Política de cache**: O resultado é armazenado em cache por um período de 5 minutos.
-        """,
-    ),
-)
-class LastUpdate12HRainView(LoggingMixin, ViewSet):
-    def list(self, request):
-        last_update_key = "data_last_12h_rain_update"
+            slots = get_history_slots(request)
+        except ValueError as error:
+            return Response({"error": str(error)}, status=400)
         try:
-            redis_url = getenv("REDIS_URL")
-            assert redis_url is not None
-            redis = RedisPal.from_url(redis_url)
-            data = redis.get(last_update_key)
-            assert data is not None
-            assert isinstance(data, list)
-            assert len(data) > 0
-            result = data[0]
-            assert "last_update" in result
-            last_update = result["last_update"]
-            last_update_str = last_update.strftime("%d/%m/%Y %H:%M:%S")
-            return Response(last_update_str)
-        except Exception:
-            return Response(
-                {"error": "Something went wrong. Try again later."},
-                status=500,
+            snapshot = await refresh_history()
+            try:
+                series = await run_in_thread(RAIN_HISTORY.get_series, id_h3, slots)
+            except KeyError:
+                return Response({"error": "Unknown hexagon."}, status=404)
+            response = Response(
+                {
+                    "id_h3": id_h3,
+                    "janela": request.query_params.get("janela", "15min"),
+                    "dados": series,
+                }
             )
-
-
-# Views for last 24h
-@method_decorator(
-    name="list",
-    decorator=swagger_auto_schema(
-        operation_summary="Retorna a quantidade de chuva precipitada em cada hexágono (H3) nas últimas 24 horas",
-        operation_description="""
-        **Resultado**: Retorna uma lista contendo todos os hexágonos (H3) com a quantidade de chuva
-        precipitada para as últimas 24 horas, em milímetros (mm):
-
-        ```json
-        [
-            {
-                "id_h3": "88a8a03989fffff",
-                "bairro": "Guaratiba",
-                "quantidade": 0.0,
-                "estacoes": null,
-                "status": "sem chuva",
-                "color": "#ffffff"
-            },
-            ...
-        ]
-        ```
-
-        **Política de cache**: O resultado é armazenado em cache por um período de 5 minutos.
-        """,
-    ),
-)
-class Last24HRainView(LoggingMixin, ViewSet):
-    def list(self, request):
-        data_key = "data_last_24h_rain"
-        try:
-            redis_url = getenv("REDIS_URL")
-            assert redis_url is not None
-            redis = RedisPal.from_url(redis_url)
-            # Get data and set cache
-            data = redis.get(data_key)
-            assert data is not None
-            assert isinstance(data, list)
-            assert len(data) > 0
-            return Response(data)
-        except Exception:
-            return Response(
-                {"error": "Something went wrong. Try again later."},
-                status=500,
-            )
-
-
-@method_decorator(
-    name="list",
-    decorator=swagger_auto_schema(
-        operation_summary="Retorna o horário de atualização dos dados de chuva das últimas 24 horas",
-        operation_description="""
-        **Resultado**: Retorna um texto contendo o horário de atualização dos dados de chuva:
-
-        ```
-        ""
-        ```
-
-        **Política de cache**: O resultado é armazenado em cache por um período de 5 minutos.
-        """,
-    ),
-)
-class LastUpdate24HRainView(LoggingMixin, ViewSet):
-    def list(self, request):
-        last_update_key = "data_last_24h_rain_update"
-        try:
-            redis_url = getenv("REDIS_URL")
-            assert redis_url is not None
-            redis = RedisPal.from_url(redis_url)
-            data = redis.get(last_update_key)
-            assert data is not None
-            assert isinstance(data, list)
-            assert len(data) > 0
-            result = data[0]
-            assert "last_update" in result
-            last_update = result["last_update"]
-            last_update_str = last_update.strftime("%d/%m/%Y %H:%M:%S")
-            return Response(last_update_str)
-        except Exception:
-            return Response(
-                {"error": "Something went wrong. Try again later."},
-                status=500,
-            )
-
-
-# Views for last 96h
-@method_decorator(
-    name="list",
-    decorator=swagger_auto_schema(
-        operation_summary="Retorna a quantidade de chuva precipitada em cada hexágono (H3) nas últimas 96 horas",
-        operation_description="""
-        **Resultado**: Retorna uma lista contendo todos os hexágonos (H3) com a quantidade de chuva
-        precipitada para as últimas 96 horas, em milímetros (mm):
-
-        ```json
-        [
-            {
-                "id_h3": "88a8a03989fffff",
-                "bairro": "Guaratiba",
-                "quantidade": 0.0,
-                "estacoes": null,
-                "status": "sem chuva",
-                "color": "#ffffff"
-            },
-            ...
-        ]
-        ```
-
-        **Política de cache**: O resultado é armazenado em cache por um período de 5 minutos.
-        """,
-    ),
-)
-class Last96HRainView(LoggingMixin, ViewSet):
-    def list(self, request):
-        data_key = "data_last_96h_rain"
-        try:
-            redis_url = getenv("REDIS_URL")
-            assert redis_url is not None
-            redis = RedisPal.from_url(redis_url)
-            # Get data and set cache
-            data = redis.get(data_key)
-            assert data is not None
-            assert isinstance(data, list)
-            assert len(data) > 0
-            return Response(data)
-        except Exception:
-            return Response(
-                {"error": "Something went wrong. Try again later."},
-                status=500,
-            )
-
-
-@method_decorator(
-    name="list",
-    decorator=swagger_auto_schema(
-        operation_summary="Retorna o horário de atualização dos dados de chuva das últimas 96 horas",
-        operation_description="""
-        **Resultado**: Retorna um texto contendo o horário de atualização dos dados de chuva:
-
-        ```
-        ""
-        ```
-
-        **Política de cache**: O resultado é armazenado em cache por um período de 5 minutos.
-        """,
-    ),
-)
-class LastUpdate96HRainView(LoggingMixin, ViewSet):
-    def list(self, request):
-        last_update_key = "data_last_96h_rain_update"
-        try:
-            redis_url = getenv("REDIS_URL")
-            assert redis_url is not None
-            redis = RedisPal.from_url(redis_url)
-            data = redis.get(last_update_key)
-            assert data is not None
-            assert isinstance(data, list)
-            assert len(data) > 0
-            result = data[0]
-            assert "last_update" in result
-            last_update = result["last_update"]
-            last_update_str = last_update.strftime("%d/%m/%Y %H:%M:%S")
-            return Response(last_update_str)
+            return set_staleness(response, snapshot.staleness)
         except Exception:
             return Response(
                 {"error": "Something went wrong. Try again later."},
@@ -0,0 +1,226 @@
+# -*- coding: utf-8 -*-
+# flake8: noqa: E501
+"""
+Registry of every dataset served by the v2 API. Adding a new time window or dataset is a matter
+of declaring it here.
+"""
+from django.conf import settings
+
+from api_dados_rio.custom.datasets import Dataset, DatasetRegistry
+from api_dados_rio.custom.history import RainHistory
+from api_dados_rio.custom.redis_pool import REDIS_TARGET_SKUPPER
+
+LAST_UPDATE_DESCRIPTION = """
+        **Resultado**: Retorna um texto contendo o horário de atualização dos dados de {dados}:
+
+        ```
+        ""
+        ```
+
+        **Política de cache**: O resultado é armazenado em cache por um período de 5 minutos.
+        """
+
+RAIN_DESCRIPTION = """
+        **Resultado**: Retorna uma lista contendo todos os hexágonos (H3) com a quantidade de chuva
+        precipitada {origem}para {periodo}, em milímetros (mm):
+
+        ```json
+        [
+            {{
+                "id_h3": "88a8a03989fffff",
+                "bairro": "Guaratiba",
+                "{campo}": 0.0,
+                "estacoes": null,
+                "status": "sem chuva",
+                "color": "#ffffff"
+            }},
+            ...
+        ]
+        ```
+
+        **Política de cache**: O resultado é armazenado em cache por um período de 5 minutos.
+        """
+
+FLOOD_DESCRIPTION = """
+        **Resultado**: Retorna uma lista contendo todos os hexágonos (H3) e sua respectiva
+         quantidade de alagamento para {periodo}:
+
+        ```json
+        [
+            {{
+                "id_h3": "88a8a03989fffff",
+                "bairro": "Guaratiba",
+                "qnt_alagamentos": 0.0,
+                "estacoes": null,
+                "status": "sem alagamento",
+                "color": "#ffffff"
+            }},
+            ...
+        ]
+        ```
+
+        **Política de cache**: O resultado é armazenado em cache por um período de 5 minutos.
+        """
+
+AI_FLOODING_DETECTION_DESCRIPTION = """
+        **Resultado**: Retorna uma lista contendo todas as informações detectados por IA pelas
+        câmeras da cidade no seguinte formato:
+
+        ```json
+        [
+            {
+                "datetime": "",
+                "id_camera": "",
+                "url_camera": "",
+                "latitude": 0.0,
+                "longitude": 0.0,
+                "image_base64": "",
+                "ai_classification": [
+                    {
+                        "object": "alagamento",
+                        "label": false,
+                        "confidence": "",
+                        "prompt": "",
+                        "max_output_token": 0,
+                        "temperature": 0.0,
+                        "top_k": 0,
+                        "top_p": 0,
+                    },
+                    ...
+                ],
+            },
+            ...
+        ]
+        ```
+        """
+
+AI_FLOODING_DETECTION_LAST_UPDATE_DESCRIPTION = """
+        **Resultado**: Retorna um texto contendo o horário de atualização dos pontos detectados por IA.
+        """
+
+
+def rain_dataset(
+    janela: str, periodo: str, campo: str = "quantidade", history: RainHistory = None
+) -> Dataset:
+    """
+    Rain gauge dataset for a time window. `periodo` is written as in "os últimos 15 minutos"
+    or "as últimas 3 horas".
+    """
+    data_key = f"data_last_{janela}_rain"
+    return Dataset(
+        "clima_pluviometro",
+        f"precipitacao_{janela}",
+        data_key,
+        f"{data_key}_update",
+        summary=f"Retorna a quantidade de chuva precipitada em cada hexágono (H3) n{periodo}",
+        description=RAIN_DESCRIPTION.format(origem="", periodo=periodo, campo=campo),
+        update_summary=f"Retorna o horário de atualização dos dados de chuva d{periodo}",
+        update_description=LAST_UPDATE_DESCRIPTION.format(dados="chuva"),
+        h3=True,
+        history=history,
+    )
+
+
+def radar_dataset(janela: str, periodo: str, data_key: str, update_key: str) -> Dataset:
+    """INEA's radar rain estimates for a time window"""
+    return Dataset(
+        "clima_radar",
+        f"precipitacao_{janela}",
+        data_key,
+        update_key,
+        summary=f"Retorna a quantidade em mm de chuva precipitada em cada hexágono (H3) n{periodo}",
+        description=RAIN_DESCRIPTION.format(
+            origem="estimada do radar do INEA ", periodo=periodo, campo="chuva_15min"
+        ),
+        update_summary=f"Retorna o horário de atualização dos dados de chuva do radar do INEA d{periodo}",
+        update_description=LAST_UPDATE_DESCRIPTION.format(
+            dados="chuva do radar do INEA"
+        ),
+        h3=True,
+    )
+
+
+def flood_dataset(janela: str, periodo: str, data_key: str, update_key: str) -> Dataset:
+    """Flooding reports for a time window"""
+    return Dataset(
+        "clima_alagamento",
+        f"alagamento_{janela}",
+        data_key,
+        update_key,
+        summary=f"Retorna a quantidade de alagamento em cada hexágono (H3) n{periodo}",
+        description=FLOOD_DESCRIPTION.format(periodo=periodo),
+        update_summary=f"Retorna o horário de atualização dos dados de alagamento d{periodo}",
+        update_description=LAST_UPDATE_DESCRIPTION.format(
+            dados=f"alagamento d{periodo}"
+        ),
+        h3=True,
+    )
+
+
+def ai_flooding_detection_dataset(group: str, name: str) -> Dataset:
+    """Flooding detected by AI on the city's cameras"""
+    return Dataset(
+        group,
+        name,
+        "flooding_detection_data",
+        "flooding_detection_last_update",
+        summary="Retorna as informações identificadas nas câmeras por IA.",
+        description=AI_FLOODING_DETECTION_DESCRIPTION,
+        update_summary="Retorna o horário de atualização dos pontos detectados por IA.",
+        update_description=AI_FLOODING_DETECTION_LAST_UPDATE_DESCRIPTION,
+        target=REDIS_TARGET_SKUPPER,
+        allow_empty=True,
+        raw_last_update=True,
+    )
+
+
+# Every 15-minute rain gauge snapshot, for rainfall over arbitrary windows
+RAIN_HISTORY = RainHistory(
+    "chuva_15min", settings.RAIN_HISTORY_SIZE, settings.RAIN_HISTORY_DIR
+)
+
+DATASETS = DatasetRegistry(
+    [
+        # Rain gauges
+        rain_dataset(
+            "15min", "os últimos 15 minutos", campo="chuva_15min", history=RAIN_HISTORY
+        ),
+        rain_dataset("30min", "os últimos 30 minutos"),
+        rain_dataset("60min", "os últimos 60 minutos"),
+        rain_dataset("120min", "os últimos 120 minutos"),
+        rain_dataset("3h", "as últimas 3 horas"),
+        rain_dataset("6h", "as últimas 6 horas"),
+        rain_dataset("12h", "as últimas 12 horas"),
+        rain_dataset("24h", "as últimas 24 horas"),
+        rain_dataset("96h", "as últimas 96 horas"),
+        # INEA's radar
+        radar_dataset(
+            "15min",
+            "os últimos 5 minutos",
+            "data_chuva_recente_radar_inea",
+            "data_update_chuva_recente_radar_inea",
+        ),
+        radar_dataset(
+            "120min",
+            "os últimos 120 minutos",
+            "data_chuva_passado_radar_inea",
+            "data_update_chuva_passado_radar_inea",
+        ),
+        # Flooding
+        flood_dataset(
+            "15min",
+            "os últimos 15 minutos",
+            "data_alagamento_recente_comando",
+            "data_update_alagamento_recente_comando",
+        ),
+        flood_dataset(
+            "120min",
+            "os últimos 120 minutos",
+            "data_alagamento_passado_comando",
+            "data_update_alagamento_passado_comando",
+        ),
+        ai_flooding_detection_dataset("clima_alagamento", "alagamento_detectado_ia"),
+        # Vision AI
+        ai_flooding_detection_dataset("vision_ai", "cameras"),
+    ]
+)
@@ -0,0 +1,6 @@
+# -*- coding: utf-8 -*-
+"""Server-Sent Events stream of updates to the datasets of the v2 API, served at /v2/stream/"""
+from api_dados_rio.custom.streams import StreamApplication
+from api_dados_rio.v2.datasets import DATASETS
+
+application = StreamApplication(DATASETS)
@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+# flake8: noqa: E501
+"""Vector tiles of the H3 datasets of the v2 API, served at /v2/tiles/<dataset>/<z>/<x>/<y>.mvt"""
+from django.urls import re_path
+from django.utils.decorators import method_decorator
+from drf_yasg.utils import swagger_auto_schema
+
+from api_dados_rio.custom.tiles import TileViewSet
+from api_dados_rio.v2.datasets import DATASETS
+
+TilesView = method_decorator(
+    name="retrieve",
+    decorator=swagger_auto_schema(
+        operation_summary="Retorna um vector tile (MVT) com os hexágonos (H3) de um conjunto de dados",
+        operation_description="""
+        **Resultado**: Retorna um Mapbox Vector Tile com os hexágonos (H3) do conjunto de dados
+        (por exemplo `precipitacao_15min` ou `clima_radar/precipitacao_15min`) que intersectam
+        o tile `z/x/y`, em uma camada com o nome do conjunto de dados. Os campos de cada
+        hexágono são as propriedades das feições.
+
+        **Política de cache**: Cada tile é gerado uma única vez por versão dos dados e acompanha
+        os cabeçalhos `ETag` e `Last-Modified` da versão.
+        """,
+    ),
+)(type("TilesView", (TileViewSet,), {"registry": DATASETS}))
+
+urlpatterns = [
+    re_path(
+        r"^tiles/(?P<dataset>[\w/]+)/(?P<z>\d+)/(?P<x>\d+)/(?P<y>\d+)\.mvt$",
+        TilesView.as_view({"get": "retrieve"}),
+        name="tiles",
+    ),
+]
@@ -4,9 +4,11 @@ from .adm_cor_comando.urls import router as adm_cor_comando_router
 from .clima_alagamento.urls import router as clima_alagamento_router
 from .clima_pluviometro.urls import router as clima_pluviometro_router
 from .clima_radar.urls import router as clima_radar_router
+from .tiles import urlpatterns as tiles_urlpatterns
 from .vision_ai.urls import router as vision_ai_router
 
 router = IndexRouter(
+    urlpatterns=tiles_urlpatterns,
     routers={
         "adm_cor_comando": adm_cor_comando_router,
         "clima_alagamento": clima_alagamento_router,
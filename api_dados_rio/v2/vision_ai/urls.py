@@ -1,16 +1,7 @@
 # -*- coding: utf-8 -*-
 from rest_framework import routers
 
-from api_dados_rio.v2.clima_alagamento import views
+from api_dados_rio.v2.datasets import DATASETS
 
 router = routers.DefaultRouter()
-router.register(
-    r"cameras",
-    views.AIFloodingDetectionView,
-    basename="cameras",
-)
-router.register(
-    r"ultima_atualizacao_cameras",
-    views.LastUpdateAIFloodingDetectionView,
-    basename="ultima_atualizacao_cameras",
-)
+DATASETS.register_routes(router, "vision_ai")
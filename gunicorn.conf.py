@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+"""
+Gunicorn configuration. Command line flags in `start-server.sh` take precedence over the
+settings in here.
+"""
+from os import getenv
+
+
+def post_worker_init(worker):
+    """Load dataset snapshots into the worker's cache before it starts serving requests"""
+    from api_dados_rio.v2.datasets import DATASETS
+
+    try:
+        DATASETS.prewarm()
+    except Exception:
+        worker.log.exception("Failed to prewarm dataset snapshots")
+
+
+def child_exit(server, worker):
+    """Drop the metrics of a worker that's gone, in Prometheus' multiprocess mode"""
+    if getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(worker.pid)
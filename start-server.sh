@@ -5,5 +5,13 @@ if [ -n "$DJANGO_SUPERUSER_USERNAME" ] && [ -n "$DJANGO_SUPERUSER_PASSWORD" ] ;
   (cd /app; python manage.py createsuperuser --no-input)
 fi
 (cd /app; python manage.py makemigrations && python manage.py migrate)
-(cd /app; gunicorn api_dados_rio.wsgi --user www-data --bind 0.0.0.0:8000 --workers 3 --log-level debug) &
+# Metrics of every gunicorn worker are aggregated from here, starting from scratch
+export PROMETHEUS_MULTIPROC_DIR="${PROMETHEUS_MULTIPROC_DIR:-/tmp/prometheus}"
+rm -rf "$PROMETHEUS_MULTIPROC_DIR" && mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+chown www-data "$PROMETHEUS_MULTIPROC_DIR"
+# The rain history is recorded by a single writer and read back by every worker
+export RAIN_HISTORY_DIR="${RAIN_HISTORY_DIR:-/tmp/rain_history}"
+mkdir -p "$RAIN_HISTORY_DIR" && chown www-data "$RAIN_HISTORY_DIR"
+(cd /app; su -s /bin/sh www-data -c "/env/bin/python manage.py record_rain_history") &
+(cd /app; gunicorn api_dados_rio.asgi:application --config gunicorn.conf.py --worker-class uvicorn.workers.UvicornWorker --user www-data --bind 0.0.0.0:8000 --workers 3 --log-level debug) &
 nginx -g "daemon off;"
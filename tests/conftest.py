@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+import os
+
+import django
+import pytest
+
+# Base settings use an in-memory cache, so tests don't need Redis
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "api_dados_rio.settings.base")
+django.setup()
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    from django.core.cache import cache
+
+    cache.clear()
+    yield
+    cache.clear()
@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from api_dados_rio.custom import breakers
+from api_dados_rio.custom.breakers import (
+    CLOSED,
+    HALF_OPEN,
+    OPEN,
+    CircuitBreaker,
+    CircuitOpen,
+)
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch) -> Clock:
+    clock = Clock()
+    monkeypatch.setattr(breakers, "monotonic", clock)
+    return clock
+
+
+@pytest.fixture
+def breaker(clock) -> CircuitBreaker:
+    return CircuitBreaker(
+        "test",
+        slow_call_duration=1,
+        window=4,
+        min_calls=4,
+        error_rate=0.5,
+        slow_call_rate=0.5,
+        open_duration=30,
+    )
+
+
+def call(breaker: CircuitBreaker, clock: Clock, fail: bool = False, duration=0.0):
+    with breaker.guard():
+        clock.now += duration
+        if fail:
+            raise ValueError("failed")
+
+
+def fail(breaker: CircuitBreaker, clock: Clock):
+    with pytest.raises(ValueError):
+        call(breaker, clock, fail=True)
+
+
+def test_opens_on_error_rate(breaker, clock):
+    call(breaker, clock)
+    call(breaker, clock)
+    fail(breaker, clock)
+    assert breaker.state == CLOSED
+
+    fail(breaker, clock)
+
+    assert breaker.state == OPEN
+    with pytest.raises(CircuitOpen):
+        call(breaker, clock)
+
+
+def test_opens_on_slow_call_rate(breaker, clock):
+    call(breaker, clock)
+    call(breaker, clock)
+    call(breaker, clock, duration=2)
+    call(breaker, clock, duration=2)
+
+    assert breaker.state == OPEN
+
+
+def test_waits_for_min_calls(breaker, clock):
+    for _ in range(3):
+        fail(breaker, clock)
+
+    assert breaker.state == CLOSED
+
+
+def test_half_opens_after_open_duration(breaker, clock):
+    for _ in range(4):
+        fail(breaker, clock)
+
+    clock.now += 29
+    assert breaker.state == OPEN
+    clock.now += 1
+    assert breaker.state == HALF_OPEN
+
+
+def test_closes_after_successful_trial(breaker, clock):
+    for _ in range(4):
+        fail(breaker, clock)
+    clock.now += 30
+
+    call(breaker, clock)
+
+    assert breaker.state == CLOSED
+    call(breaker, clock)
+
+
+def test_reopens_after_failed_or_slow_trial(breaker, clock):
+    for _ in range(4):
+        fail(breaker, clock)
+    clock.now += 30
+    fail(breaker, clock)
+    assert breaker.state == OPEN
+
+    clock.now += 30
+    call(breaker, clock, duration=2)
+    assert breaker.state == OPEN
+
+
+def test_lets_a_single_trial_through(breaker, clock):
+    for _ in range(4):
+        fail(breaker, clock)
+    clock.now += 30
+
+    with breaker.guard():
+        with pytest.raises(CircuitOpen):
+            call(breaker, clock)
+
+    assert breaker.state == CLOSED
@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+import base64
+import json
+from time import time
+
+import pytest
+import requests
+
+from api_dados_rio.custom import cor_comando
+from api_dados_rio.custom.breakers import CircuitOpen
+from api_dados_rio.custom.cor_comando import TokenManager, get_expiry, get_url, send
+
+
+def make_token(expires_in: float) -> str:
+    """Unsigned JWT expiring in some seconds"""
+
+    def encode(claims: dict) -> str:
+        return (
+            base64.urlsafe_b64encode(json.dumps(claims).encode()).decode().rstrip("=")
+        )
+
+    return f"{encode({'alg': 'none'})}.{encode({'exp': time() + expires_in})}.signature"
+
+
+class Login:
+    """Stand-in for `cor_comando.login`, handing out tokens or failing"""
+
+    def __init__(self, expires_in: float = 3600):
+        self.expires_in = expires_in
+        self.error = None
+        self.tokens = []
+        self.deadlines = []
+
+    def __call__(self, deadline=None) -> str:
+        self.deadlines.append(deadline)
+        if self.error is not None:
+            raise self.error
+        self.tokens.append(make_token(self.expires_in))
+        return self.tokens[-1]
+
+
+@pytest.fixture
+def login(monkeypatch) -> Login:
+    login = Login()
+    monkeypatch.setattr(cor_comando, "login", login)
+    return login
+
+
+def test_get_expiry_reads_jwt_exp():
+    token = make_token(100)
+
+    assert abs(get_expiry(token) - (time() + 100)) < 2
+
+
+def test_logs_in_once_for_every_worker(login):
+    first, second = TokenManager(), TokenManager()
+
+    token = first.get()
+
+    assert first.get() == token
+    # Other workers share the token through the cache
+    assert second.get() == token
+    assert login.tokens == [token]
+
+
+def test_refreshes_expiring_token(login):
+    manager = TokenManager()
+    login.expires_in = 30
+    expiring = manager.get()
+    login.expires_in = 3600
+
+    token = manager.get()
+
+    assert token != expiring
+    assert login.tokens == [expiring, token]
+
+
+def test_keeps_expiring_token_when_refresh_fails(login):
+    manager = TokenManager()
+    login.expires_in = 30
+    expiring = manager.get()
+    login.error = CircuitOpen("cor_comando.login")
+
+    assert manager.get() == expiring
+
+
+def test_raises_when_there_is_no_token(login):
+    login.error = CircuitOpen("cor_comando.login")
+
+    with pytest.raises(CircuitOpen):
+        TokenManager().get()
+
+
+def test_refreshes_rejected_token(login):
+    manager = TokenManager()
+    rejected = manager.get()
+
+    token = manager.refresh(rejected)
+
+    assert token != rejected
+    assert manager.get() == token
+    assert login.tokens == [rejected, token]
+
+
+def test_reuses_token_refreshed_by_another_worker(login):
+    first, second = TokenManager(), TokenManager()
+    rejected = first.get()
+    second.get()
+    token = first.refresh(rejected)
+
+    assert second.refresh(rejected) == token
+    assert login.tokens == [rejected, token]
+
+
+def test_send_gives_up_past_the_deadline(monkeypatch):
+    monkeypatch.setattr(cor_comando, "get_session", lambda: pytest.fail("requested"))
+
+    with pytest.raises(requests.Timeout):
+        send("GET", "https://comando/api", deadline=cor_comando.monotonic() - 1)
+
+
+def test_get_url_shares_one_deadline(login, monkeypatch):
+    monkeypatch.setattr(cor_comando, "token_manager", TokenManager())
+    requests_made = []
+
+    def request_api(url, parameters, token, deadline):
+        requests_made.append((token, deadline))
+        response = requests.Response()
+        # The first token is rejected
+        response.status_code = 401 if len(requests_made) == 1 else 200
+        response._content = b"{}"
+        return response
+
+    monkeypatch.setattr(cor_comando, "request_api", request_api)
+
+    assert get_url("https://comando/api") == {}
+
+    assert [token for token, _ in requests_made] == login.tokens
+    deadlines = login.deadlines + [deadline for _, deadline in requests_made]
+    assert len(deadlines) == 4
+    assert len(set(deadlines)) == 1
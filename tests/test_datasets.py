@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+import pickle
+from datetime import datetime
+
+import pytest
+from asgiref.sync import async_to_sync
+from rest_framework.test import APIRequestFactory
+
+from api_dados_rio.custom.datasets import Dataset, DatasetLastUpdateViewSet
+from api_dados_rio.custom.fallback import last_known_good
+from api_dados_rio.custom.snapshots import Snapshot, SnapshotVersion
+
+RAW_UPDATE = pickle.dumps([{"last_update": datetime(2023, 1, 1, 12)}])
+
+
+def make_dataset(version: SnapshotVersion, **kwargs) -> Dataset:
+    dataset = Dataset(
+        "clima",
+        "chuva",
+        "data_chuva",
+        "data_chuva_update",
+        summary="",
+        description="",
+        update_summary="",
+        update_description="",
+        **kwargs,
+    )
+
+    async def get_version():
+        return version
+
+    async def get_snapshot():
+        raise AssertionError("The payload shouldn't be loaded")
+
+    dataset.aget_version = get_version
+    dataset.aget_snapshot = get_snapshot
+    return dataset
+
+
+def get_last_update(dataset: Dataset):
+    view = type("View", (DatasetLastUpdateViewSet,), {"dataset": dataset}).as_view(
+        {"get": "list"}
+    )
+    response = async_to_sync(view)(
+        APIRequestFactory().get("/v2/clima/ultima_atualizacao_chuva/")
+    )
+    response.render()
+    return response
+
+
+@pytest.fixture(autouse=True)
+def no_logging(monkeypatch):
+    monkeypatch.setattr(DatasetLastUpdateViewSet, "should_log", lambda *args: False)
+    last_known_good.clear()
+    yield
+    last_known_good.clear()
+
+
+def test_serves_last_update_from_the_update_key():
+    version = SnapshotVersion.from_raw_update(RAW_UPDATE)
+
+    response = get_last_update(make_dataset(version))
+
+    assert response.status_code == 200
+    assert response.data == "01/01/2023 12:00:00"
+    assert "X-Defasagem" not in response
+
+
+def test_serves_raw_update_key():
+    version = SnapshotVersion.from_raw_update(RAW_UPDATE)
+
+    response = get_last_update(make_dataset(version, raw_last_update=True))
+
+    assert response.data == [{"last_update": datetime(2023, 1, 1, 12)}]
+
+
+def test_serves_last_update_of_the_fallback():
+    good = Snapshot("data_chuva", "v1", datetime(2023, 1, 1, 11), [{"a": 1}], 10)
+    last_known_good.remember(good)
+    empty = Snapshot("data_chuva", "v2", datetime(2023, 1, 1, 12), [], 10)
+
+    response = get_last_update(make_dataset(empty))
+
+    assert response.data == "01/01/2023 11:00:00"
+    assert response["X-Defasagem"] == "0"
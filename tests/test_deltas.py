@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+import json
+from datetime import datetime
+
+import pytest
+from asgiref.sync import async_to_sync
+from rest_framework.test import APIRequestFactory
+
+from api_dados_rio.custom import deltas
+from api_dados_rio.custom.datasets import Dataset, DatasetViewSet
+from api_dados_rio.custom.deltas import compute_delta
+from api_dados_rio.custom.snapshots import Snapshot
+from tests.test_snapshots import FakeRedis, make_cache
+
+CENTRO = {"id_h3": "88a8a06a0bfffff", "bairro": "Centro", "quantidade": 0.0}
+TIJUCA = {"id_h3": "88a8a06a1bfffff", "bairro": "Tijuca", "quantidade": 0.0}
+LAPA = {"id_h3": "88a8a06a3bfffff", "bairro": "Lapa", "quantidade": 0.0}
+
+
+def make_snapshot(version: str, data: list) -> Snapshot:
+    return Snapshot("data", version, datetime(2023, 1, 1), data, 100)
+
+
+def test_computes_added_removed_and_changed_hexagons():
+    previous = make_snapshot("v1", [CENTRO, TIJUCA])
+    snapshot = make_snapshot("v2", [{**CENTRO, "quantidade": 2.5}, LAPA])
+
+    assert compute_delta(previous, snapshot) == {
+        "versao": "v2",
+        "desde": "v1",
+        "completo": False,
+        "adicionados": [LAPA],
+        "removidos": [TIJUCA["id_h3"]],
+        "alterados": [{**CENTRO, "quantidade": 2.5}],
+    }
+
+
+@pytest.fixture
+def api(monkeypatch):
+    monkeypatch.setattr(DatasetViewSet, "should_log", lambda *args: False)
+    client = FakeRedis()
+    cache = make_cache()
+    monkeypatch.setattr(deltas, "snapshot_cache", cache)
+    dataset = Dataset(
+        "clima",
+        "chuva",
+        "data",
+        "data_update",
+        summary="",
+        description="",
+        update_summary="",
+        update_description="",
+        h3=True,
+    )
+
+    async def get_snapshot():
+        return cache.get(client, "data", "data_update")
+
+    dataset.aget_version = dataset.aget_snapshot = get_snapshot
+    view = type("View", (DatasetViewSet,), {"dataset": dataset}).as_view(
+        {"get": "list"}
+    )
+
+    class Api:
+        def publish(self, data: list, hour: int) -> str:
+            client.publish("data", data, datetime(2023, 1, 1, hour))
+            return self.get()["X-Versao"]
+
+        def get(self, parameters=None, **headers):
+            request = APIRequestFactory().get("/v2/clima/chuva/", parameters, **headers)
+            response = async_to_sync(view)(request)
+            if hasattr(response, "render"):
+                response.render()
+            return response
+
+    return Api()
+
+
+def test_serves_changes_since_a_recent_version(api):
+    v1 = api.publish([CENTRO, TIJUCA], 12)
+    v2 = api.publish([{**CENTRO, "quantidade": 2.5}, LAPA], 13)
+
+    response = api.get({"desde": v1})
+
+    assert response.status_code == 200
+    assert response["X-Versao"] == v2
+    assert json.loads(response.content) == {
+        "versao": v2,
+        "desde": v1,
+        "completo": False,
+        "adicionados": [LAPA],
+        "removidos": [TIJUCA["id_h3"]],
+        "alterados": [{**CENTRO, "quantidade": 2.5}],
+    }
+
+
+def test_serves_no_changes_since_the_current_version(api):
+    v1 = api.publish([CENTRO], 12)
+
+    delta = json.loads(api.get({"desde": v1}).content)
+
+    assert delta["completo"] is False
+    assert delta["adicionados"] == delta["removidos"] == delta["alterados"] == []
+
+
+def test_serves_everything_since_an_unknown_version(api):
+    v1 = api.publish([CENTRO, TIJUCA], 12)
+
+    delta = json.loads(api.get({"desde": "desconhecida"}).content)
+
+    assert delta == {"versao": v1, "completo": True, "dados": [CENTRO, TIJUCA]}
+
+
+def test_tags_deltas_apart_from_the_payload(api):
+    v1 = api.publish([CENTRO], 12)
+    api.publish([TIJUCA], 13)
+
+    payload = api.get()["ETag"]
+    delta = api.get({"desde": v1})["ETag"]
+
+    assert payload != delta
+    assert api.get({"desde": v1}, HTTP_IF_NONE_MATCH=delta).status_code == 304
+
+
+@pytest.mark.parametrize(
+    "parameters", [{"bairro": "Centro"}, {"formato": "colunar"}, {"format": "arrow"}]
+)
+def test_rejects_deltas_combined_with_other_parameters(api, parameters):
+    v1 = api.publish([CENTRO], 12)
+
+    response = api.get({"desde": v1, **parameters})
+
+    assert response.status_code == 400
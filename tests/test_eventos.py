@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+from datetime import datetime
+
+import pytest
+from django.core.cache import cache
+from rest_framework.test import APIRequestFactory
+
+from api_dados_rio.v2.adm_cor_comando import views
+from api_dados_rio.v2.adm_cor_comando.views import (
+    EventosView,
+    cache_eventos_by_date,
+    get_eventos_key,
+)
+
+
+def evento(id: int, inicio: str) -> dict:
+    return {"id": id, "inicio": f"{inicio} 10:00:00.0"}
+
+
+class Upstream:
+    """Stand-in for `get_url_once`, answering with eventos and recording its calls"""
+
+    def __init__(self, eventos):
+        self.eventos = eventos
+        self.calls = []
+
+    def __call__(self, key, url, parameters=None):
+        self.calls.append(parameters)
+        return {"eventos": self.eventos}
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    def install(eventos) -> Upstream:
+        upstream = Upstream(eventos)
+        monkeypatch.setattr(views, "get_url_once", upstream)
+        return upstream
+
+    monkeypatch.setattr(EventosView, "should_log", lambda *args: False)
+    return install
+
+
+def get_eventos(inicio: str, fim: str):
+    request = APIRequestFactory().get(
+        "/v2/adm_cor_comando/eventos/",
+        {"inicio": f"{inicio} 00:00:00.0", "fim": f"{fim} 00:00:00.0"},
+    )
+    return EventosView.as_view({"get": "list"})(request)
+
+
+def test_caches_fetched_eventos_by_day(upstream):
+    fetched = upstream([evento(1, "2022-06-01"), evento(2, "2022-06-03")])
+
+    response = get_eventos("2022-06-01", "2022-06-03")
+
+    assert response.status_code == 200
+    assert [e["id"] for e in response.data["eventos"]] == [1, 2]
+    assert fetched.calls == [
+        {"inicio": "2022-06-01 00:00:00.0", "fim": "2022-06-03 00:00:00.0"}
+    ]
+    assert cache.get(get_eventos_key(datetime(2022, 6, 1))) == {
+        "eventos": [evento(1, "2022-06-01")]
+    }
+    assert cache.get(get_eventos_key(datetime(2022, 6, 3))) == {
+        "eventos": [evento(2, "2022-06-03")]
+    }
+
+
+def test_fetches_only_days_missing_from_cache(upstream):
+    cache_eventos_by_date({datetime(2022, 6, 1): [evento(1, "2022-06-01")]})
+    # The upstream answers with eventos of a cached day too
+    fetched = upstream([evento(1, "2022-06-01"), evento(2, "2022-06-02")])
+
+    response = get_eventos("2022-06-01", "2022-06-02")
+
+    assert [e["id"] for e in response.data["eventos"]] == [1, 2]
+    # A single missing day is fetched as a range of one day
+    assert fetched.calls == [
+        {"inicio": "2022-06-02 00:00:00.0", "fim": "2022-06-03 00:00:00.0"}
+    ]
+
+
+def test_serves_cached_days_without_upstream(upstream):
+    cache_eventos_by_date(
+        {
+            datetime(2022, 6, 1): [evento(1, "2022-06-01")],
+            datetime(2022, 6, 2): [],
+        }
+    )
+    fetched = upstream([])
+
+    response = get_eventos("2022-06-01", "2022-06-02")
+
+    assert [e["id"] for e in response.data["eventos"]] == [1]
+    assert fetched.calls == []
@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+import os
+from datetime import datetime
+
+import pytest
+from asgiref.sync import async_to_sync
+from django.http import HttpResponse
+
+from api_dados_rio.custom import datasets
+from api_dados_rio.custom.datasets import Dataset
+from api_dados_rio.custom.fallback import LastKnownGood, set_staleness
+from api_dados_rio.custom.snapshots import Snapshot
+
+
+def make_snapshot(version: str = "v1", data=None) -> Snapshot:
+    return Snapshot(
+        "data_chuva",
+        version,
+        datetime(2023, 1, 1, 12),
+        [{"id_h3": "88a8a06a0bfffff", "quantidade": 1.5}] if data is None else data,
+        100,
+    )
+
+
+@pytest.fixture
+def last_known_good(tmp_path, monkeypatch):
+    last_known_good = LastKnownGood(str(tmp_path))
+    monkeypatch.setattr(datasets, "last_known_good", last_known_good)
+    return last_known_good
+
+
+@pytest.fixture
+def dataset(monkeypatch):
+    async def fail(*args, **kwargs):
+        raise ConnectionError("Redis is down")
+
+    monkeypatch.setattr(datasets.snapshot_cache, "aget_version", fail)
+    monkeypatch.setattr(datasets.snapshot_cache, "aget_many", fail)
+    monkeypatch.setattr(datasets, "get_async_redis_client", lambda target: None)
+    return Dataset(
+        "clima",
+        "chuva",
+        "data_chuva",
+        "data_chuva_update",
+        summary="",
+        description="",
+        update_summary="",
+        update_description="",
+    )
+
+
+def test_fresh_snapshots_are_not_stale():
+    response = set_staleness(HttpResponse(), make_snapshot().staleness)
+
+    assert "Warning" not in response
+    assert "X-Defasagem" not in response
+
+
+def test_fallback_carries_time_since_last_confirmed(last_known_good, monkeypatch):
+    monkeypatch.setattr("api_dados_rio.custom.fallback.time", lambda: 1000.0)
+    last_known_good.remember(make_snapshot())
+    monkeypatch.setattr("api_dados_rio.custom.snapshots.time", lambda: 1090.5)
+
+    snapshot = last_known_good.fall_back("data_chuva")
+    response = set_staleness(HttpResponse(), snapshot.staleness)
+
+    assert snapshot.version == "v1"
+    assert response["Warning"] == '110 - "Response is Stale"'
+    assert response["X-Defasagem"] == "90"
+
+
+def test_confirming_a_version_resets_its_staleness(last_known_good, monkeypatch):
+    monkeypatch.setattr("api_dados_rio.custom.fallback.time", lambda: 1000.0)
+    last_known_good.remember(make_snapshot())
+    monkeypatch.setattr("api_dados_rio.custom.fallback.time", lambda: 1060.0)
+    last_known_good.remember(make_snapshot())
+
+    assert last_known_good.fall_back("data_chuva").confirmed_at == 1060.0
+
+
+def test_another_worker_loads_the_snapshot_from_disk(last_known_good, tmp_path):
+    last_known_good.remember(make_snapshot())
+    last_known_good.flush()
+
+    snapshot = async_to_sync(LastKnownGood(str(tmp_path)).afall_back)("data_chuva")
+
+    assert snapshot.version == "v1"
+    assert snapshot.data == make_snapshot().data
+    assert snapshot.staleness is not None
+
+
+def test_skips_saving_a_version_already_on_disk(last_known_good, tmp_path):
+    last_known_good.remember(make_snapshot())
+    last_known_good.flush()
+    saved = os.stat(tmp_path / "data_chuva.pickle")
+
+    other = LastKnownGood(str(tmp_path))
+    other.remember(make_snapshot())
+    other.flush()
+    unchanged = os.stat(tmp_path / "data_chuva.pickle")
+    other.remember(make_snapshot("v2"))
+    other.flush()
+
+    assert unchanged.st_ino == saved.st_ino
+    assert os.stat(tmp_path / "data_chuva.pickle").st_ino != saved.st_ino
+    assert LastKnownGood(str(tmp_path)).fall_back("data_chuva").version == "v2"
+
+
+def test_falls_back_while_redis_is_down(last_known_good, dataset):
+    last_known_good.remember(make_snapshot())
+
+    snapshot = async_to_sync(dataset.aget_snapshot)()
+    version = async_to_sync(dataset.aget_version)()
+
+    assert snapshot.version == version.version == "v1"
+    assert snapshot.staleness is not None
+
+
+def test_falls_back_from_an_empty_payload(last_known_good, dataset):
+    last_known_good.remember(make_snapshot())
+
+    snapshot = async_to_sync(dataset.asettle)(make_snapshot("v2", data=[]))
+
+    assert snapshot.version == "v1"
+    assert snapshot.staleness is not None
+
+
+def test_raises_without_a_snapshot_to_fall_back_on(last_known_good, dataset):
+    with pytest.raises(ConnectionError):
+        async_to_sync(dataset.aget_snapshot)()
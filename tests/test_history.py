@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+from datetime import datetime
+
+from django.utils import timezone
+
+from api_dados_rio.custom.history import RainHistory
+from api_dados_rio.custom.snapshots import Snapshot
+
+
+def make_snapshot(version: str, hour: int, minute: int, chuva: float) -> Snapshot:
+    last_update = timezone.make_aware(datetime(2023, 1, 1, hour, minute))
+    data = [{"id_h3": "a", "bairro": "Centro", "chuva_15min": chuva}]
+    return Snapshot("data", version, last_update, data, 0)
+
+
+def test_records_each_version_once():
+    history = RainHistory("chuva_15min", 8)
+
+    assert history.observe(make_snapshot("v1", 12, 0, 1.0))
+    assert not history.observe(make_snapshot("v1", 12, 0, 1.0))
+    assert history.observe(make_snapshot("v2", 12, 15, 2.0))
+
+    items, coverage = history.get_window(2)
+    assert items == [{"id_h3": "a", "bairro": "Centro", "quantidade": 3.0}]
+    assert coverage == 1.0
+
+
+def test_readers_reload_what_the_writer_saved(tmp_path):
+    writer = RainHistory("chuva_15min", 8, str(tmp_path))
+    reader = RainHistory("chuva_15min", 8, str(tmp_path))
+    writer.observe(make_snapshot("v1", 12, 0, 1.0))
+    # Nothing is written until the writer saves
+    assert not list(tmp_path.iterdir())
+
+    writer.save()
+    reader.reload()
+    assert reader.get_window(1)[0][0]["quantidade"] == 1.0
+
+    writer.observe(make_snapshot("v2", 12, 15, 2.0))
+    writer.save()
+    reader.reload()
+    assert reader.last_slot == writer.last_slot
+    assert reader.get_window(2)[0][0]["quantidade"] == 3.0
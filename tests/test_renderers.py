@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+import pyarrow as pa
+import pytest
+from asgiref.sync import async_to_sync
+from rest_framework.response import Response
+from rest_framework.test import APIRequestFactory
+
+from api_dados_rio.custom.datasets import Dataset, DatasetViewSet
+from api_dados_rio.custom.renderers import ArrowRenderer
+
+
+@pytest.fixture
+def get_dataset(monkeypatch):
+    monkeypatch.setattr(DatasetViewSet, "should_log", lambda *args: False)
+    dataset = Dataset(
+        "clima",
+        "chuva",
+        "data_chuva",
+        "data_chuva_update",
+        summary="",
+        description="",
+        update_summary="",
+        update_description="",
+        h3=True,
+    )
+
+    async def fail():
+        raise ConnectionError("Redis is down")
+
+    dataset.aget_version = fail
+    view = type("View", (DatasetViewSet,), {"dataset": dataset}).as_view(
+        {"get": "list"}
+    )
+
+    def get_dataset(**parameters):
+        request = APIRequestFactory().get("/v2/clima/chuva/", parameters)
+        response = async_to_sync(view)(request)
+        response.render()
+        return response
+
+    return get_dataset
+
+
+@pytest.mark.parametrize("format", ["arrow", "parquet", "geojson"])
+def test_renders_client_errors_as_json(get_dataset, format):
+    response = get_dataset(format=format, formato="colunar")
+
+    assert response.status_code == 400
+    assert response["Content-Type"] == "application/json"
+    assert b'"error":' in response.content
+
+
+@pytest.mark.parametrize("format", ["arrow", "parquet"])
+def test_renders_server_errors_as_json(get_dataset, format):
+    response = get_dataset(format=format)
+
+    assert response.status_code == 500
+    assert response["Content-Type"] == "application/json"
+    assert response.content == b'{"error":"Something went wrong. Try again later."}'
+
+
+def test_renders_objects_as_a_single_row():
+    response = Response({"bairro": "Centro", "quantidade": 1.5})
+    content = ArrowRenderer().render(
+        response.data, renderer_context={"response": response}
+    )
+
+    table = pa.ipc.open_stream(content).read_all()
+    assert table.to_pylist() == [{"bairro": "Centro", "quantidade": 1.5}]
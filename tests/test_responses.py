@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+from datetime import datetime
+
+import pytest
+from asgiref.sync import async_to_sync
+from rest_framework.test import APIRequestFactory
+
+from api_dados_rio.custom.datasets import Dataset, DatasetViewSet
+from api_dados_rio.custom.snapshots import Snapshot
+
+
+def make_items(n: int):
+    return [
+        {"id_h3": f"88a8a0{i:04x}fffff", "bairro": "Centro", "quantidade": float(i)}
+        for i in range(n)
+    ]
+
+
+@pytest.fixture
+def api(monkeypatch):
+    monkeypatch.setattr(DatasetViewSet, "should_log", lambda *args: False)
+    dataset = Dataset(
+        "clima",
+        "chuva",
+        "data_chuva",
+        "data_chuva_update",
+        summary="",
+        description="",
+        update_summary="",
+        update_description="",
+        h3=True,
+    )
+
+    class Api:
+        snapshot = None
+        loads = 0
+
+        def publish(self, version: str, n: int):
+            self.snapshot = Snapshot(
+                "data_chuva", version, datetime(2023, 1, 1, 12), make_items(n), 100
+            )
+
+        def get(self, parameters=None, **headers):
+            request = APIRequestFactory().get("/v2/clima/chuva/", parameters, **headers)
+            response = async_to_sync(view)(request)
+            if hasattr(response, "render"):
+                response.render()
+            return response
+
+    api = Api()
+
+    async def get_version():
+        return api.snapshot
+
+    async def get_snapshot():
+        api.loads += 1
+        return api.snapshot
+
+    dataset.aget_version = get_version
+    dataset.aget_snapshot = get_snapshot
+    view = type("View", (DatasetViewSet,), {"dataset": dataset}).as_view(
+        {"get": "list"}
+    )
+    return api
+
+
+def test_small_bodies_are_served_and_tagged_uncompressed(api):
+    api.publish("v1", 1)
+
+    response = api.get(HTTP_ACCEPT_ENCODING="br, gzip")
+
+    assert response.status_code == 200
+    assert "Content-Encoding" not in response
+    assert response["ETag"] == '"v1"'
+
+
+@pytest.mark.parametrize("encoding", ["br", "gzip"])
+def test_compressed_bodies_are_tagged_with_their_encoding(api, encoding):
+    api.publish("v1", 100)
+
+    response = api.get(HTTP_ACCEPT_ENCODING=encoding)
+
+    assert response["Content-Encoding"] == encoding
+    assert response["ETag"] == f'"v1-{encoding}"'
+    assert "Accept-Encoding" in response["Vary"]
+
+
+@pytest.mark.parametrize("n", [1, 100])
+def test_answers_if_none_match_without_loading_the_payload(api, n):
+    api.publish("v1", n)
+    etag = api.get(HTTP_ACCEPT_ENCODING="br")["ETag"]
+    loads = api.loads
+
+    response = api.get(HTTP_ACCEPT_ENCODING="br", HTTP_IF_NONE_MATCH=etag)
+
+    assert response.status_code == 304
+    assert response["ETag"] == etag
+    assert response["X-Versao"] == "v1"
+    assert api.loads == loads
+
+
+def test_answers_if_modified_since(api):
+    api.publish("v1", 1)
+    last_modified = api.get()["Last-Modified"]
+
+    response = api.get(HTTP_IF_MODIFIED_SINCE=last_modified)
+
+    assert response.status_code == 304
+
+
+def test_serves_new_versions(api):
+    api.publish("v1", 1)
+    etag = api.get()["ETag"]
+    api.publish("v2", 1)
+
+    response = api.get(HTTP_IF_NONE_MATCH=etag)
+
+    assert response.status_code == 200
+    assert response["ETag"] == '"v2"'
+
+
+def test_tags_each_representation_apart(api):
+    api.publish("v1", 1)
+
+    etags = {
+        api.get()["ETag"],
+        api.get({"format": "msgpack"})["ETag"],
+        api.get({"bairro": "Centro"})["ETag"],
+        api.get({"formato": "colunar"})["ETag"],
+    }
+
+    assert len(etags) == 4
+    assert api.get({"format": "msgpack"}, HTTP_IF_NONE_MATCH='"v1"').status_code == 200
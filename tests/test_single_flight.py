@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+import threading
+import time
+
+import pytest
+from django.core.cache import cache
+from django.test import override_settings
+
+from api_dados_rio.custom.single_flight import single_flight
+
+
+class Fetch:
+    """Fetch counting its calls, which can be held until released"""
+
+    def __init__(self, result="result"):
+        self.result = result
+        self.calls = 0
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.release.set()
+
+    def __call__(self):
+        self.calls += 1
+        self.started.set()
+        self.release.wait(5)
+        return self.result
+
+
+def test_leader_fetches_and_shares_result():
+    fetch = Fetch()
+
+    assert single_flight("key", fetch) == "result"
+    # Callers that just missed the flight get its result
+    assert single_flight("key", fetch) == "result"
+    assert fetch.calls == 1
+    assert cache.get("single_flight_key_lock") is None
+
+
+def test_waiters_get_the_leader_result():
+    fetch = Fetch()
+    fetch.release.clear()
+    results = []
+    leader = threading.Thread(
+        target=lambda: results.append(single_flight("key", fetch))
+    )
+    leader.start()
+    assert fetch.started.wait(5)
+    waiters = [
+        threading.Thread(target=lambda: results.append(single_flight("key", fetch)))
+        for _ in range(3)
+    ]
+    for waiter in waiters:
+        waiter.start()
+    # Let the waiters find the lock taken
+    time.sleep(0.1)
+
+    fetch.release.set()
+    for thread in [leader] + waiters:
+        thread.join(5)
+
+    assert results == ["result"] * 4
+    assert fetch.calls == 1
+
+
+@override_settings(SINGLE_FLIGHT_TIMEOUT=0.2)
+def test_waiters_time_out():
+    fetch = Fetch()
+    # Another worker took the lock and never shares a result
+    cache.add("single_flight_key_lock", True, timeout=60)
+
+    assert single_flight("key", fetch) is None
+    assert fetch.calls == 0
+
+
+def test_leader_releases_lock_when_fetch_fails():
+    def fail():
+        raise ValueError("failed")
+
+    with pytest.raises(ValueError):
+        single_flight("key", fail)
+
+    assert cache.get("single_flight_key_lock") is None
+    assert single_flight("key", Fetch()) == "result"
+
+
+def test_leader_keeps_lock_taken_by_another_caller():
+    def fetch():
+        # The lock expired during the fetch, and another caller took it
+        cache.set("single_flight_key_lock", 1, timeout=60)
+        return "result"
+
+    assert single_flight("key", fetch) == "result"
+    assert cache.get("single_flight_key_lock") == 1
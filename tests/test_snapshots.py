@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+import threading
+import time
+from datetime import datetime
+
+from redis import Redis
+from redis_pal import RedisPal
+
+from api_dados_rio.custom.snapshots import Snapshot, SnapshotCache
+
+
+class FakeRedis(Redis):
+    """Redis client answering GET and MGET from a dict, recording the keys of each command"""
+
+    def __init__(self):
+        self.values = {}
+        self.commands = []
+        # Called with the keys of each MGET, before they're read
+        self.on_mget = None
+
+    def publish(self, key: str, data, last_update: datetime):
+        self.values[key] = RedisPal._serialize(data)
+        self.values[f"{key}_update"] = RedisPal._serialize(
+            [{"last_update": last_update}]
+        )
+
+    def execute_command(self, command, *keys, **options):
+        self.commands.append((command, keys))
+        if command == "MGET" and self.on_mget is not None:
+            self.on_mget(keys)
+        if command == "GET":
+            return self.values.get(keys[0])
+        return [self.values.get(key) for key in keys]
+
+
+def make_cache(**kwargs) -> SnapshotCache:
+    options = dict(max_entries=8, max_bytes=10**6, check_interval=0, history_size=2)
+    options.update(kwargs)
+    return SnapshotCache(**options)
+
+
+def test_loads_payload_once_per_version():
+    client = FakeRedis()
+    client.publish("data", [1], datetime(2023, 1, 1))
+    cache = make_cache()
+
+    first = cache.get(client, "data", "data_update")
+    second = cache.get(client, "data", "data_update")
+
+    assert first is second
+    assert first.data == [1]
+    assert first.last_update == datetime(2023, 1, 1)
+    # The cold read gets both keys at once, the next one only the update key
+    assert client.commands == [
+        ("MGET", ("data_update", "data")),
+        ("MGET", ("data_update",)),
+    ]
+
+
+def test_reloads_when_update_key_changes():
+    client = FakeRedis()
+    client.publish("data", [1], datetime(2023, 1, 1))
+    cache = make_cache()
+    first = cache.get(client, "data", "data_update")
+
+    client.publish("data", [2], datetime(2023, 1, 2))
+    second = cache.get(client, "data", "data_update")
+
+    assert second.data == [2]
+    assert second.version != first.version
+    assert cache.get_previous("data", first.version) is not None
+
+
+def test_skips_update_key_within_check_interval():
+    client = FakeRedis()
+    client.publish("data", [1], datetime(2023, 1, 1))
+    cache = make_cache(check_interval=60)
+    cache.get(client, "data", "data_update")
+    client.commands.clear()
+
+    client.publish("data", [2], datetime(2023, 1, 2))
+
+    assert cache.get(client, "data", "data_update").data == [1]
+    assert client.commands == []
+
+
+def test_pins_payload_to_the_version_read_with_it():
+    client = FakeRedis()
+    client.publish("data", [1], datetime(2023, 1, 1))
+    cache = make_cache()
+    cache.get(client, "data", "data_update")
+    client.publish("data", [2], datetime(2023, 1, 2))
+
+    def publish_again(keys):
+        # A new version lands between reading the update key and the payload
+        if keys == ("data_update",):
+            client.publish("data", [3], datetime(2023, 1, 3))
+
+    client.on_mget = publish_again
+    snapshot = cache.get(client, "data", "data_update")
+
+    assert snapshot.data == [3]
+    assert snapshot.last_update == datetime(2023, 1, 3)
+    assert client.commands[-1] == ("MGET", ("data_update", "data"))
+
+
+def test_evicts_least_recently_used_entries():
+    client = FakeRedis()
+    for key in ("a", "b", "c"):
+        client.publish(key, [key], datetime(2023, 1, 1))
+    cache = make_cache(max_entries=2)
+
+    a = cache.get(client, "a", "a_update")
+    cache.get(client, "b", "b_update")
+    cache.get(client, "a", "a_update")
+    cache.get(client, "c", "c_update")
+
+    assert list(cache._entries) == ["a", "c"]
+    assert cache.get_previous("a", a.version) is a
+
+
+def test_counts_derived_artifacts_against_max_bytes():
+    cache = make_cache(max_bytes=1000)
+    old = Snapshot("old", "v1", None, [1], 400)
+    cache._store(old)
+    current = Snapshot("current", "v1", None, [1], 400)
+    cache._store(current)
+
+    body = current.derive("body", lambda snapshot: b"x" * 300)
+
+    assert body == b"x" * 300
+    assert list(cache._entries) == ["current"]
+    for name in range(5):
+        current.derive(str(name), lambda snapshot: b"x" * 300)
+    assert current.size <= 1000
+
+
+def test_builds_each_artifact_once_for_concurrent_callers():
+    snapshot = Snapshot("data", "v1", None, [1], 10)
+    started, release = threading.Event(), threading.Event()
+    builds = []
+
+    def build(snapshot):
+        builds.append(threading.current_thread())
+        started.set()
+        release.wait(5)
+        return b"body"
+
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(snapshot.derive("body", build)))
+        for _ in range(4)
+    ]
+    threads[0].start()
+    assert started.wait(5)
+    for thread in threads[1:]:
+        thread.start()
+    # Let the other callers reach the artifact while it's being built
+    time.sleep(0.1)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert results == [b"body"] * 4
+    assert len(builds) == 1
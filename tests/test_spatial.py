@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+import json
+from datetime import datetime
+
+import h3
+import pytest
+from asgiref.sync import async_to_sync
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from api_dados_rio.custom.datasets import Dataset, DatasetViewSet
+from api_dados_rio.custom.geometry import get_centroid
+from api_dados_rio.custom.snapshots import Snapshot
+from api_dados_rio.custom.spatial import (
+    BBoxQuery,
+    RadiusQuery,
+    get_spatial_index,
+    get_spatial_queries,
+    haversine,
+)
+
+LAT, LON = -22.9, -43.2
+CELLS = sorted(h3.k_ring(h3.geo_to_h3(LAT, LON, 8), 6))
+
+
+def make_snapshot() -> Snapshot:
+    data = [{"id_h3": id_h3, "quantidade": 1.0} for id_h3 in CELLS]
+    # Items without a valid cell are left out of every spatial query
+    data += [{"id_h3": None}, {"id_h3": "invalida"}, {"bairro": "Centro"}]
+    return Snapshot("data", "v1", datetime(2023, 1, 1), data, 100)
+
+
+def get_queries(**parameters):
+    return get_spatial_queries(
+        Request(APIRequestFactory().get("/v2/clima/chuva/", parameters))
+    )
+
+
+def test_bbox_matches_centroids_inside_it():
+    snapshot = make_snapshot()
+    bbox = (LON - 0.02, LAT - 0.01, LON + 0.015, LAT + 0.02)
+
+    positions = BBoxQuery(*bbox).match(snapshot)
+
+    expected = set()
+    for position, id_h3 in enumerate(CELLS):
+        lat, lon = get_centroid(id_h3)
+        if bbox[0] <= lon <= bbox[2] and bbox[1] <= lat <= bbox[3]:
+            expected.add(position)
+    assert 0 < len(positions) < len(CELLS)
+    assert positions == expected
+
+
+@pytest.mark.parametrize("radius_m", [1, 800, 2500, 50000])
+def test_radius_matches_centroids_within_it(radius_m):
+    snapshot = make_snapshot()
+
+    positions = RadiusQuery(LAT, LON, radius_m).match(snapshot)
+
+    expected = {
+        position
+        for position, id_h3 in enumerate(CELLS)
+        if haversine(LAT, LON, *get_centroid(id_h3)) <= radius_m
+    }
+    assert positions == expected
+
+
+def test_queries_far_away_match_nothing():
+    snapshot = make_snapshot()
+
+    assert BBoxQuery(10, 10, 11, 11).match(snapshot) == set()
+    assert RadiusQuery(0, 0, 1000).match(snapshot) == set()
+
+
+def test_builds_the_index_once_per_snapshot():
+    snapshot = make_snapshot()
+
+    assert get_spatial_index(snapshot) is get_spatial_index(snapshot)
+
+
+def test_parses_spatial_parameters():
+    bbox, radius = get_queries(
+        bbox="-43.3,-23,-43.1,-22.8", lat="-22.9", lon="-43.2", raio_m="500"
+    )
+
+    assert bbox.bbox == (-43.3, -23.0, -43.1, -22.8)
+    assert (radius.lat, radius.lon, radius.radius_m) == (-22.9, -43.2, 500.0)
+    assert get_queries() == []
+
+
+@pytest.mark.parametrize(
+    "parameters",
+    [
+        {"bbox": "-43.3,-23,-43.1"},
+        {"bbox": "-43.1,-23,-43.3,-22.8"},
+        {"bbox": "a,b,c,d"},
+        {"bbox": "nan,-23,-43.1,-22.8"},
+        {"lat": "-22.9", "lon": "-43.2"},
+        {"lat": "-22.9", "lon": "-43.2", "raio_m": "0"},
+        {"lat": "-122.9", "lon": "-43.2", "raio_m": "500"},
+    ],
+)
+def test_rejects_malformed_parameters(parameters):
+    with pytest.raises(ValueError):
+        get_queries(**parameters)
+
+
+@pytest.fixture
+def get_dataset(monkeypatch):
+    monkeypatch.setattr(DatasetViewSet, "should_log", lambda *args: False)
+    dataset = Dataset(
+        "clima",
+        "chuva",
+        "data",
+        "data_update",
+        summary="",
+        description="",
+        update_summary="",
+        update_description="",
+        h3=True,
+    )
+    snapshot = make_snapshot()
+
+    async def get_snapshot():
+        return snapshot
+
+    dataset.aget_version = dataset.aget_snapshot = get_snapshot
+    view = type("View", (DatasetViewSet,), {"dataset": dataset}).as_view(
+        {"get": "list"}
+    )
+
+    def get_dataset(**parameters):
+        request = APIRequestFactory().get("/v2/clima/chuva/", parameters)
+        response = async_to_sync(view)(request)
+        if hasattr(response, "render"):
+            response.render()
+        return response
+
+    return get_dataset
+
+
+def test_serves_hexagons_within_a_radius(get_dataset):
+    response = get_dataset(lat=str(LAT), lon=str(LON), raio_m="1000")
+
+    assert response.status_code == 200
+    items = json.loads(response.content)
+    assert 0 < len(items) < len(CELLS)
+    assert all(
+        haversine(LAT, LON, *get_centroid(item["id_h3"])) <= 1000 for item in items
+    )
+
+
+def test_combines_spatial_queries(get_dataset):
+    bbox = f"{LON},{LAT - 1},{LON + 1},{LAT + 1}"
+
+    both = json.loads(
+        get_dataset(bbox=bbox, lat=str(LAT), lon=str(LON), raio_m="1000").content
+    )
+    radius = json.loads(get_dataset(lat=str(LAT), lon=str(LON), raio_m="1000").content)
+
+    assert 0 < len(both) < len(radius)
+    assert all(get_centroid(item["id_h3"])[1] >= LON for item in both)
+
+
+def test_reports_malformed_parameters(get_dataset):
+    response = get_dataset(bbox="-43.3,-23")
+
+    assert response.status_code == 400
+    assert json.loads(response.content) == {
+        "error": 'Parameter "bbox" must be formatted as minlon,minlat,maxlon,maxlat.'
+    }
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+import math
+from datetime import datetime
+
+import h3
+import mapbox_vector_tile
+import pytest
+from asgiref.sync import async_to_sync
+from rest_framework.test import APIRequestFactory
+
+from api_dados_rio.custom.datasets import Dataset, DatasetRegistry
+from api_dados_rio.custom.snapshots import Snapshot
+from api_dados_rio.custom.tiles import TileViewSet, tile_cache
+
+LAT, LON, ZOOM = -22.9, -43.2, 12
+ID_H3 = h3.geo_to_h3(LAT, LON, 8)
+
+
+def get_tile_coordinates(lat: float, lon: float, z: int):
+    n = 2**z
+    x = int((lon + 180) / 360 * n)
+    y = int((1 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2 * n)
+    return x, y
+
+
+def make_dataset(snapshot: Snapshot) -> Dataset:
+    dataset = Dataset(
+        "clima",
+        "chuva",
+        "data_chuva",
+        "data_chuva_update",
+        summary="",
+        description="",
+        update_summary="",
+        update_description="",
+        h3=True,
+    )
+
+    async def get_snapshot():
+        return snapshot
+
+    dataset.aget_version = dataset.aget_snapshot = get_snapshot
+    return dataset
+
+
+@pytest.fixture
+def get_tile(monkeypatch):
+    monkeypatch.setattr(TileViewSet, "should_log", lambda *args: False)
+    tile_cache.clear()
+    snapshot = Snapshot(
+        "data_chuva",
+        "v1",
+        datetime(2023, 1, 1, 12),
+        [{"id_h3": ID_H3, "bairro": "Centro", "quantidade": 1.5}],
+        100,
+    )
+    view = type(
+        "View", (TileViewSet,), {"registry": DatasetRegistry([make_dataset(snapshot)])}
+    ).as_view({"get": "retrieve"})
+
+    def get_tile(dataset="chuva", z=ZOOM, xy=None, **headers):
+        x, y = xy or get_tile_coordinates(LAT, LON, z)
+        request = APIRequestFactory().get(
+            f"/v2/tiles/{dataset}/{z}/{x}/{y}.mvt", **headers
+        )
+        response = async_to_sync(view)(
+            request, dataset=dataset, z=str(z), x=str(x), y=str(y)
+        )
+        if hasattr(response, "render"):
+            response.render()
+        return response
+
+    return get_tile
+
+
+def test_serves_hexagons_overlapping_the_tile(get_tile):
+    response = get_tile()
+
+    assert response.status_code == 200
+    assert response["Content-Type"] == "application/vnd.mapbox-vector-tile"
+    assert response["X-Versao"] == "v1"
+    layer = mapbox_vector_tile.decode(response.content)["chuva"]
+    assert [feature["properties"] for feature in layer["features"]] == [
+        {"id_h3": ID_H3, "bairro": "Centro", "quantidade": 1.5}
+    ]
+
+
+def test_leaves_out_hexagons_outside_the_tile(get_tile):
+    x, y = get_tile_coordinates(LAT, LON, ZOOM)
+
+    response = get_tile(xy=(x + 2, y))
+
+    assert response.status_code == 200
+    assert mapbox_vector_tile.decode(response.content)["chuva"]["features"] == []
+
+
+@pytest.mark.parametrize(
+    "accept,content_type",
+    [
+        ("application/vnd.mapbox-vector-tile", "application/vnd.mapbox-vector-tile"),
+        ("application/x-protobuf", "application/x-protobuf"),
+        # Browsers
+        ("text/html,*/*;q=0.8", "application/vnd.mapbox-vector-tile"),
+    ],
+)
+def test_negotiates_vector_tiles(get_tile, accept, content_type):
+    response = get_tile(HTTP_ACCEPT=accept)
+
+    assert response.status_code == 200
+    assert response["Content-Type"] == content_type
+
+
+def test_rejects_other_formats(get_tile):
+    response = get_tile(HTTP_ACCEPT="application/json")
+
+    assert response.status_code == 406
+    assert response["Content-Type"] == "application/json"
+
+
+def test_answers_conditional_requests(get_tile):
+    etag = get_tile()["ETag"]
+
+    response = get_tile(HTTP_IF_NONE_MATCH=etag)
+
+    assert response.status_code == 304
+
+
+def test_reports_errors_as_json(get_tile):
+    unknown = get_tile(dataset="desconhecido")
+    invalid = get_tile(z=1, xy=(5, 0))
+
+    assert unknown.status_code == 404
+    assert unknown["Content-Type"] == "application/json"
+    assert unknown.data == {"error": "Unknown dataset."}
+    assert invalid.status_code == 400
+    assert invalid.data == {"error": "Invalid tile coordinates."}